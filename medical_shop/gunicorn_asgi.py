@@ -0,0 +1,31 @@
+"""
+Gunicorn settings for serving the ASGI application with uvicorn workers:
+
+    gunicorn medical_shop.asgi:application -c medical_shop/gunicorn_asgi.py
+
+Each worker is one process running an event loop, so a handful of workers
+hold many slow connections (product pages waiting on the FDA API, clients
+on slow networks) where sync workers would need a thread apiece. Sync-only
+code (templates, transactions, raw SQL) still runs in a per-request
+thread. For development, ``uvicorn medical_shop.asgi:application --reload``.
+
+The WSGI profile stays available: ``gunicorn medical_shop.wsgi -k gthread
+--threads 8``. ``manage.py benchmark asgi`` compares the two.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+worker_class = 'uvicorn_worker.UvicornWorker'
+# CPU-bound work is what the event loop can't overlap
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+# Recycle workers now and then, staggered so they don't restart together
+max_requests = 10000
+max_requests_jitter = 1000
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+# Async requests run in short-lived threads, which can't reuse persistent
+# connections: open one per request (see CONN_MAX_AGE in settings.py)
+raw_env = ['CONN_MAX_AGE=0']
+accesslog = '-'
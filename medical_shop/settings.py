@@ -44,12 +44,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost, so its timings cover the rest of the stack (see store/instrumentation.py)
+    'store.middleware.PerformanceMiddleware',
+    # Read-your-writes for the replica router (see store/routers.py)
+    'store.middleware.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'store.middleware.SharedUserMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -61,7 +66,8 @@ from pathlib import Path
 # Update TEMPLATES configuration
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # The stock backend plus render timing for PerformanceMiddleware
+        'BACKEND': 'store.instrumentation.DjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],  # Add this line
         'APP_DIRS': True,
         'OPTIONS': {
@@ -70,6 +76,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'store.context_processors.cart_count',
             ],
         },
     },
@@ -84,10 +91,64 @@ WSGI_APPLICATION = 'medical_shop.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
     }
 }
 
+# Point the project at a (local) PostgreSQL server instead, e.g. for the
+# checkout load benchmark: POSTGRES_DB=shop python manage.py benchmark checkout
+if os.environ.get('POSTGRES_DB'):
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ['POSTGRES_DB'],
+        'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+        'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+    }
+
+# Read replicas for catalog and order-history reads (see store/routers.py):
+# SQLITE_REPLICAS=db-replica.sqlite3 (kept in sync with `manage.py
+# sync_replicas`) or POSTGRES_REPLICA_HOSTS=replica1,replica2 next to
+# POSTGRES_DB. Replicas are called replica1, replica2, ...
+if DATABASES['default']['ENGINE'].endswith('sqlite3'):
+    _replicas = [
+        {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / name, 'TEST': {'MIRROR': 'default'}}
+        for name in os.environ.get('SQLITE_REPLICAS', '').split(',') if name
+    ]
+else:
+    _replicas = [
+        {**DATABASES['default'], 'HOST': host, 'TEST': {'MIRROR': 'default'}}
+        for host in os.environ.get('POSTGRES_REPLICA_HOSTS', '').split(',') if host
+    ]
+for _number, _replica in enumerate(_replicas, 1):
+    DATABASES[f'replica{_number}'] = _replica
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['store.routers.PrimaryReplicaRouter']
+# How long a visitor keeps reading from the primary after their own write; replicas
+# must catch up faster than this (run `sync_replicas` at least as often for SQLite ones)
+DATABASE_REPLICA_PIN_SECONDS = int(os.environ.get('DATABASE_REPLICA_PIN_SECONDS', '10'))
+
+# Persistent connections, checked before reuse
+for _database in DATABASES.values():
+    _database['CONN_MAX_AGE'] = int(os.environ.get('CONN_MAX_AGE', '60'))
+    _database['CONN_HEALTH_CHECKS'] = True
+    if _database['ENGINE'].endswith('sqlite3'):
+        # Take the write lock when a transaction starts, so a writer waits
+        # for busy_timeout instead of failing to upgrade a read lock
+        _database.setdefault('OPTIONS', {})['transaction_mode'] = 'IMMEDIATE'
+
+# Run on every new SQLite connection (store.routers.apply_sqlite_pragmas)
+SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,
+    'mmap_size': 128 * 2 ** 20,
+}
+# WAL is stored in the database file and leaves -wal/-shm files beside it,
+# so switch it on per deployment: SQLITE_WAL=1
+SQLITE_WAL_PRAGMAS = {'journal_mode': 'WAL', 'synchronous': 'NORMAL'}
+if os.environ.get('SQLITE_WAL'):
+    SQLITE_PRAGMAS.update(SQLITE_WAL_PRAGMAS)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -144,6 +205,89 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 
 # Login redirect
+# Flash messages travel in a cookie; with a shared cache (below) sessions and
+# users are cached too, so a typical page view runs no session or auth queries
+SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+AUTHENTICATION_BACKENDS = ['django.contrib.auth.backends.ModelBackend']
+AUTH_USER_CACHE_TIMEOUT = 60 * 5
+
 LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'home'
-LOGIN_URL = 'login'
\ No newline at end of file
+LOGIN_URL = 'login'
+
+# openFDA drug label lookups (see store/fda.py)
+FDA_API_URL = os.environ.get('FDA_API_URL', 'https://api.fda.gov/drug/label.json')
+FDA_TIMEOUT = 10
+FDA_LABEL_TTL = 60 * 60 * 24 * 7      # labels that were found
+FDA_LABEL_NEGATIVE_TTL = 60 * 60 * 6  # no results or upstream errors
+FDA_LABEL_STALE_TTL = 60 * 60 * 24    # serve stale while refreshing in the background
+FDA_LABEL_BUDGET = 0.3                # seconds medicine_detail waits before rendering placeholders
+FDA_MAX_CONNECTIONS = 20
+
+# Caches: in-process by default; set REDIS_URL (needs the redis package) or CACHE_DIR to share between workers
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'medical-shop',
+    }
+}
+
+if os.environ.get('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+elif os.environ.get('CACHE_DIR'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ['CACHE_DIR'],
+    }
+
+# Sessions read from the cache and written through to the database, and users
+# cached by store.auth.CachedModelBackend, but only in a cache every worker
+# shares: per process, a logout, password change or is_staff change on one
+# worker wouldn't reach the others. ModelBackend stays listed so sessions
+# signed in through it keep working.
+if CACHES['default']['BACKEND'] != 'django.core.cache.backends.locmem.LocMemCache':
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+    AUTHENTICATION_BACKENDS = ['store.auth.CachedModelBackend', *AUTHENTICATION_BACKENDS]
+
+# Rendered product cards and home grid (see store/catalog_cache.py)
+CATALOG_CACHE_ENABLED = os.environ.get('CATALOG_CACHE_ENABLED', '1') != '0'
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+# Per-request timing: Server-Timing header, slow-request log and per-view histograms
+# (see store/instrumentation.py). Off by default; the middleware then drops out of the stack.
+PERF_INSTRUMENTATION = os.environ.get('PERF_INSTRUMENTATION', '0') == '1'
+PERF_SERVER_TIMING = os.environ.get('PERF_SERVER_TIMING', '1') == '1'
+PERF_SLOW_REQUEST_MS = int(os.environ.get('PERF_SLOW_REQUEST_MS', '500'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # One JSON object per slow request
+        'store.perf': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+        # Job failures and worker throughput (see store/jobs.py)
+        'store.jobs': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Background jobs (see store/jobs.py), run by `manage.py run_jobs`
+JOBS_WORKER_PROCESSES = int(os.environ.get('JOBS_WORKER_PROCESSES', '1'))
+JOBS_POLL_INTERVAL = float(os.environ.get('JOBS_POLL_INTERVAL', '1'))
+JOBS_MAX_ATTEMPTS = 5
+JOBS_RETRY_BACKOFF = 10               # seconds before the first retry, doubling after each failure
+JOBS_RETRY_BACKOFF_MAX = 60 * 60
+JOBS_LOCK_TIMEOUT = 60 * 10           # a job running longer is presumed lost with its worker
+JOBS_KEEP_DONE = 60 * 60 * 24         # finished jobs are kept this long for the throughput stats
+
+# Low-stock alerts after checkout go to these addresses (comma-separated)
+MANAGERS = [(email, email) for email in os.environ.get('MANAGERS', '').split(',') if email]
+
+# How long a shared cache (reverse proxy) may serve anonymous catalog responses; browsers always revalidate
+CATALOG_SHARED_MAX_AGE = int(os.environ.get('CATALOG_SHARED_MAX_AGE', '60'))
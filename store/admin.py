@@ -1,7 +1,10 @@
 from django.contrib import admin
-from .models import Medicine, Order, OrderItem
+from django.utils import timezone
 from django.utils.html import format_html
 
+from . import images, rollups
+from .models import Job, Medicine, Order, OrderItem
+
 class MedicineAdmin(admin.ModelAdmin):
     list_display = ['name', 'company_name', 'power', 'price', 'quantity', 'image_preview', 'created_at']
     list_filter = ['company_name', 'created_at']
@@ -10,10 +13,44 @@ class MedicineAdmin(admin.ModelAdmin):
     
     def image_preview(self, obj):
         if obj.image:
-            return format_html('<img src="{}" width="100" height="100" />', obj.image.url)
+            return format_html('<img src="{}" width="100" height="100" />', images.variant_url(obj, 'thumb'))
         return "No Image"
     image_preview.short_description = 'Image Preview'
 
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'order_date', 'final_amount', 'is_completed']
+    # __str__ shows the username
+    list_select_related = ['user']
+    date_hierarchy = 'order_date'
+
+class OrderItemAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'order', 'price']
+    # __str__ shows the medicine name, and the order column its user
+    list_select_related = ['medicine', 'order__user']
+    raw_id_fields = ['order', 'medicine']
+
+    # Lines have no delete signals (see rollups.py), so recompute their days here
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, OrderItem.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        rollups.deleting_lines(queryset)
+        super().delete_queryset(request, queryset)
+        rollups.rebuild_deleted()
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'attempts', 'max_attempts', 'run_at', 'finished_at']
+    list_filter = ['status', 'name']
+    readonly_fields = ['created_at', 'started_at', 'finished_at', 'locked_by', 'last_error']
+    actions = ['retry']
+
+    @admin.action(description='Run the selected jobs again')
+    def retry(self, request, queryset):
+        queryset.exclude(status=Job.RUNNING).update(
+            status=Job.QUEUED, attempts=0, run_at=timezone.now(), finished_at=None, locked_by='',
+        )
+
 admin.site.register(Medicine, MedicineAdmin)
-admin.site.register(Order)
-admin.site.register(OrderItem)
\ No newline at end of file
+admin.site.register(Order, OrderAdmin)
+admin.site.register(OrderItem, OrderItemAdmin)
+admin.site.register(Job, JobAdmin)
\ No newline at end of file
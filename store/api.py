@@ -0,0 +1,140 @@
+"""
+Read-only catalog API for the mobile app and partner integrations.
+
+``GET /api/v1/medicines/`` lists the catalog and
+``GET /api/v1/medicines/<id>/`` returns one medicine. Both take
+``?fields=id,name,price`` to return only some fields; the queryset is
+trimmed with ``only()`` to the columns those fields need.
+
+Lists are keyset-paginated like the staff listing: the ``next`` link
+carries the position of the last row, so every page costs the same.
+``?updated_since=<ISO 8601>`` returns the medicines changed at or after
+that time, oldest change first, for delta sync: a client stores the
+``updated_at`` of the last medicine it received and passes it next time
+(the boundary medicine comes back once more). Deleted medicines are not
+reported.
+
+Responses are gzipped when the client accepts it.
+"""
+import base64
+import json
+
+from django.core.exceptions import ValidationError as InvalidValue
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.decorators import method_decorator
+from django.views.decorators.gzip import gzip_page
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.permissions import AllowAny
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.views import APIView
+
+from .models import Medicine
+from .serializers import MedicineFeedSerializer, model_fields, parse_fields
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class KeysetPagination(BasePagination):
+    """Pages ordered by ``ordering`` (ending in ``id``) with an opaque position cursor."""
+    cursor_query_param = 'cursor'
+    limit_query_param = 'limit'
+
+    def __init__(self, ordering):
+        self.ordering = ordering
+
+    def _limit(self, request):
+        try:
+            return min(max(int(request.query_params.get(self.limit_query_param, PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        except ValueError:
+            raise ValidationError({self.limit_query_param: 'Must be an integer.'})
+
+    def _decode(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return [Medicine._meta.get_field(name).to_python(value) for name, value in zip(self.ordering, values)]
+        except (TypeError, ValueError, InvalidValue) as e:
+            raise ValidationError({self.cursor_query_param: 'Invalid cursor.'}) from e
+
+    def _encode(self, medicine):
+        values = [getattr(medicine, name) for name in self.ordering]
+        raw = json.dumps([value.isoformat() if hasattr(value, 'isoformat') else value for value in values])
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        limit = self._limit(request)
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            # (a, b, id) > (x, y, z), spelled out for every database
+            values = self._decode(cursor)
+            after = Q()
+            for i, name in enumerate(self.ordering):
+                after |= Q(**dict(zip(self.ordering[:i], values[:i])), **{f'{name}__gt': values[i]})
+            queryset = queryset.filter(after)
+        page = list(queryset[:limit + 1])
+        self.next_url = None
+        if len(page) > limit:
+            page = page[:limit]
+            self.next_url = replace_query_param(
+                request.build_absolute_uri(), self.cursor_query_param, self._encode(page[-1]),
+            )
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.next_url, 'results': data})
+
+
+class CatalogAPIView(APIView):
+    renderer_classes = [JSONRenderer]
+    permission_classes = [AllowAny]
+
+    def fields(self):
+        try:
+            return parse_fields(self.request.query_params.get('fields'))
+        except ValueError as e:
+            raise ValidationError({'fields': str(e)})
+
+
+@method_decorator(gzip_page, name='dispatch')
+class MedicineList(CatalogAPIView):
+    def get(self, request):
+        fields = self.fields()
+        medicines = Medicine.objects.all()
+        since = request.query_params.get('updated_since')
+        if since:
+            try:
+                # An unencoded "+01:00" offset arrives as " 01:00"
+                updated_since = parse_datetime(since.replace(' ', '+'))
+            except ValueError:
+                updated_since = None
+            if updated_since is None:
+                raise ValidationError({'updated_since': 'Expected an ISO 8601 date and time.'})
+            if timezone.is_naive(updated_since):
+                updated_since = timezone.make_aware(updated_since)
+            medicines = medicines.filter(updated_at__gte=updated_since)
+            ordering = ('updated_at', 'id')
+        else:
+            ordering = ('id',)
+
+        paginator = KeysetPagination(ordering)
+        # The cursor needs the ordering columns even if they weren't asked for
+        page = paginator.paginate_queryset(medicines.only(*model_fields(fields), *ordering), request, self)
+        return paginator.get_paginated_response(MedicineFeedSerializer(page, many=True, fields=fields).data)
+
+
+@method_decorator(gzip_page, name='dispatch')
+class MedicineDetail(CatalogAPIView):
+    def get(self, request, medicine_id):
+        fields = self.fields()
+        medicine = Medicine.objects.only(*model_fields(fields)).filter(pk=medicine_id).first()
+        if medicine is None:
+            raise NotFound('No such medicine.')
+        return Response(MedicineFeedSerializer(medicine, fields=fields).data)
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class StoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'store'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import routers, signals  # noqa: F401
+        connection_created.connect(routers.apply_sqlite_pragmas, dispatch_uid='store.sqlite_pragmas')
@@ -0,0 +1,50 @@
+"""
+Cached user loading for ``AuthenticationMiddleware``.
+
+``CachedModelBackend`` is Django's ``ModelBackend`` with ``get_user``
+(and ``aget_user``) served from the cache, so a signed-in request doesn't
+read its ``auth_user`` row every time. Together with the ``cached_db``
+session engine, a page view by a returning visitor runs no session or
+auth queries. Settings enable both only when the cache is shared between
+workers (REDIS_URL or CACHE_DIR), since ``forget`` only reaches the cache
+it runs against.
+
+The entry is dropped whenever the user is saved or deleted (see
+``signals.py``): an email change, ``last_login`` on sign-in, a new
+password. The session hash check in ``django.contrib.auth.get_user``
+therefore always compares against the current password. Code that
+changes users with ``QuerySet.update`` must call ``forget``.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+
+def cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def forget(user_id):
+    cache.delete(cache_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        key = cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            cache.set(key, user, settings.AUTH_USER_CACHE_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        key = cache_key(user_id)
+        user = await cache.aget(key)
+        if user is None:
+            user = await super().aget_user(user_id)
+            if user is None:
+                return None
+            await cache.aset(key, user, settings.AUTH_USER_CACHE_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
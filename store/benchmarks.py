@@ -0,0 +1,1081 @@
+"""
+Benchmark scenarios for ``manage.py benchmark``.
+
+Each scenario runs against a throwaway test database and returns a dict of
+results. Register new scenarios with the ``@scenario`` decorator.
+"""
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import httpx
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management import call_command
+from django.core.signals import request_finished, request_started
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.conf import settings
+from django.db import OperationalError, connection, connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from requests import RequestException, Session
+from rest_framework import serializers
+
+from . import (
+    catalog_cache, exports, forecasting, importer, instrumentation, jobs, listing, orders, rollups, routers, search,
+    search_index, seeding,
+)
+from .cart import CartLine
+from .models import CartItem, DailyMedicineSales, DrugLabelCache, Job, Medicine, Order, OrderItem
+from .seeding import synthetic_medicine
+from .serializers import DEFAULT_FIELDS, MedicineFeedSerializer, model_fields
+from .testing import StubFDAServer
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Latency summary in milliseconds for a list of durations in seconds."""
+    return {
+        'n': len(samples),
+        'mean_ms': round(sum(samples) / len(samples) * 1000, 3) if samples else 0.0,
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+    }
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def counted(func, *args, **kwargs):
+    """``(seconds, queries, result)`` of calling ``func`` on this thread's connection."""
+    queries = []
+    with connection.execute_wrapper(lambda execute, *args: queries.append(1) or execute(*args)):
+        elapsed, result = timed(func, *args, **kwargs)
+    return elapsed, len(queries), result
+
+
+def make_medicines(count, prefix='Bench'):
+    """Bulk insert ``count`` simple medicines and return them."""
+    Medicine.objects.bulk_create(
+        [
+            Medicine(
+                name=f'{prefix} Medicine {i}',
+                components=f'Component {i % 50}',
+                product_number=f'{prefix.upper()}-{i:07d}',
+                quantity=100,
+                company_name=f'Company {i % 20}',
+                power='500mg',
+                price=Decimal('10.00'),
+                image='medicines/dummpy.jpeg',
+            )
+            for i in range(count)
+        ],
+        batch_size=1000,
+    )
+    return list(Medicine.objects.filter(product_number__startswith=f'{prefix.upper()}-').order_by('id'))
+
+
+def make_synthetic_medicines(count, seed=0, batch_size=5000, offset=0):
+    """Bulk insert ``count`` synthetic medicines numbered from ``offset``."""
+    rng = random.Random(seed)
+    for start in range(offset, offset + count, batch_size):
+        Medicine.objects.bulk_create(
+            [synthetic_medicine(i, rng) for i in range(start, min(offset + count, start + batch_size))],
+            batch_size=batch_size,
+        )
+
+
+@scenario('label_cache')
+def label_cache(options):
+    """Detail page latency with a cold and a warm FDA label cache."""
+    medicines = make_medicines(options.get('count') or 50)
+    labels = {m.name: {'description': [f'About {m.name}'], 'indications_and_usage': ['Pain']} for m in medicines[::2]}
+    client = Client()
+
+    with StubFDAServer(labels, delay=options.get('upstream_delay', 0.05)) as stub:
+        with override_settings(FDA_API_URL=stub.url):
+            DrugLabelCache.objects.all().delete()
+            cold = [timed(client.get, f'/medicine/{m.id}/')[0] for m in medicines]
+            warm = [timed(client.get, f'/medicine/{m.id}/')[0] for m in medicines]
+
+    return {
+        'upstream_calls': stub.hits,
+        'cold': summarize(cold),
+        'warm': summarize(warm),
+    }
+
+
+@scenario('conditional_get')
+def conditional_get(options):
+    """Bytes and latency of revisiting catalog pages with and without ETag revalidation."""
+    medicines = make_medicines(options.get('count') or 200)
+    paths = ['/', '/?q=bench', '/api/search/suggest/?q=bench'] + [f'/medicine/{m.id}/' for m in medicines]
+    client = Client()
+
+    def visit(etags=None):
+        sizes, samples, not_modified = [], [], 0
+        for path in paths:
+            headers = {'HTTP_IF_NONE_MATCH': etags[path]} if etags and path in etags else {}
+            elapsed, response = timed(client.get, path, **headers)
+            samples.append(elapsed)
+            sizes.append(len(response.content))
+            not_modified += response.status_code == 304
+            if etags is not None and response.has_header('ETag'):
+                etags[path] = response['ETag']
+        return {
+            'kb': round(sum(sizes) / 1024, 1),
+            'not_modified': not_modified,
+            **summarize(samples),
+        }
+
+    results = {'pages': len(paths)}
+    with StubFDAServer({}) as stub:
+        with override_settings(FDA_API_URL=stub.url):
+            visit()  # fill the label and catalog caches
+            results['full'] = visit()
+            etags = {}
+            visit(etags)
+            results['revalidated'] = visit(etags)
+            # A tenth of the products change, e.g. stock sold
+            with transaction.atomic():
+                for m in medicines[::10]:
+                    m.quantity -= 1
+                    m.save(update_fields=['quantity'])
+            results['revalidated_after_changes'] = visit(etags)
+    results['bandwidth_saved_pct'] = round(100 * (1 - results['revalidated']['kb'] / results['full']['kb']), 1)
+    return results
+
+
+@scenario('search')
+def search_latency(options):
+    """Home page search: the old unbounded icontains scan vs. the indexed search."""
+    count = options.get('count') or 100000
+    make_synthetic_medicines(count)
+    index_seconds, _ = timed(search_index.rebuild)
+    queries = ['paracetamol', 'croc', 'sun pharma', 'vitamin d3', 'amoxicillin clavulanic', 'zin']
+    ingredient_queries = ['paracetamol 500', 'cetirizine 10mg', 'amoxicillin 1g']
+    typo_queries = ['paracetmol', 'amoxycillin 250mg', 'crocinn', 'atorvastatn']
+
+    like, fts, ingredient, fuzzy = [], [], [], []
+    for _ in range(5):
+        for query in queries:
+            like.append(timed(lambda: list(search.like_search(query)))[0])
+            fts.append(timed(lambda: list(search.search_medicines(query)[:24]))[0])
+        for query in ingredient_queries:
+            ingredient.append(timed(lambda: list(search.search_medicines(query)[:24]))[0])
+        for query in typo_queries:
+            fuzzy.append(timed(lambda: list(search.search_medicines(query)[:24]))[0])
+
+    return {
+        'medicines': count,
+        'ingredient_index_build_s': round(index_seconds, 2),
+        'like': summarize(like),
+        'fts': summarize(fts),
+        'ingredient': summarize(ingredient),
+        'fuzzy': summarize(fuzzy),
+    }
+
+
+def run_concurrently(workers, target):
+    """Run ``target(worker_index)`` in ``workers`` threads, each with its own DB connection."""
+    def run(i):
+        try:
+            target(i)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+@scenario('checkout')
+def checkout_concurrency(options):
+    """Concurrent checkouts competing for scarce stock: throughput and overselling."""
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=WAL')
+
+    workers, attempts = 8, options.get('count') or 200
+    stock = 50
+    medicines = make_medicines(10, prefix='Checkout')
+    Medicine.objects.update(quantity=stock)
+    users = [User.objects.create_user(f'checkout{i}') for i in range(workers)]
+    connection.close()
+
+    outcome = {'placed': 0, 'short': 0, 'errors': 0}
+    lock = threading.Lock()
+    latencies = []
+
+    def worker(i):
+        rng = random.Random(i)
+        for _ in range(attempts // workers):
+            lines = [
+                CartLine(medicine=m, quantity=rng.randint(1, 3), price=m.price)
+                for m in rng.sample(medicines, rng.randint(1, 4))
+            ]
+            try:
+                elapsed, result = timed(orders.place_order, users[i], lines)
+                key = 'placed' if result.ok else 'short'
+            except OperationalError:
+                elapsed, key = 0, 'errors'
+            with lock:
+                outcome[key] += 1
+                if elapsed:
+                    latencies.append(elapsed)
+
+    seconds = run_concurrently(workers, worker)
+
+    sold = OrderItem.objects.aggregate(units=Sum('quantity'))['units'] or 0
+    remaining = Medicine.objects.filter(pk__in=[m.pk for m in medicines]).aggregate(units=Sum('quantity'))['units']
+    return {
+        'database': connection.vendor,
+        'workers': workers,
+        **outcome,
+        'orders_per_second': round(outcome['placed'] / seconds, 1),
+        'latency': summarize(latencies),
+        'units_sold': sold,
+        'units_remaining': remaining,
+        'oversold': sold + remaining != stock * len(medicines) or remaining < 0,
+    }
+
+
+def session_writes(queries):
+    writes = [q['sql'] for q in queries if 'django_session' in q['sql'] and not q['sql'].startswith('SELECT')]
+    return {'writes': len(writes), 'bytes': sum(len(sql) for sql in writes)}
+
+
+@scenario('cart_session')
+def cart_session(options):
+    """Session write volume of a cart workload: the old session-serialized cart vs. the cart tables."""
+    lines = options.get('count') or 30
+    medicines = make_medicines(lines, prefix='Cart')
+    user = User.objects.create_user('cartbench', password='pw')
+
+    # Before: every add/update/remove rewrote the whole cart dict into the session row.
+    session = SessionStore()
+    legacy = {}
+    with CaptureQueriesContext(connection) as before:
+        for m in medicines:
+            legacy[str(m.id)] = {'name': m.name, 'price': str(m.price), 'quantity': 1,
+                                 'image': m.image.url, 'max_quantity': m.quantity}
+            session['cart'] = legacy
+            session.save()
+        for m in medicines:
+            legacy[str(m.id)]['quantity'] = 2
+            session['cart'] = legacy
+            session.save()
+        for m in medicines:
+            del legacy[str(m.id)]
+            session['cart'] = legacy
+            session.save()
+
+    # After: the same workload through the real views.
+    client = Client()
+    client.force_login(user)
+    with CaptureQueriesContext(connection) as after:
+        for m in medicines:
+            client.post(f'/cart/add/{m.id}/')
+        for m in medicines:
+            client.post(f'/cart/update/{m.id}/', {'quantity': '2'})
+        for m in medicines:
+            client.post(f'/cart/remove/{m.id}/')
+
+    return {
+        'operations': lines * 3,
+        'session_cart': session_writes(before),
+        'cart_tables': session_writes(after),
+    }
+
+
+@scenario('home_cache')
+def home_cache(options):
+    """Home page throughput with the catalog grid/card cache off and on."""
+    requests = options.get('count') or 500
+    make_synthetic_medicines(1000)
+    search_index.rebuild()
+    client = Client()
+
+    results = {'requests': requests}
+    for label, enabled in (('uncached', False), ('cached', True)):
+        with override_settings(CATALOG_CACHE_ENABLED=enabled):
+            catalog_cache.get_cache().clear()
+            for path in ('/', '/?q=paracetamol'):
+                client.get(path)  # warm up
+                samples = []
+                with CaptureQueriesContext(connection) as queries:
+                    for _ in range(requests):
+                        samples.append(timed(client.get, path)[0])
+                results[f'{label} {path}'] = {
+                    'req_per_s': round(len(samples) / sum(samples), 1),
+                    'queries_per_request': round(len(queries) / requests, 2),
+                    **summarize(samples),
+                }
+    return results
+
+
+@scenario('admin_listing')
+def admin_listing(options):
+    """Product management page and listing API render time and payload at growing catalog sizes."""
+    sizes = [options['count']] if options.get('count') else [1000, 10000, 100000]
+    staff = User.objects.create_user('listingbench', password='pw', is_staff=True)
+    client = Client()
+    client.force_login(staff)
+
+    def measure(path, params=None, repeat=20):
+        samples, size = [], 0
+        for _ in range(repeat):
+            elapsed, response = timed(client.get, path, params or {})
+            samples.append(elapsed)
+            size = len(response.content)
+        return {'bytes': size, **summarize(samples)}
+
+    results = {}
+    for size in sizes:
+        have = Medicine.objects.count()
+        make_synthetic_medicines(size - have, seed=size, offset=have)
+        search.install_fts()
+        middle = Medicine.objects.order_by('-created_at', '-id')[size // 2]
+        api = '/api/medicines/'
+        results[size] = {
+            'page': measure('/admin/add-product/'),
+            'api_first_page': measure(api),
+            'api_deep_page': measure(api, {'cursor': listing.encode_cursor('newest', middle)}),
+            'api_search': measure(api, {'q': 'paracetamol', 'sort': 'name'}),
+            'api_low_stock': measure(api, {'stock': 'low'}),
+            'api_price_sort': measure(api, {'sort': '-price'}),
+            'counts': summarize([timed(listing.stock_counts)[0] for _ in range(20)]),
+        }
+    return results
+
+
+@scenario('inventory_batch')
+def inventory_batch(options):
+    """A stock-take over N medicines: one request per medicine vs one batch request."""
+    count = options.get('count') or 2000
+    make_synthetic_medicines(count, seed=13)
+    staff = User.objects.create_user('inventorybench', password='pw', is_staff=True)
+    client = Client()
+    client.force_login(staff)
+    medicines = list(Medicine.objects.only('id', 'version').order_by('id')[:count])
+
+    def per_row():
+        for m in medicines:
+            client.post(f'/api/medicine/{m.id}/', {'quantity': 50}, content_type='application/json')
+
+    def batch():
+        patches = [{'id': m.id, 'quantity': 60} for m in medicines]
+        return client.post('/api/medicine/batch/', patches, content_type='application/json')
+
+    row_time, row_queries, _ = counted(per_row)
+    batch_time, batch_queries, response = counted(batch)
+    assert response.status_code == 200, response.content
+    return {
+        'medicines': count,
+        'per_row': {'seconds': round(row_time, 3), 'queries': row_queries},
+        'batch': {'seconds': round(batch_time, 3), 'queries': batch_queries},
+        'speedup': round(row_time / batch_time, 1),
+    }
+
+
+def peak_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+@scenario('catalog_import')
+def catalog_import(options):
+    """Streaming CSV import of a synthetic price list: rows/sec and peak RSS, first load and re-import."""
+    count = options.get('count') or 1_000_000
+    rng = random.Random(14)
+    fd, path = tempfile.mkstemp(suffix='.csv')
+    try:
+        with os.fdopen(fd, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(importer.COLUMNS)
+            for i in range(count):
+                m = synthetic_medicine(i, rng)
+                # every 1000th row is invalid, to exercise the error report
+                quantity = -1 if i % 1000 == 999 else m.quantity
+                writer.writerow([m.product_number, m.name, m.components, m.company_name, m.power, quantity, m.price])
+        size_mb = round(os.path.getsize(path) / 1024 / 1024, 1)
+
+        def run():
+            rss_before = peak_rss_mb()
+            with open(path, 'rb') as f:
+                elapsed, result = timed(importer.import_catalog, importer.read_records(f, path),
+                                        report=lambda *row: None)
+            return {
+                'seconds': round(elapsed, 1),
+                'rows_per_sec': round(result.rows / elapsed),
+                'created': result.created,
+                'updated': result.updated,
+                'rejected': result.error_rows,
+                'peak_rss_mb_before': rss_before,
+                'peak_rss_mb_after': peak_rss_mb(),
+            }
+
+        return {'rows': count, 'file_mb': size_mb, 'first_load': run(), 'reimport': run()}
+    finally:
+        os.remove(path)
+
+
+def make_order_lines(count, user, medicines, lines_per_order=4, batch_size=5000):
+    """Bulk insert completed orders holding ``count`` lines in total."""
+    rng = random.Random(15)
+    for start in range(0, count, batch_size):
+        n = min(batch_size, count - start)
+        batch = Order.objects.bulk_create([
+            Order(user=user, total_amount=100, final_amount=100, is_completed=True)
+            for _ in range((n + lines_per_order - 1) // lines_per_order)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=batch[i // lines_per_order], medicine=rng.choice(medicines),
+                      quantity=rng.randint(1, 5), price=Decimal('12.50'))
+            for i in range(n)
+        ], batch_size=batch_size)
+
+
+@scenario('order_export')
+def order_export(options):
+    """Streaming order-line export: throughput and peak Python memory at growing row counts."""
+    largest = options.get('count') or 500_000
+    user = User.objects.create_user('exportbench')
+    medicines = make_medicines(50, prefix='Export')
+    results, have = {}, 0
+    for size in (largest // 100, largest // 10, largest):
+        make_order_lines(size - have, user, medicines)
+        have = size
+        for fmt, compress in (('csv', False), ('jsonl', False), ('csv', True)):
+            def drain():
+                return sum(len(chunk) for chunk in exports.export(fmt, compress=compress))
+
+            elapsed, written = timed(drain)
+            # a second, traced pass: tracing slows the export down too much to time it
+            tracemalloc.start()
+            drain()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results[f'{size} {fmt}{" gzip" if compress else ""}'] = {
+                'seconds': round(elapsed, 2),
+                'rows_per_sec': round(size / elapsed),
+                'kb': round(written / 1024),
+                'peak_python_mb': round(peak / 1024 / 1024, 2),
+            }
+    return results
+
+
+def raw_sales_report(start, end, top=rollups.TOP_SIZE):
+    """What ``rollups.report`` would cost computed from ``OrderItem`` directly."""
+    items = OrderItem.objects.filter(order__is_completed=True, **exports.date_bounds(start, end))
+    return {
+        'daily': list(items.annotate(day=TruncDate('order__order_date')).values('day')
+                      .annotate(units=Sum('quantity'), revenue=rollups.REVENUE).order_by('day')),
+        'medicines': list(items.values('medicine_id', 'medicine__name')
+                          .annotate(units=Sum('quantity'), revenue=rollups.REVENUE).order_by('-revenue')[:top]),
+        'companies': list(items.values('medicine__company_name')
+                          .annotate(units=Sum('quantity'), revenue=rollups.REVENUE).order_by('-revenue')[:top]),
+    }
+
+
+@scenario('sales_report')
+def sales_report(options):
+    """Sales report latency from the rollups vs raw OrderItem aggregation as order history grows."""
+    lines_per_day = options.get('count') or 300
+    user = User.objects.create_user('salesbench')
+    medicines = make_medicines(500, prefix='Sales')
+    today = timezone.localdate()
+    results, have = {}, 0
+    for history in (30, 365, 1095):
+        for age in range(have, history):
+            first = Order.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+            make_order_lines(lines_per_day, user, medicines)
+            moment = timezone.make_aware(datetime.combine(today - timedelta(days=age), datetime.min.time()))
+            Order.objects.filter(pk__gt=first).update(order_date=moment + timedelta(hours=12))
+        have = history
+        rebuild_seconds, _ = timed(rollups.rebuild)
+
+        row = {'order_lines': OrderItem.objects.count(), 'rebuild_seconds': round(rebuild_seconds, 2)}
+        for window in (30, 365):
+            start = today - timedelta(days=window - 1)
+            row[f'rollup_{window}d'] = summarize([timed(rollups.report, start, today)[0] for _ in range(10)])
+            row[f'raw_{window}d'] = summarize([timed(raw_sales_report, start, today)[0] for _ in range(3)])
+        results[f'{history} days'] = row
+    return results
+
+
+def make_sales_history(days, selling_rate=0.1, seed=17):
+    """Sparse daily rollups for every medicine: each sells on about ``selling_rate`` of the days."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    ids = np.array(Medicine.objects.order_by('pk').values_list('pk', flat=True))
+    today = timezone.localdate()
+    table = connection.ops.quote_name(DailyMedicineSales._meta.db_table)
+    sql = f'INSERT INTO {table} (date, medicine_id, units, revenue, order_lines) VALUES (%s, %s, %s, %s, 1)'
+    rows = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        for age in range(1, days + 1):
+            day = (today - timedelta(days=age)).isoformat()
+            sold = ids[rng.random(len(ids)) < selling_rate]
+            units = rng.integers(1, 20, len(sold))
+            cursor.executemany(sql, [(day, int(pk), int(n), int(n) * 10) for pk, n in zip(sold, units)])
+            rows += len(sold)
+    return rows
+
+
+@scenario('forecast')
+def forecast_catalog(options):
+    """Reorder forecast for the whole catalog from two years of daily sales rollups."""
+    skus = options.get('count') or 100_000
+    make_synthetic_medicines(skus, seed=17)
+    history_rows = make_sales_history(forecasting.HISTORY_DAYS)
+    end = timezone.localdate() - timedelta(days=1)
+    results = {'skus': skus, 'days': forecasting.HISTORY_DAYS, 'history_rows': history_rows}
+
+    catalog_seconds, catalog = timed(forecasting.load_catalog)
+    history_seconds, history = timed(forecasting.load_history,
+                                     end - timedelta(days=forecasting.HISTORY_DAYS - 1), end)
+    results['load_catalog_seconds'] = round(catalog_seconds, 2)
+    results['load_history_seconds'] = round(history_seconds, 2)
+    for method in forecasting.METHODS:
+        results[f'compute_{method}'] = summarize([timed(forecasting.compute, *catalog, *history, method=method)[0]
+                                                  for _ in range(5)])
+        total, forecast = timed(forecasting.forecast, method)
+        results[f'forecast_{method}_seconds'] = round(total, 2)
+        results[f'to_reorder_{method}'] = len(forecast.suggestions())
+    return results
+
+
+class NaiveMedicineSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Medicine
+        exclude = ['image_variants']
+
+
+@scenario('catalog_api')
+def catalog_api(options):
+    """Serialization throughput of the catalog API serializer against a plain ModelSerializer."""
+    count = options.get('count') or 20000
+    make_synthetic_medicines(count)
+    client = Client()
+
+    def throughput(serialize, queryset, repeat=3):
+        rows = list(queryset)
+        samples = [timed(serialize, rows)[0] for _ in range(repeat)]
+        return round(count / min(samples))
+
+    results = {
+        'medicines': count,
+        'model_serializer_objects_per_s': throughput(
+            lambda rows: NaiveMedicineSerializer(rows, many=True).data, Medicine.objects.all(),
+        ),
+        'feed_serializer_objects_per_s': throughput(
+            lambda rows: MedicineFeedSerializer(rows, many=True).data,
+            Medicine.objects.only(*model_fields(DEFAULT_FIELDS)),
+        ),
+        'feed_serializer_3_fields_objects_per_s': throughput(
+            lambda rows: MedicineFeedSerializer(rows, many=True, fields=('id', 'name', 'price')).data,
+            Medicine.objects.only('id', 'name', 'price'),
+        ),
+    }
+
+    for label, query in (('all_fields', ''), ('3_fields', '&fields=id,name,price')):
+        samples, raw, sent, url = [], 0, 0, f'/api/v1/medicines/?limit=1000{query}'
+        while url:
+            elapsed, response = timed(client.get, url, HTTP_ACCEPT_ENCODING='gzip')
+            samples.append(elapsed)
+            body = gzip.decompress(response.content)
+            raw, sent = raw + len(body), sent + len(response.content)
+            url = json.loads(body)['next']
+        results[f'api_{label}'] = {
+            'objects_per_s': round(count / sum(samples)),
+            'mb': round(raw / 2 ** 20, 2),
+            'gzipped_mb': round(sent / 2 ** 20, 2),
+            **summarize(samples),
+        }
+    return results
+
+
+@scenario('instrumentation')
+def instrumentation_overhead(options):
+    """Request latency with the performance middleware off and on."""
+    requests = options.get('count') or 500
+    medicines = make_medicines(50)
+    paths = ['/', '/api/v1/medicines/?limit=50', f'/medicine/{medicines[0].id}/']
+    results = {'requests': requests}
+    with StubFDAServer({}) as stub, override_settings(FDA_API_URL=stub.url, PERF_SLOW_REQUEST_MS=10 ** 6):
+        for label, enabled in (('off', False), ('on', True)):
+            with override_settings(PERF_INSTRUMENTATION=enabled):
+                # A new client loads the middleware stack with the setting in force
+                client = Client()
+                for path in paths:
+                    client.get(path)  # warm up
+                    samples = [timed(client.get, path)[0] for _ in range(requests)]
+                    results[f'{label} {path}'] = summarize(samples)
+    for path in paths:
+        off, on = results[f'off {path}']['mean_ms'], results[f'on {path}']['mean_ms']
+        results[f'overhead {path}'] = {'ms': round(on - off, 3), 'pct': round(100 * (on - off) / off, 1)}
+    return results
+
+
+def route_stats(samples, queries=None):
+    """``summarize`` plus serial throughput and, if counted, queries per request."""
+    stats = {'req_per_s': round(len(samples) / sum(samples), 1) if samples else 0.0, **summarize(samples)}
+    if queries is not None:
+        stats['queries_per_request'] = round(queries / len(samples), 2) if samples else 0.0
+    return stats
+
+
+@scenario('e2e')
+def end_to_end(options):
+    """Latency and queries per request of the main shop routes on a seeded database."""
+    requests = options.get('count') or 200
+    seeding.seed(medicines=5000, users=200, orders=20000, seed=1)
+    rng = random.Random(3)
+    in_stock = list(Medicine.objects.filter(quantity__gte=100).values_list('pk', flat=True)[:1000])
+    words = sorted({name.split()[0].lower() for name in Medicine.objects.values_list('name', flat=True)[:200]})
+    customer = User.objects.filter(username__startswith='customer').order_by('pk').first()
+    staff = User.objects.create_user('e2e-staff', password='password', is_staff=True)
+
+    anonymous, shopper, admin = Client(), Client(), Client()
+    shopper.force_login(customer)
+    admin.force_login(staff)
+
+    def fill_cart():
+        CartItem.objects.filter(cart__user=customer).delete()
+        for pk in rng.sample(in_stock, 2):
+            shopper.post(f'/cart/add/{pk}/')
+
+    # name: (client, method, path, untimed setup before each request)
+    routes = {
+        'home_search': (anonymous, 'get', lambda: f'/?q={rng.choice(words)}', None),
+        'medicine_detail': (anonymous, 'get', lambda: f'/medicine/{rng.choice(in_stock)}/', None),
+        'add_to_cart': (shopper, 'post', lambda: f'/cart/add/{rng.choice(in_stock)}/', None),
+        'checkout': (shopper, 'post', lambda: '/checkout/', fill_cart),
+        'profile': (shopper, 'get', lambda: '/profile/', None),
+        'admin_product_management': (admin, 'get', lambda: '/admin/add-product/', None),
+        'admin_product_listing': (admin, 'get', lambda: '/api/medicines/', None),
+    }
+    results = {'requests_per_route': requests}
+    with StubFDAServer({}) as stub, override_settings(FDA_API_URL=stub.url):
+        for name, (client, method, path, setup) in routes.items():
+            samples, queries, errors = [], 0, 0
+            for _ in range(requests):
+                if setup:
+                    setup()
+                elapsed, count, response = counted(getattr(client, method), path())
+                samples.append(elapsed)
+                queries += count
+                errors += response.status_code >= 400
+            results[name] = {**route_stats(samples, queries), 'errors': errors}
+    return results
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+# route: (weight, path)
+BROWSING_MIX = {
+    'home': (1, lambda rng, ids, words: '/'),
+    'home_search': (3, lambda rng, ids, words: f'/?q={rng.choice(words)}'),
+    'medicine_detail': (5, lambda rng, ids, words: f'/medicine/{rng.choice(ids)}/'),
+    'catalog_api': (2, lambda rng, ids, words: '/api/v1/medicines/?limit=50&fields=id,name,price,stock'),
+}
+
+
+@scenario('http_load')
+def http_load(options):
+    """Concurrent HTTP clients browsing a threaded WSGI server: throughput, latency and queries per view."""
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=WAL')
+
+    workers = options.get('workers') or 8
+    per_worker = max(1, (options.get('count') or 2000) // workers)
+    seeding.seed(medicines=5000, users=50, orders=5000, seed=2)
+    ids = list(Medicine.objects.values_list('pk', flat=True)[:2000])
+    words = sorted({name.split()[0].lower() for name in Medicine.objects.values_list('name', flat=True)[:200]})
+    connection.close()
+
+    names = list(BROWSING_MIX)
+    weights = [BROWSING_MIX[name][0] for name in names]
+    samples = {name: [] for name in names}
+    errors = []
+    lock = threading.Lock()
+
+    with StubFDAServer({}) as stub, override_settings(
+        FDA_API_URL=stub.url, PERF_INSTRUMENTATION=True, PERF_SLOW_REQUEST_MS=10 ** 6,
+    ):
+        instrumentation.reset()
+        server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler)
+        # Loaded here so the middleware stack sees PERF_INSTRUMENTATION
+        server.set_app(get_wsgi_application())
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f'http://127.0.0.1:{server.server_port}'
+
+        def worker(i):
+            rng = random.Random(i)
+            session = Session()
+            for _ in range(per_worker):
+                name = rng.choices(names, weights)[0]
+                start = time.perf_counter()
+                try:
+                    status = session.get(base + BROWSING_MIX[name][1](rng, ids, words), timeout=30).status_code
+                except RequestException as e:
+                    status = type(e).__name__
+                elapsed = time.perf_counter() - start
+                with lock:
+                    if status == 200:
+                        samples[name].append(elapsed)
+                    else:
+                        errors.append(status)
+            session.close()
+
+        try:
+            seconds = run_concurrently(workers, worker)
+        finally:
+            server.shutdown()
+            server.server_close()
+        views = instrumentation.snapshot()
+
+    completed = sum(len(route) for route in samples.values())
+    view_names = {'home': 'home', 'home_search': 'home', 'medicine_detail': 'medicine_detail',
+                  'catalog_api': 'api_v1_medicine_list'}
+    return {
+        'workers': workers,
+        'requests': completed + len(errors),
+        'errors': len(errors),
+        'req_per_s': round(completed / seconds, 1),
+        'latency': summarize([elapsed for route in samples.values() for elapsed in route]),
+        **{
+            name: {**summarize(route), 'queries_per_request': views.get(view_names[name], {}).get('mean_queries')}
+            for name, route in samples.items()
+        },
+    }
+
+
+
+def as_request(func, *args):
+    """Call ``func`` the way a view runs: between request signals, so ``CONN_MAX_AGE`` applies."""
+    request_started.send(sender=None)
+    token = routers.start_request()
+    try:
+        return func(*args)
+    finally:
+        routers.end_request(token)
+        request_finished.send(sender=None)
+
+
+# Before this tuning: rollback journal, a new connection per request,
+# deferred transactions and no replicas
+UNTUNED_DATABASE = {'CONN_MAX_AGE': 0, 'OPTIONS': {}}
+UNTUNED_PRAGMAS = {'journal_mode': 'DELETE', 'synchronous': 'FULL'}
+
+
+@scenario('read_write')
+def read_write(options):
+    """Mixed catalog reads and checkouts from concurrent threads, before and after the database tuning."""
+    workers = options.get('workers') or 8
+    writers = max(1, workers // 4)
+    per_worker = max(1, (options.get('count') or 1600) // workers)
+    seeding.seed(medicines=3000, users=100, orders=5000, seed=4)
+    Medicine.objects.update(quantity=10 ** 6)
+    ids = list(Medicine.objects.values_list('pk', flat=True))
+    users = list(User.objects.filter(username__startswith='customer'))
+    words = sorted({name.split()[0].lower() for name in Medicine.objects.values_list('name', flat=True)[:200]})
+    medicines = {m.pk: m for m in Medicine.objects.filter(pk__in=ids[:500])}
+
+    def browse(rng):
+        list(search.search_medicines(rng.choice(words))[:20])
+        Medicine.objects.get(pk=rng.choice(ids))
+        list(OrderItem.objects.filter(order__user=rng.choice(users)).select_related('order', 'medicine')[:20])
+
+    def checkout(rng):
+        lines = [CartLine(medicine=m, quantity=1, price=m.price) for m in rng.sample(list(medicines.values()), 2)]
+        orders.place_order(rng.choice(users), lines)
+
+    opened = []
+    connection_created.connect(lambda **kwargs: opened.append(1), weak=False, dispatch_uid='benchmark.read_write')
+
+    def run():
+        samples = {'read': [], 'write': []}
+        errors = []
+        lock = threading.Lock()
+        opened.clear()
+
+        def worker(i):
+            rng = random.Random(i)
+            kind, work = ('write', checkout) if i < writers else ('read', browse)
+            for _ in range(per_worker):
+                start = time.perf_counter()
+                try:
+                    as_request(work, rng)
+                except OperationalError as e:
+                    with lock:
+                        errors.append(str(e))
+                    continue
+                with lock:
+                    samples[kind].append(time.perf_counter() - start)
+
+        seconds = run_concurrently(workers, worker)
+        return {
+            'readers': workers - writers,
+            'writers': writers,
+            'reads_per_s': round(len(samples['read']) / seconds, 1),
+            'writes_per_s': round(len(samples['write']) / seconds, 1),
+            'read': summarize(samples['read']),
+            'write': summarize(samples['write']),
+            'errors': len(errors),
+            'connections_opened': len(opened),
+        }
+
+    def reconnect():
+        for conn in connections.all():
+            conn.close()
+
+    results = {}
+    saved = {alias: dict(connections[alias].settings_dict) for alias in connections}
+    try:
+        for alias in connections:
+            connections[alias].settings_dict.update(UNTUNED_DATABASE)
+        with override_settings(SQLITE_PRAGMAS=UNTUNED_PRAGMAS, DATABASE_REPLICAS=[]):
+            reconnect()
+            results['untuned'] = run()
+    finally:
+        for alias, settings_dict in saved.items():
+            connections[alias].settings_dict.update(settings_dict)
+        reconnect()
+
+    # The benchmark's own database files, so WAL is on whatever SQLITE_WAL says
+    with override_settings(SQLITE_PRAGMAS={**settings.SQLITE_PRAGMAS, **settings.SQLITE_WAL_PRAGMAS}):
+        reconnect()
+        with override_settings(DATABASE_REPLICAS=[]):
+            results['tuned'] = run()
+        if settings.DATABASE_REPLICAS:
+            results['synced_replicas'] = routers.sync_sqlite_replicas()
+            results['tuned_with_replicas'] = run()
+    connection_created.disconnect(dispatch_uid='benchmark.read_write')
+    return results
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(args, env, log):
+    """Start gunicorn with ``args`` on a free port; returns ``(process, base url)`` once it answers."""
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', *args, '--bind', f'127.0.0.1:{port}'],
+        cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=log,
+    )
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            httpx.get(f'{url}/api/v1/medicines/?limit=1', timeout=1)
+            return process, url
+        except httpx.HTTPError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError(f'gunicorn {" ".join(args)} did not start; see {log.name}')
+            time.sleep(0.2)
+
+
+async def load_test(url, paths, concurrency):
+    """GET every path with ``concurrency`` connections in flight; returns ``(seconds, latencies, errors)``."""
+    pending = iter(paths)
+    samples, errors = [], 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        async def connection_loop():
+            nonlocal errors
+            for path in pending:
+                start = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                if response.status_code == 200:
+                    samples.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(connection_loop() for _ in range(concurrency)))
+    return time.perf_counter() - start, samples, errors
+
+
+SLOW_UPSTREAM_SECONDS = 1.0
+# name: gunicorn arguments; one process each, so the comparison is per worker
+SERVERS = {
+    'wsgi_gthread_8_threads': ['medical_shop.wsgi:application', '-k', 'gthread', '--workers', '1', '--threads', '8'],
+    'asgi_uvicorn': ['medical_shop.asgi:application', '-c', 'medical_shop/gunicorn_asgi.py', '--workers', '1'],
+}
+
+
+@scenario('asgi')
+def wsgi_versus_asgi(options):
+    """Product pages under a slow FDA API from many concurrent connections, served by WSGI and ASGI workers."""
+    concurrency = options.get('workers') or 64
+    medicines = make_medicines(options.get('count') or 640)
+    # A distinct medicine per request, so every page waits on the upstream
+    paths = [f'/medicine/{m.id}/' for m in medicines]
+    database = connection.settings_dict['NAME']
+    results = {
+        'concurrency': concurrency, 'requests': len(paths),
+        'upstream_delay_seconds': SLOW_UPSTREAM_SECONDS, 'label_budget_seconds': settings.FDA_LABEL_BUDGET,
+    }
+    with StubFDAServer({}, delay=SLOW_UPSTREAM_SECONDS) as stub, tempfile.NamedTemporaryFile('w', suffix='.log') as log:
+        env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'medical_shop.settings'),
+            'FDA_API_URL': stub.url,
+            'PERF_INSTRUMENTATION': '0',
+            **({'SQLITE_PATH': str(database)} if connection.vendor == 'sqlite' else {'POSTGRES_DB': database}),
+        }
+        for name, args in SERVERS.items():
+            DrugLabelCache.objects.all().delete()
+            process, url = start_gunicorn(args, env, log)
+            try:
+                seconds, samples, errors = asyncio.run(load_test(url, paths, concurrency))
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+            results[name] = {
+                'req_per_s': round(len(samples) / seconds, 1),
+                'errors': errors,
+                **summarize(samples),
+            }
+    return results
+
+@scenario('jobs')
+def background_jobs(options):
+    """Checkout with its follow-up work queued, and how fast one or more worker processes drain the queue."""
+    count = options.get('count') or 500
+    processes = options.get('workers') or 4
+    medicines = make_medicines(20, prefix='Jobs')
+    Medicine.objects.update(quantity=count * 20)
+    user = User.objects.create_user('jobs')
+    rng = random.Random(0)
+    baskets = [
+        [CartLine(medicine=m, quantity=rng.randint(1, 3), price=m.price) for m in rng.sample(medicines, rng.randint(1, 4))]
+        for _ in range(count)
+    ]
+    checkout = [timed(orders.place_order, user, lines)[0] for lines in baskets]
+
+    # What each checkout would pay running its follow-up work inline instead
+    inline = []
+    for lines in baskets:
+        token = routers.start_request()
+        inline.append(timed(orders.notify_low_stock, [[line.medicine.pk, line.quantity] for line in lines])[0])
+        routers.end_request(token)
+
+    queued = Job.objects.count()
+    results = {'jobs': queued, 'checkout': summarize(checkout), 'followups_inline': summarize(inline)}
+    for n in sorted({1, processes}):
+        Job.objects.update(status=Job.QUEUED, attempts=0, started_at=None, finished_at=None)
+        start = time.perf_counter()
+        call_command('run_jobs', processes=n, burst=True, stdout=io.StringIO())
+        seconds = time.perf_counter() - start
+        results[f'workers_{n}'] = {
+            'seconds': round(seconds, 2),
+            'jobs_per_second': round(queued / seconds, 1),
+            'done': Job.objects.filter(status=Job.DONE).count(),
+        }
+    results['stats'] = {key: value for key, value in jobs.stats().items() if key != 'jobs'}
+    return results
+
+# Metric name endings: +1 when higher is better, -1 when lower is better
+METRIC_DIRECTIONS = (
+    ('per_s', 1), ('per_second', 1),
+    ('_ms', -1), ('_seconds', -1), ('_mb', -1), ('queries', -1), ('queries_per_request', -1),
+)
+
+
+def metric_direction(name):
+    for suffix, direction in METRIC_DIRECTIONS:
+        if name.endswith(suffix):
+            return direction
+    return 0
+
+
+def flatten(results, prefix=''):
+    """``{'scenario.group.metric': number}`` for the numeric leaves of nested results."""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f'{prefix}{key}'] = value
+    return flat
+
+
+def compare(baseline, results, tolerance=10.0):
+    """Metrics that moved more than ``tolerance`` percent from ``baseline``.
+
+    Returns ``(regressions, improvements)``, lists of
+    ``(metric, baseline value, new value, percent change)``. Metrics whose
+    name doesn't say which way is better, or missing from either side, are
+    left out.
+    """
+    old, new = flatten(baseline), flatten(results)
+    regressions, improvements = [], []
+    for metric in sorted(old.keys() & new.keys()):
+        direction = metric_direction(metric.rsplit('.', 1)[-1])
+        if not direction or not old[metric]:
+            continue
+        change = 100 * (new[metric] - old[metric]) / abs(old[metric])
+        if abs(change) <= tolerance:
+            continue
+        row = (metric, old[metric], new[metric], round(change, 1))
+        (improvements if change * direction > 0 else regressions).append(row)
+    return regressions, improvements
@@ -0,0 +1,248 @@
+"""
+Shopping cart service shared by the cart, checkout and add/update views.
+
+Carts live in the ``Cart``/``CartItem`` tables; the session only holds the
+cart id under ``cart_id``, which is written once when the cart is created.
+Adding, updating or removing a line is a single-row upsert or delete and
+never rewrites the session. Prices and stock are read live from
+``Medicine`` whenever the cart is loaded, so they can't go stale.
+
+Logged-in users have one cart (``Cart.user``); an anonymous cart is merged
+into it by the ``user_logged_in`` handler in ``signals.py``.
+
+The cart views are async, so adding, updating and removing lines exist
+only as the ``a``-prefixed functions, on the async session and ORM APIs;
+checkout and the navbar badge are sync and use ``load_cart`` and
+``item_count``. Importing a legacy session cart and the insert race in
+``_upsert`` need transactions, which are sync only, so those rare paths
+run in a thread.
+"""
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from . import images, models
+from .models import CartItem, Medicine
+
+SESSION_KEY = 'cart_id'
+# Carts used to be stored whole in the session under this key
+LEGACY_SESSION_KEY = 'cart'
+# Columns the cart and checkout pages actually read
+CART_FIELDS = ('id', 'name', 'company_name', 'power', 'price', 'quantity', 'image', 'image_variants')
+
+
+@dataclass
+class CartLine:
+    medicine: Medicine
+    quantity: int
+    price: Decimal
+    image: str = ''
+
+    @property
+    def id(self):
+        return str(self.medicine.pk)
+
+    @property
+    def total(self):
+        return self.price * self.quantity
+
+    @property
+    def in_stock(self):
+        return self.quantity <= self.medicine.quantity
+
+
+@dataclass
+class Cart:
+    lines: list = field(default_factory=list)
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __bool__(self):
+        return bool(self.lines)
+
+    @property
+    def total(self):
+        return sum((line.total for line in self.lines), Decimal('0.00'))
+
+    @property
+    def shortages(self):
+        return [line for line in self.lines if not line.in_stock]
+
+
+def get_cart_id(request, create=False):
+    """Return the id of the request's cart, creating it if ``create`` is set."""
+    cart_id = request.session.get(SESSION_KEY)
+    if cart_id is None:
+        user = request.user if request.user.is_authenticated else None
+        if user is not None:
+            cart_id = models.Cart.objects.filter(user=user).values_list('id', flat=True).first()
+        if cart_id is None and (create or LEGACY_SESSION_KEY in request.session):
+            cart_id = models.Cart.objects.get_or_create(user=user)[0].id if user else models.Cart.objects.create().id
+        if cart_id is not None:
+            request.session[SESSION_KEY] = cart_id
+
+    if cart_id is not None and LEGACY_SESSION_KEY in request.session:
+        _import_legacy_cart(request, cart_id)
+    return cart_id
+
+
+def _import_legacy_cart(request, cart_id):
+    legacy = request.session.pop(LEGACY_SESSION_KEY) or {}
+    existing = set(Medicine.objects.filter(pk__in=[int(pk) for pk in legacy]).values_list('pk', flat=True))
+    for medicine_id, item in legacy.items():
+        if int(medicine_id) in existing:
+            _upsert(cart_id, int(medicine_id), item['quantity'])
+
+
+def _upsert(cart_id, medicine_id, quantity):
+    """Add ``quantity`` to a cart line, creating the line if needed."""
+    if CartItem.objects.filter(cart_id=cart_id, medicine_id=medicine_id).update(quantity=F('quantity') + quantity):
+        return
+    try:
+        with transaction.atomic():
+            CartItem.objects.create(cart_id=cart_id, medicine_id=medicine_id, quantity=quantity)
+    except IntegrityError:
+        # Created concurrently by another request
+        CartItem.objects.filter(cart_id=cart_id, medicine_id=medicine_id).update(quantity=F('quantity') + quantity)
+
+
+def _items(cart_id):
+    return (
+        CartItem.objects.filter(cart_id=cart_id)
+        .select_related('medicine')
+        .only('quantity', 'medicine_id', *(f'medicine__{name}' for name in CART_FIELDS))
+        .order_by('added_at', 'id')
+    )
+
+
+def _line(item):
+    medicine = item.medicine
+    return CartLine(
+        medicine=medicine,
+        quantity=item.quantity,
+        price=medicine.price,
+        image=images.variant_url(medicine, 'thumb'),
+    )
+
+
+def load_cart(request):
+    """Resolve the request's cart into a ``Cart`` with live prices, using one query."""
+    cached = getattr(request, '_cart', None)
+    if cached is not None:
+        return cached
+
+    cart = Cart()
+    cart_id = get_cart_id(request)
+    if cart_id is not None:
+        cart.lines = [_line(item) for item in _items(cart_id)]
+    request._cart = cart
+    return cart
+
+
+def _changed(request):
+    request._cart = None
+    request._cart_count = None
+
+
+def item_count(request):
+    """Number of lines in the cart, for the navbar badge (and ETags); counted once per request."""
+    cached = getattr(request, '_cart', None)
+    if cached is not None:
+        return len(cached)
+    count = getattr(request, '_cart_count', None)
+    if count is None:
+        cart_id = get_cart_id(request)
+        count = request._cart_count = CartItem.objects.filter(cart_id=cart_id).count() if cart_id is not None else 0
+    return count
+
+
+def emptied(request):
+    """Forget the request's loaded cart after ``place_order`` emptied it."""
+    _changed(request)
+
+
+def merge_carts(source_id, user):
+    """Move every line of cart ``source_id`` into ``user``'s cart; returns its id."""
+    target, _ = models.Cart.objects.get_or_create(user=user)
+    if source_id is not None and source_id != target.id:
+        with transaction.atomic():
+            items = CartItem.objects.filter(cart_id=source_id, cart__user__isnull=True)
+            for medicine_id, quantity in items.values_list('medicine_id', 'quantity'):
+                _upsert(target.id, medicine_id, quantity)
+            models.Cart.objects.filter(pk=source_id, user__isnull=True).delete()
+    return target.id
+
+
+async def aget_cart_id(request, create=False):
+    session = request.session
+    cart_id = await session.aget(SESSION_KEY)
+    if cart_id is None:
+        user = await request.auser()
+        user = user if user.is_authenticated else None
+        if user is not None:
+            cart_id = await models.Cart.objects.filter(user=user).values_list('id', flat=True).afirst()
+        if cart_id is None and (create or await session.ahas_key(LEGACY_SESSION_KEY)):
+            if user is not None:
+                cart_id = (await models.Cart.objects.aget_or_create(user=user))[0].id
+            else:
+                cart_id = (await models.Cart.objects.acreate()).id
+        if cart_id is not None:
+            await session.aset(SESSION_KEY, cart_id)
+
+    if cart_id is not None and await session.ahas_key(LEGACY_SESSION_KEY):
+        await sync_to_async(_import_legacy_cart)(request, cart_id)
+    return cart_id
+
+
+async def _aupsert(cart_id, medicine_id, quantity):
+    updated = await CartItem.objects.filter(cart_id=cart_id, medicine_id=medicine_id).aupdate(
+        quantity=F('quantity') + quantity,
+    )
+    if not updated:
+        await sync_to_async(_upsert)(cart_id, medicine_id, quantity)
+
+
+async def aload_cart(request):
+    cached = getattr(request, '_cart', None)
+    if cached is not None:
+        return cached
+
+    cart = Cart()
+    cart_id = await aget_cart_id(request)
+    if cart_id is not None:
+        cart.lines = [_line(item) async for item in _items(cart_id)]
+    request._cart = cart
+    return cart
+
+
+async def aadd_item(request, medicine, quantity=1):
+    await _aupsert(await aget_cart_id(request, create=True), medicine.pk, quantity)
+    _changed(request)
+
+
+async def aset_quantity(request, medicine_id, quantity):
+    if quantity <= 0:
+        await aremove_item(request, medicine_id)
+        return
+    cart_id = await aget_cart_id(request)
+    await CartItem.objects.filter(cart_id=cart_id, medicine_id=medicine_id).aupdate(quantity=quantity)
+    _changed(request)
+
+
+async def aremove_item(request, medicine_id):
+    cart_id = await aget_cart_id(request)
+    deleted, _ = await CartItem.objects.filter(cart_id=cart_id, medicine_id=medicine_id).adelete()
+    _changed(request)
+    return deleted > 0
+
+
+async def acontains(request, medicine_id):
+    cart_id = await aget_cart_id(request)
+    return cart_id is not None and await CartItem.objects.filter(cart_id=cart_id, medicine_id=medicine_id).aexists()
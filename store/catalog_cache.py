@@ -0,0 +1,150 @@
+"""
+Rendered-HTML cache for the catalog grid on the home page.
+
+Each product card is cached under a key that embeds the medicine's
+``updated_at`` (``catalog:card:<id>:<updated_at>``), and the whole "newest
+medicines" grid under the ``CatalogVersion`` counter
+(``catalog:home:<version>``). Both come from the database, not the cache,
+so a change made by one worker is seen by every other worker on its next
+request even with a per-process cache; stale entries are never read again
+and simply expire. Saving or deleting a medicine advances the counter (see
+``signals.py``); code that changes medicines with ``QuerySet.update`` must
+set ``updated_at`` and call ``invalidate`` itself, as ``place_order`` does.
+
+The counter is also behind the catalog ETags (see conditional.py), so a
+request reads it once, with ``catalog_state``, for both.
+
+Anything written under a version key is read from the primary: a lagging
+replica could still have the rows from before the change that bumped the
+version, and the stale HTML would be served until the next change.
+
+Cards contain the add-to-cart form, so they are rendered with a placeholder
+instead of the CSRF token and the caller's token is substituted on the way
+out; the cached HTML is the same for every visitor.
+
+With a cache shared between processes, ``warm`` renders the home grid and
+the changed cards in a background job after checkout, so the next visitor
+doesn't pay for the re-render.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+
+from . import jobs
+from .models import CatalogVersion, Medicine
+
+CARD_TEMPLATE = 'partials/medicine_card.html'
+CATALOG_STATE_PK = 1
+CSRF_PLACEHOLDER = '__CATALOG_CSRF_TOKEN__'
+HOME_SIZE = 12
+
+
+def enabled():
+    return settings.CATALOG_CACHE_ENABLED
+
+
+def get_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def shared():
+    """Whether other processes (a job worker) can fill the cache for the web server."""
+    return enabled() and not isinstance(get_cache(), LocMemCache)
+
+
+def invalidate():
+    """Advance the catalog version: every cached grid and the catalog ETags go stale.
+
+    Changed cards need nothing more than a new ``updated_at``.
+    """
+    now = timezone.now()
+    if not CatalogVersion.objects.filter(pk=CATALOG_STATE_PK).update(version=F('version') + 1, updated_at=now):
+        CatalogVersion.objects.get_or_create(pk=CATALOG_STATE_PK, defaults={'updated_at': now})
+
+
+def catalog_state(request=None):
+    """``(version, updated_at)`` of the ``CatalogVersion`` row, read once per ``request``."""
+    state = getattr(request, '_catalog_state', None)
+    if state is None:
+        state = (
+            CatalogVersion.objects.filter(pk=CATALOG_STATE_PK).values_list('version', 'updated_at').first()
+            or (0, None)
+        )
+        if request is not None:
+            request._catalog_state = state
+    return state
+
+
+def render_card(medicine):
+    return render_to_string(CARD_TEMPLATE, {'medicine': medicine, 'csrf_token': CSRF_PLACEHOLDER})
+
+
+def render_cards(medicines):
+    """HTML of the cards of ``medicines``, in order, reusing cached cards."""
+    if not enabled():
+        return ''.join(render_card(m) for m in medicines)
+
+    cache = get_cache()
+    keys = [f'catalog:card:{m.pk}:{m.updated_at.timestamp():.6f}' for m in medicines]
+    cards = cache.get_many(keys)
+    missing = [(key, m) for key, m in zip(keys, medicines) if key not in cards]
+    if missing:
+        missing_keys, missing_medicines = zip(*missing)
+        rendered = {key: render_card(m) for key, m in zip(missing_keys, _from_primary(missing_medicines))}
+        cache.set_many(rendered, timeout=settings.CATALOG_CACHE_TIMEOUT)
+        cards.update(rendered)
+    return ''.join(cards[key] for key in keys)
+
+
+def _from_primary(medicines):
+    """``medicines`` as the primary has them, reloading any that were read from a replica."""
+    replicated = [m.pk for m in medicines if m._state.db != DEFAULT_DB_ALIAS]
+    if not replicated:
+        return medicines
+    fresh = Medicine.objects.using(DEFAULT_DB_ALIAS).in_bulk(replicated)
+    return [fresh.get(m.pk, m) for m in medicines]
+
+
+def with_csrf(request, html):
+    if CSRF_PLACEHOLDER not in html:
+        return mark_safe(html)
+    return mark_safe(html.replace(CSRF_PLACEHOLDER, get_token(request)))
+
+
+def home_grid(request):
+    """The rendered grid of the newest medicines; only the catalog version is read on a cache hit."""
+    if not enabled():
+        medicines = Medicine.objects.order_by('-created_at')[:HOME_SIZE]
+        return with_csrf(request, render_cards(medicines))
+
+    return with_csrf(request, _cached_home_grid(catalog_state(request)[0]))
+
+
+def _cached_home_grid(version):
+    cache = get_cache()
+    key = f'catalog:home:{version}'
+    html = cache.get(key)
+    if html is None:
+        html = render_cards(list(Medicine.objects.using(DEFAULT_DB_ALIAS).order_by('-created_at')[:HOME_SIZE]))
+        cache.set(key, html, timeout=settings.CATALOG_CACHE_TIMEOUT)
+    return html
+
+
+def cards_grid(request, medicines):
+    """The rendered cards of ``medicines``, e.g. a page of search results."""
+    return with_csrf(request, render_cards(list(medicines)))
+
+
+@jobs.job(max_attempts=1)
+def warm(medicine_ids=()):
+    """Render the home grid and the cards of ``medicine_ids`` into the cache ahead of visitors."""
+    if not enabled():
+        return
+    _cached_home_grid(catalog_state()[0])
+    render_cards(list(Medicine.objects.using(DEFAULT_DB_ALIAS).filter(pk__in=medicine_ids)))
@@ -0,0 +1,146 @@
+"""
+Conditional GET and Cache-Control for the catalog pages and JSON endpoints.
+
+Validators are cheap: the product page compares ``Medicine.updated_at``
+(one primary-key lookup) and catalog-wide responses (home page, search,
+the listing API) compare the ``CatalogVersion`` counter, which
+``catalog_cache.invalidate`` advances on every change to any medicine.
+It is read from the database, one primary-key lookup shared with the
+home grid, never from a cache that may be private to one worker.
+``condition`` answers a matching ``If-None-Match``/``If-Modified-Since``
+with a 304 before the view runs.
+
+The pages also show who is signed in and their cart badge, so a signed-in
+viewer's ETag includes their user id and cart size; Last-Modified, which
+can't express that, is only sent to anonymous visitors. While flash
+messages are waiting to be shown no validators are sent at all, so a 304
+can't swallow them.
+
+``cache_policy`` sets Cache-Control by audience: anonymous responses are
+``public`` and a shared cache (a reverse proxy in front of the site) may
+serve them for ``CATALOG_SHARED_MAX_AGE`` seconds, while browsers always
+revalidate; signed-in responses are ``private, no-cache``. Both vary on
+``Cookie``, since the CSRF token and session decide what a page contains.
+"""
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from django.views.decorators import http
+
+from . import cart, catalog_cache
+from .models import Medicine
+
+def catalog_version(request):
+    """``(version, updated_at)`` of the catalog, read once per request."""
+    return catalog_cache.catalog_state(request)
+
+
+def _validated(request):
+    """Whether the response may carry validators at all."""
+    return not len(messages.get_messages(request))
+
+
+def _etag(request, resource):
+    if not _validated(request):
+        return None
+    if request.user.is_authenticated:
+        return f'"{resource}-u{request.user.pk}-c{cart.item_count(request)}"'
+    return f'"{resource}"'
+
+
+def _last_modified(request, value):
+    if request.user.is_authenticated or not _validated(request):
+        return None
+    return value
+
+
+def catalog_etag(request, *args, **kwargs):
+    return _etag(request, f'catalog-{catalog_version(request)[0]}')
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    return _last_modified(request, catalog_version(request)[1])
+
+
+def _medicine_updated_at(request, medicine_id):
+    if not hasattr(request, '_medicine_updated_at'):
+        request._medicine_updated_at = (
+            Medicine.objects.filter(pk=medicine_id).values_list('updated_at', flat=True).first()
+        )
+    return request._medicine_updated_at
+
+
+def medicine_etag(request, medicine_id, *args, **kwargs):
+    updated_at = _medicine_updated_at(request, medicine_id)
+    if updated_at is None:
+        return None
+    return _etag(request, f'medicine-{medicine_id}-{updated_at.timestamp():.6f}')
+
+
+def medicine_last_modified(request, medicine_id, *args, **kwargs):
+    return _last_modified(request, _medicine_updated_at(request, medicine_id))
+
+
+def condition(etag_func=None, last_modified_func=None):
+    """``django.views.decorators.http.condition`` that also takes async views.
+
+    Django calls the validator functions inside the event loop for async
+    views, where they can't query the database; here they run in a thread.
+    """
+    def decorator(view):
+        if not iscoroutinefunction(view):
+            return http.condition(etag_func, last_modified_func)(view)
+
+        def validators(request, *args, **kwargs):
+            etag = etag_func(request, *args, **kwargs) if etag_func else None
+            last_modified = last_modified_func(request, *args, **kwargs) if last_modified_func else None
+            return (
+                quote_etag(etag) if etag is not None else None,
+                int(last_modified.timestamp()) if last_modified else None,
+            )
+
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            etag, last_modified = await sync_to_async(validators)(request, *args, **kwargs)
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if request.method in ('GET', 'HEAD'):
+                if last_modified and not response.has_header('Last-Modified'):
+                    response.headers['Last-Modified'] = http_date(last_modified)
+                if etag:
+                    response.headers.setdefault('ETag', etag)
+            return response
+
+        return inner
+
+    return decorator
+
+
+def _apply_policy(request, response, user):
+    if request.method not in ('GET', 'HEAD') or response.status_code not in (200, 304):
+        return response
+    if user.is_authenticated:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, max_age=0, s_maxage=settings.CATALOG_SHARED_MAX_AGE)
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def cache_policy(view):
+    """Cache-Control for anonymous versus signed-in viewers; put it above ``condition``."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            response = await view(request, *args, **kwargs)
+            return _apply_policy(request, response, await request.auser())
+    else:
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            return _apply_policy(request, view(request, *args, **kwargs), request.user)
+    return inner
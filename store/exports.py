@@ -0,0 +1,136 @@
+"""
+Order-line exports for accounting (CSV or JSON Lines, optionally gzipped).
+
+Used by the ``export_orders`` view and ``manage.py export_orders``. Each
+output row is one ``OrderItem`` flattened with its order, customer and
+medicine. Rows come from a single ``values_list`` query read with
+``iterator(chunk_size=...)`` and are encoded and (optionally) compressed
+as they are produced, so memory use does not depend on the number of
+rows exported. Under ASGI Django would read a sync iterator to the end
+before sending anything, so the view hands it over through ``aiterate``,
+which produces the same chunks one at a time from the request's thread.
+
+Date ranges are whole days in the site's time zone, both ends inclusive,
+and are applied as ``order_date`` bounds so they can use ``order_date_idx``.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, time, timedelta
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+
+from .models import OrderItem
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+}
+CHUNK_SIZE = 2000
+# Encoded rows are yielded in pieces of about this many bytes
+BUFFER_SIZE = 64 * 1024
+
+# (output column, OrderItem lookup)
+COLUMNS = (
+    ('order_id', 'order_id'),
+    ('order_date', 'order__order_date'),
+    ('customer', 'order__user__username'),
+    ('order_total', 'order__total_amount'),
+    ('discount_percentage', 'order__discount_percentage'),
+    ('order_final_amount', 'order__final_amount'),
+    ('line_id', 'id'),
+    ('medicine_id', 'medicine_id'),
+    ('product_number', 'medicine__product_number'),
+    ('medicine', 'medicine__name'),
+    ('company', 'medicine__company_name'),
+    ('quantity', 'quantity'),
+    ('unit_price', 'price'),
+)
+HEADER = [name for name, _ in COLUMNS] + ['line_total']
+
+
+def date_bounds(start=None, end=None):
+    """``order_date`` filter for the days ``start`` to ``end`` (``date`` objects, inclusive)."""
+    bounds = {}
+    tz = timezone.get_current_timezone()
+    if start:
+        bounds['order__order_date__gte'] = datetime.combine(start, time.min, tzinfo=tz)
+    if end:
+        bounds['order__order_date__lt'] = datetime.combine(end + timedelta(days=1), time.min, tzinfo=tz)
+    return bounds
+
+
+def order_lines(start=None, end=None):
+    """Completed order lines in the range, as tuples in ``COLUMNS`` order, oldest first."""
+    return (
+        OrderItem.objects.filter(order__is_completed=True, **date_bounds(start, end))
+        .order_by('order__order_date', 'order_id', 'id')
+        .values_list(*(lookup for _, lookup in COLUMNS))
+    )
+
+
+def _records(start, end):
+    for row in order_lines(start, end).iterator(chunk_size=CHUNK_SIZE):
+        row = list(row)
+        row[1] = row[1].isoformat()
+        # quantity * unit price
+        row.append(row[-2] * row[-1])
+        yield row
+
+
+def csv_lines(start=None, end=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(HEADER)
+    for row in _records(start, end):
+        writer.writerow(row)
+        if buffer.tell() >= BUFFER_SIZE:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def jsonl_lines(start=None, end=None):
+    pieces, size = [], 0
+    for row in _records(start, end):
+        line = json.dumps(dict(zip(HEADER, row)), default=str) + '\n'
+        pieces.append(line)
+        size += len(line)
+        if size >= BUFFER_SIZE:
+            yield ''.join(pieces).encode()
+            pieces, size = [], 0
+    yield ''.join(pieces).encode()
+
+
+def gzipped(chunks):
+    """Compress a stream of bytes into a gzip stream on the fly."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export(fmt='csv', start=None, end=None, compress=False):
+    """Iterator of the export's bytes; raises ``ValueError`` for an unknown format."""
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown format {fmt!r}; use one of: {", ".join(FORMATS)}')
+    chunks = csv_lines(start, end) if fmt == 'csv' else jsonl_lines(start, end)
+    return gzipped(chunks) if compress else chunks
+
+
+async def aiterate(chunks):
+    """Async iterator over ``chunks``, each chunk produced in the request's sync thread."""
+    done = object()
+    step = sync_to_async(next)
+    while (chunk := await step(chunks, done)) is not done:
+        yield chunk
+
+
+def filename(fmt, start=None, end=None, compress=False):
+    span = '-'.join(day.isoformat() for day in (start, end) if day) or 'all'
+    return f'orders-{span}.{FORMATS[fmt][1]}' + ('.gz' if compress else '')
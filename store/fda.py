@@ -0,0 +1,226 @@
+"""
+Drug label lookups against the openFDA API.
+
+Label data is cached in the database (``DrugLabelCache``) keyed by the
+normalized medicine name, so every gunicorn worker shares the same entries
+and they survive restarts. Entries are served fresh until ``expires_at``,
+then served stale for up to ``FDA_LABEL_STALE_TTL`` seconds while they are
+refreshed in the background.
+
+Background lookups run on a per-process pool of ``FDA_MAX_CONNECTIONS``
+threads sharing one pooled ``requests`` session, and one lookup per name
+is in flight at a time. They outlive the request that started them: under
+WSGI each async view runs on its own event loop, which cancels whatever is
+left on it when the view returns, so the detail page and the label
+endpoint only wait up to ``FDA_LABEL_BUDGET`` for a lookup and leave it to
+fill the cache.
+
+``prefetch_labels`` fetches with ``afetch_label_info`` on an ``httpx``
+client of its own event loop (``async_client``) and closes it when done.
+"""
+import asyncio
+import logging
+import os
+import re
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from . import instrumentation
+from .models import DrugLabelCache
+
+logger = logging.getLogger(__name__)
+
+NO_INFO = "No information available from FDA database"
+GENERIC_SIDE_EFFECTS = "Common side effects may include nausea, headache, or dizziness. Consult your doctor for specific side effects."
+
+# normalized name: future of the lookup in flight
+_inflight = {}
+_inflight_lock = threading.Lock()
+# (pid, executor, session), rebuilt in a forked worker
+_pool = None
+_pool_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def default_label_info():
+    return {
+        "description": NO_INFO,
+        "uses": NO_INFO,
+        "side_effects": NO_INFO,
+        "precautions": NO_INFO,
+    }
+
+
+def normalize_name(name):
+    """Lower-case, collapse whitespace and strip punctuation from a medicine name."""
+    name = re.sub(r'[^\w\s-]', ' ', name or '').lower()
+    return ' '.join(name.split())
+
+
+def _first(result, *fields):
+    for field in fields:
+        if result.get(field):
+            return result[field][0]
+    return None
+
+
+def extract_label_info(result):
+    """Build the ``medicine_info`` dict from a single openFDA label result."""
+    info = default_label_info()
+    info["description"] = _first(result, "description", "purpose", "clinical_pharmacology") or NO_INFO
+    info["uses"] = _first(result, "indications_and_usage", "purpose") or NO_INFO
+    info["side_effects"] = _first(
+        result, "adverse_reactions", "warnings", "boxed_warning", "contraindications", "drug_interactions"
+    ) or GENERIC_SIDE_EFFECTS
+    info["precautions"] = _first(
+        result, "precautions", "warnings", "drug_interactions", "contraindications"
+    ) or NO_INFO
+    return info
+
+
+def label_url(name):
+    return f'{settings.FDA_API_URL}?search=openfda.brand_name:"{name}"&limit=1'
+
+
+def parse_label_response(status_code, data):
+    """Return ``(info, found)`` for an openFDA response."""
+    if status_code == 200 and data and data.get("results"):
+        return extract_label_info(data["results"][0]), True
+    return default_label_info(), False
+
+
+def _lookup_pool():
+    """The process's lookup threads and their shared HTTP session."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool[0] != os.getpid():
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=settings.FDA_MAX_CONNECTIONS)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            executor = ThreadPoolExecutor(max_workers=settings.FDA_MAX_CONNECTIONS, thread_name_prefix='fda')
+            _pool = (os.getpid(), executor, session)
+        return _pool[1], _pool[2]
+
+
+def fetch_label_info(name):
+    """Call openFDA for ``name`` and return ``(info, found)``."""
+    try:
+        with instrumentation.measure('http'):
+            response = _lookup_pool()[1].get(label_url(name), timeout=settings.FDA_TIMEOUT)
+        data = response.json() if response.status_code == 200 else None
+        if response.status_code != 200:
+            logger.info("FDA API returned status %s for %r", response.status_code, name)
+        return parse_label_response(response.status_code, data)
+    except (requests.RequestException, ValueError) as e:
+        logger.warning("Error calling FDA API for %r: %s", name, e)
+        return default_label_info(), False
+
+
+def _cache_defaults(info, found):
+    ttl = settings.FDA_LABEL_TTL if found else settings.FDA_LABEL_NEGATIVE_TTL
+    now = timezone.now()
+    return {
+        'info': info,
+        'found': found,
+        'fetched_at': now,
+        'expires_at': now + timedelta(seconds=ttl),
+    }
+
+
+def cache_state(entry):
+    """Return 'fresh', 'stale' or 'expired' for a cache entry (or None)."""
+    if entry is None:
+        return 'expired'
+    now = timezone.now()
+    if now < entry.expires_at:
+        return 'fresh'
+    if now < entry.expires_at + timedelta(seconds=settings.FDA_LABEL_STALE_TTL):
+        return 'stale'
+    return 'expired'
+
+
+def store_label_info(key, info, found):
+    DrugLabelCache.objects.update_or_create(key=key, defaults=_cache_defaults(info, found))
+
+
+def _refresh_in_background(key, name):
+    """Start refreshing ``key`` on the lookup threads, or join the refresh in flight; returns its future."""
+    def run():
+        info, found = fetch_label_info(name)
+        try:
+            store_label_info(key, info, found)
+        except Exception:
+            logger.exception("Could not cache the FDA label %r", key)
+        finally:
+            connection.close()
+            with _inflight_lock:
+                _inflight.pop(key, None)
+        return info
+
+    with _inflight_lock:
+        future = _inflight.get(key)
+        if future is None:
+            future = _inflight[key] = _lookup_pool()[0].submit(run)
+    return future
+
+
+def async_client():
+    """Return the pooled ``httpx.AsyncClient`` for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=settings.FDA_TIMEOUT,
+            limits=httpx.Limits(max_connections=settings.FDA_MAX_CONNECTIONS),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def afetch_label_info(name):
+    try:
+        with instrumentation.measure('http'):
+            response = await async_client().get(label_url(name))
+        data = response.json() if response.status_code == 200 else None
+        if response.status_code != 200:
+            logger.info("FDA API returned status %s for %r", response.status_code, name)
+        return parse_label_response(response.status_code, data)
+    except (httpx.HTTPError, ValueError) as e:
+        logger.warning("Error calling FDA API for %r: %s", name, e)
+        return default_label_info(), False
+
+
+async def aget_label_info_within(name, budget):
+    """Return ``(info, pending)`` without waiting longer than ``budget`` seconds.
+
+    If the budget runs out, placeholder info is returned with ``pending`` set
+    and the lookup carries on in the background to fill the cache.
+    """
+    key = normalize_name(name)
+    if not key:
+        return default_label_info(), False
+
+    entry = await DrugLabelCache.objects.filter(key=key).afirst()
+    state = cache_state(entry)
+    if state == 'stale':
+        _refresh_in_background(key, name)
+    if state != 'expired':
+        return entry.info, False
+
+    future = _refresh_in_background(key, name)
+    # Waits on a thread of its own, so the request's event loop never holds the lookup
+    with instrumentation.measure('http'):
+        done, _ = await sync_to_async(wait, thread_sensitive=False)([future], timeout=budget)
+    if done:
+        return future.result(), False
+    return default_label_info(), True
@@ -0,0 +1,181 @@
+"""
+Reorder suggestions from sales velocity.
+
+The daily sales history comes from the ``DailyMedicineSales`` rollups
+(see rollups.py): one query returns every ``(medicine, day, units)`` row
+of the history window, which is loaded into NumPy arrays a chunk at a
+time. Everything after that is a handful of vectorized operations over
+the whole catalog; there are no per-medicine queries or loops, and the
+history is never expanded into a dense SKU x day matrix (days without
+sales have no rollup row and simply count as zero).
+
+For every medicine:
+
+* ``demand``: expected units per day, either an exponentially weighted
+  average of daily sales (``ewma``, weight ``alpha * (1 - alpha) ** age``)
+  or a simple moving average over the last ``window`` days (``sma``);
+* ``safety_stock``: ``z * std * sqrt(lead_time)``, with ``std`` the
+  standard deviation of daily sales over the last ``window`` days;
+* ``reorder_point``: ``demand * lead_time + safety_stock``;
+* ``days_of_cover``: current stock / demand (infinite with no demand);
+* ``reorder_quantity``: once stock is at or below the reorder point,
+  enough to cover ``lead_time + cover_days`` days of demand plus the
+  safety stock.
+
+Days are whole days in the site's time zone; the forecast uses complete
+days only, so today's sales so far are left out.
+"""
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+import numpy as np
+from django.db import connection
+from django.db.models import CharField
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .models import DailyMedicineSales, Medicine
+
+METHODS = ('ewma', 'sma')
+HISTORY_DAYS = 730
+WINDOW = 28
+ALPHA = 0.1
+LEAD_TIME = 7
+COVER_DAYS = 30
+# 95% cycle service level
+SERVICE_Z = 1.65
+FETCH_SIZE = 100_000
+
+
+@dataclass
+class Forecast:
+    as_of: date
+    ids: np.ndarray
+    stock: np.ndarray
+    demand: np.ndarray
+    std: np.ndarray
+    safety_stock: np.ndarray
+    reorder_point: np.ndarray
+    days_of_cover: np.ndarray
+    reorder_quantity: np.ndarray
+
+    def __len__(self):
+        return len(self.ids)
+
+    def suggestions(self, limit=None):
+        """Indexes of the medicines to reorder, the soonest to run out first."""
+        needed = np.flatnonzero(self.reorder_quantity > 0)
+        order = needed[np.lexsort((self.ids[needed], self.days_of_cover[needed]))]
+        return order[:limit] if limit else order
+
+    def at_risk(self, within=LEAD_TIME):
+        """How many medicines will run out within ``within`` days."""
+        return int(np.count_nonzero(self.days_of_cover < within))
+
+    def rows(self, indexes):
+        """Dicts for the medicines at ``indexes``, with names from one query."""
+        medicines = Medicine.objects.only('id', 'name', 'company_name', 'product_number').in_bulk(
+            self.ids[indexes].tolist()
+        )
+        rows = []
+        for i in indexes:
+            medicine = medicines.get(int(self.ids[i]))
+            if medicine is None:
+                continue
+            cover = float(self.days_of_cover[i])
+            rows.append({
+                'id': medicine.id,
+                'name': medicine.name,
+                'company_name': medicine.company_name,
+                'product_number': medicine.product_number,
+                'stock': int(self.stock[i]),
+                'demand': round(float(self.demand[i]), 2),
+                'safety_stock': int(np.ceil(self.safety_stock[i])),
+                'reorder_point': int(np.ceil(self.reorder_point[i])),
+                'days_of_cover': round(cover, 1) if np.isfinite(cover) else None,
+                'stockout_date': self.as_of + timedelta(days=int(cover)) if np.isfinite(cover) else None,
+                'reorder_quantity': int(self.reorder_quantity[i]),
+            })
+        return rows
+
+
+def load_catalog():
+    """``(ids, stock)`` arrays for every medicine, ordered by id."""
+    rows = Medicine.objects.order_by('pk').values_list('pk', 'quantity')
+    if not rows:
+        return np.empty(0, np.int64), np.empty(0, np.float64)
+    ids, stock = zip(*rows)
+    return np.array(ids, np.int64), np.array(stock, np.float64)
+
+
+def load_history(start, end):
+    """``(medicine_ids, ages, units)`` arrays of the sales rollups from ``start`` to ``end``.
+
+    ``ages`` count days back from ``end`` (0 for ``end`` itself). One query,
+    read in chunks of ``FETCH_SIZE`` rows.
+    """
+    # Dates are read as text and mapped through a dict: parsing millions of
+    # date objects took longer than the forecast itself.
+    queryset = (
+        DailyMedicineSales.objects.filter(date__gte=start, date__lte=end, units__gt=0)
+        .values_list('medicine_id', Cast('date', CharField()), 'units')
+    )
+    age_of = {(end - timedelta(days=age)).isoformat(): age for age in range((end - start).days + 1)}
+    ids, ages, units = [], [], []
+    with connection.cursor() as cursor:
+        cursor.execute(*queryset.query.sql_with_params())
+        while rows := cursor.fetchmany(FETCH_SIZE):
+            chunk_ids, chunk_dates, chunk_units = zip(*rows)
+            ids.append(np.array(chunk_ids, np.int64))
+            ages.append(np.fromiter(map(age_of.__getitem__, chunk_dates), np.int32, len(rows)))
+            units.append(np.array(chunk_units, np.float64))
+    if not ids:
+        return np.empty(0, np.int64), np.empty(0, np.int32), np.empty(0, np.float64)
+    return np.concatenate(ids), np.concatenate(ages), np.concatenate(units)
+
+
+def compute(ids, stock, medicine_ids, ages, units, method='ewma', window=WINDOW, alpha=ALPHA,
+            lead_time=LEAD_TIME, cover_days=COVER_DAYS, z=SERVICE_Z):
+    """The vectorized forecast over catalog and history arrays.
+
+    Returns ``(demand, std, safety_stock, reorder_point, days_of_cover, reorder_quantity)``.
+    """
+    if method not in METHODS:
+        raise ValueError(f'Unknown method {method!r}; use one of: {", ".join(METHODS)}')
+    n = len(ids)
+    rows = np.searchsorted(ids, medicine_ids)
+    # history of medicines deleted since the catalog was read
+    known = rows < n
+    known[known] &= ids[rows[known]] == medicine_ids[known]
+    rows, ages, units = rows[known], ages[known], units[known]
+
+    recent = ages < window
+    recent_rows, recent_units = rows[recent], units[recent]
+    mean = np.bincount(recent_rows, weights=recent_units, minlength=n) / window
+    mean_square = np.bincount(recent_rows, weights=recent_units ** 2, minlength=n) / window
+    std = np.sqrt(np.maximum(mean_square - mean ** 2, 0))
+    if method == 'sma':
+        demand = mean
+    else:
+        demand = np.bincount(rows, weights=units * alpha * (1 - alpha) ** ages, minlength=n)
+
+    safety_stock = z * std * np.sqrt(lead_time)
+    reorder_point = demand * lead_time + safety_stock
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_of_cover = np.where(demand > 0, stock / demand, np.inf)
+    target = demand * (lead_time + cover_days) + safety_stock
+    reorder_quantity = np.where((demand > 0) & (stock <= reorder_point), np.ceil(target - stock), 0).clip(min=0)
+    return demand, std, safety_stock, reorder_point, days_of_cover, reorder_quantity.astype(np.int64)
+
+
+def forecast(method='ewma', window=WINDOW, alpha=ALPHA, lead_time=LEAD_TIME, cover_days=COVER_DAYS,
+             z=SERVICE_Z, history_days=HISTORY_DAYS, as_of=None):
+    """Forecast the whole catalog from the sales up to the day before ``as_of`` (default today)."""
+    as_of = as_of or timezone.localdate()
+    end = as_of - timedelta(days=1)
+    ids, stock = load_catalog()
+    history = load_history(end - timedelta(days=history_days - 1), end)
+    return Forecast(as_of, ids, stock, *compute(
+        ids, stock, *history, method=method, window=window, alpha=alpha,
+        lead_time=lead_time, cover_days=cover_days, z=z,
+    ))
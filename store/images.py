@@ -0,0 +1,156 @@
+"""
+Resized WebP/JPEG derivatives of ``Medicine.image``.
+
+Uploaded originals are often multi-megabyte phone photos, so every page
+that shows a product serves a derivative instead:
+
+* ``thumb``: a 200x200 square crop, for the cart, the admin tables and
+  ``MedicineAdmin.image_preview``;
+* ``medium``: fitted inside 640x640, for product cards and the detail page.
+
+Each is written as WebP and JPEG under ``medicines/derived/`` with a name
+derived from the SHA-256 of the original (``<hash>-thumb.webp``), so the
+files are immutable and identical uploads share them. EXIF (including GPS
+position), ICC profiles and comments are not copied to the derivatives;
+the EXIF orientation is applied to the pixels first.
+
+Uploads are processed by ``Medicine.save`` (so the product form, the
+JSON API and the admin all get derivatives), and ``manage.py
+build_image_variants`` backfills existing images. ``render_variants`` is
+a pure bytes-in/bytes-out function so the backfill can run it in worker
+processes; ``store_variants`` writes the files through the default
+storage and returns the dict kept in ``Medicine.image_variants``.
+"""
+import hashlib
+import io
+import logging
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+DERIVED_DIR = 'medicines/derived'
+
+# name: (width, height, crop to exactly this size)
+VARIANTS = {
+    'thumb': (200, 200, True),
+    'medium': (640, 640, False),
+}
+
+# extension: (Pillow format, save options)
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def _load(data):
+    image = Image.open(io.BytesIO(data))
+    if image.format == 'JPEG':
+        # Let libjpeg decode at a reduced scale; big photos load several times faster.
+        largest = max(width for width, _, _ in VARIANTS.values())
+        image.draft('RGB', (largest * 2, largest * 2))
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render_variants(data):
+    """Render every variant of the original image ``data``.
+
+    Returns ``(hash, {variant: {'width', 'height', ext: bytes, ...}})``.
+    """
+    original = _load(data)
+    rendered = {}
+    for name, (width, height, crop) in VARIANTS.items():
+        if crop:
+            image = ImageOps.fit(original, (width, height), Image.Resampling.LANCZOS)
+        else:
+            image = original.copy()
+            image.thumbnail((width, height), Image.Resampling.LANCZOS)
+        # A fresh image carries no info dict, so nothing but pixels is written.
+        clean = Image.new('RGB', image.size)
+        clean.paste(image)
+        variant = {'width': clean.width, 'height': clean.height}
+        for ext, (fmt, options) in FORMATS.items():
+            buffer = io.BytesIO()
+            clean.save(buffer, fmt, **options)
+            variant[ext] = buffer.getvalue()
+        rendered[name] = variant
+    return content_hash(data), rendered
+
+
+def variant_name(digest, variant, ext):
+    return f'{DERIVED_DIR}/{digest}-{variant}.{ext}'
+
+
+def store_variants(source_name, digest, rendered, storage=default_storage):
+    """Write rendered variants to ``storage``; returns the ``image_variants`` dict."""
+    variants = {'source': source_name, 'hash': digest}
+    for name, variant in rendered.items():
+        stored = {'width': variant['width'], 'height': variant['height']}
+        for ext in FORMATS:
+            path = variant_name(digest, name, ext)
+            if not storage.exists(path):
+                storage.save(path, ContentFile(variant[ext]))
+            stored[ext] = path
+        variants[name] = stored
+    return variants
+
+
+def build_variants(image_file, source_name):
+    """Derivatives for an uploaded or stored image file."""
+    image_file.seek(0)
+    data = image_file.read()
+    image_file.seek(0)
+    return store_variants(source_name, *render_variants(data))
+
+
+def process_upload(medicine):
+    """Store a freshly uploaded ``medicine.image`` and build its derivatives.
+
+    Called from ``Medicine.save`` before the row is written. The original is
+    committed to storage first so the derivatives are recorded against its
+    final name; a file Pillow can't process keeps the original only.
+    """
+    image = medicine.image
+    image.save(image.name, image.file, save=False)
+    try:
+        medicine.image_variants = build_variants(image, image.name)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        logger.exception('Could not build image variants for %s', image.name)
+        medicine.image_variants = {}
+
+
+def variants_for(medicine):
+    """The medicine's variants, or ``{}`` if they're missing or out of date."""
+    variants = medicine.image_variants or {}
+    if not medicine.image or variants.get('source') != medicine.image.name:
+        return {}
+    return variants
+
+
+def variant_url(medicine, variant, ext='jpg'):
+    """URL of a derivative, falling back to the original image."""
+    variants = variants_for(medicine)
+    if variant in variants:
+        return default_storage.url(variants[variant][ext])
+    return medicine.image.url if medicine.image else ''
+
+
+def srcset(medicine, ext):
+    variants = variants_for(medicine)
+    return ', '.join(
+        f'{default_storage.url(variants[name][ext])} {variants[name]["width"]}w'
+        for name in VARIANTS if name in variants
+    )
@@ -0,0 +1,248 @@
+"""
+Bulk catalog import from distributor price lists (CSV or XLSX).
+
+Used by ``manage.py import_medicines`` and the ``api_import_medicines``
+endpoint. The file is read a row at a time (CSV through ``csv.reader``,
+XLSX through openpyxl's read-only mode), so memory stays flat however
+long the list is. Columns are matched by header, case-insensitively::
+
+    product_number, name, components, company_name, power, quantity, price[, image]
+
+Each row is validated with the field rules of ``MedicineForm`` (required
+fields, lengths, non-negative quantity, price of at least 0.01 with two
+decimal places). Valid rows are upserted on ``product_number`` in chunks
+with ``bulk_create(update_conflicts=True)``: new products are created,
+existing ones get the file's values, and invalid rows are skipped and
+reported with their line number. A later row for the same product number
+wins.
+
+The optional ``image`` column names a file in the images zip. Each image
+is stored and resized once, however many rows use it. Without a zip the
+column is ignored and existing images are kept; new products then show
+the "no image" placeholder until one is uploaded.
+"""
+import csv
+import io
+import os
+import zipfile
+from dataclasses import dataclass, field
+
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image
+
+from . import catalog_cache, images, search_index
+from .forms import MedicineForm
+from .models import Medicine
+
+COLUMNS = ('product_number', 'name', 'components', 'company_name', 'power', 'quantity', 'price')
+CHUNK_SIZE = 1000
+MAX_KEPT_ERRORS = 1000
+MAX_IMAGE_SIZE = 20 * 1024 * 1024
+# Fields the ingredient/trigram index is built from
+SEARCH_FIELDS = ('name', 'components', 'power')
+
+
+class ImportFileError(ValueError):
+    """The file as a whole can't be imported (wrong format, missing columns)."""
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    error_rows: int = 0
+    # (line, product_number, field, message); the first MAX_KEPT_ERRORS only
+    errors: list = field(default_factory=list)
+    errors_truncated: bool = False
+
+    def summary(self):
+        return (f'{self.rows} row(s): {self.created} created, {self.updated} updated, '
+                f'{self.error_rows} rejected')
+
+
+def _column(name):
+    return str(name or '').strip().lower().replace(' ', '_')
+
+
+def _records(rows):
+    """Turn raw rows (header first) into ``(line, {column: value})`` pairs."""
+    header = next(rows, None)
+    if header is None:
+        raise ImportFileError('The file is empty')
+    columns = [_column(name) for name in header]
+    missing = [name for name in COLUMNS if name not in columns]
+    if missing:
+        raise ImportFileError(f'Missing column(s): {", ".join(missing)}')
+    for line, values in enumerate(rows, start=2):
+        if all(value is None or str(value).strip() == '' for value in values):
+            continue
+        yield line, dict(zip(columns, values))
+
+
+def _csv_rows(fileobj):
+    text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    try:
+        yield from csv.reader(text)
+    except UnicodeDecodeError as e:
+        raise ImportFileError(f'The CSV file is not UTF-8: {e}') from e
+    finally:
+        # leave the underlying file open for the caller
+        text.detach()
+
+
+def _xlsx_rows(fileobj):
+    from openpyxl import load_workbook
+
+    try:
+        workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, KeyError, OSError) as e:
+        raise ImportFileError(f'Not a readable .xlsx file: {e}') from e
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def read_records(fileobj, filename):
+    """Stream ``(line, values)`` from a binary CSV or XLSX file object."""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.csv':
+        return _records(_csv_rows(fileobj))
+    if extension == '.xlsx':
+        return _records(_xlsx_rows(fileobj))
+    raise ImportFileError(f'Upload a .csv or .xlsx file, not {filename!r}')
+
+
+def clean_row(values):
+    """Validate one row with ``MedicineForm``'s field rules: ``(cleaned, [(field, message)])``."""
+    cleaned, errors = {}, []
+    for name in COLUMNS:
+        value = values.get(name)
+        try:
+            value = MedicineForm.base_fields[name].clean(value)
+            Medicine._meta.get_field(name).run_validators(value)
+        except ValidationError as e:
+            errors.extend((name, message) for message in e.messages)
+        else:
+            cleaned[name] = value
+    return cleaned, errors
+
+
+class ImageArchive:
+    """Product images in a zip, looked up by file name (without folders, case-insensitively)."""
+
+    def __init__(self, fileobj):
+        try:
+            self.zip = zipfile.ZipFile(fileobj)
+        except zipfile.BadZipFile as e:
+            raise ImportFileError(f'The images file is not a zip: {e}') from e
+        self.members = {
+            os.path.basename(info.filename).lower(): info
+            for info in self.zip.infolist() if not info.is_dir()
+        }
+        self.stored = {}
+
+    def get(self, filename):
+        """``(image name, image_variants)`` for ``filename``, stored on first use.
+
+        Raises ``ValueError`` if the image is missing or unusable.
+        """
+        key = os.path.basename(filename).lower()
+        if key not in self.stored:
+            info = self.members.get(key)
+            if info is None:
+                raise ValueError(f'{filename} is not in the images zip')
+            if info.file_size > MAX_IMAGE_SIZE:
+                raise ValueError(f'{filename} is larger than {MAX_IMAGE_SIZE // (1024 * 1024)} MB')
+            data = self.zip.read(info)
+            try:
+                digest, rendered = images.render_variants(data)
+            except (OSError, ValueError, Image.DecompressionBombError) as e:
+                raise ValueError(f'{filename} is not a usable image') from e
+            image_field = Medicine._meta.get_field('image')
+            name = image_field.storage.save(
+                image_field.generate_filename(None, os.path.basename(info.filename)), ContentFile(data)
+            )
+            self.stored[key] = (name, images.store_variants(name, digest, rendered, storage=image_field.storage))
+        return self.stored[key]
+
+
+def _write_chunk(chunk, result):
+    """Upsert one chunk of cleaned rows keyed by product number."""
+    plain, with_image = [], []
+    for values in chunk.values():
+        (with_image if 'image' in values else plain).append(Medicine(**values))
+
+    update_fields = [name for name in COLUMNS if name != 'product_number']
+    with transaction.atomic():
+        existing = {
+            row[0]: row[1:] for row in Medicine.objects.filter(product_number__in=list(chunk))
+            .values_list('product_number', 'pk', *SEARCH_FIELDS)
+        }
+        for medicines, extra in ((plain, []), (with_image, ['image', 'image_variants'])):
+            if medicines:
+                Medicine.objects.bulk_create(
+                    medicines, update_conflicts=True, unique_fields=['product_number'],
+                    update_fields=update_fields + extra,
+                )
+        updated = [pk for pk, *_ in existing.values()]
+        if updated:
+            Medicine.objects.filter(pk__in=updated).update(version=F('version') + 1, updated_at=timezone.now())
+        # bulk_create skips post_save, so refresh what the signals would have,
+        # for new medicines and those whose indexed text changed
+        search_index.index_medicines(
+            m for m in plain + with_image
+            if existing.get(m.product_number, ())[1:] != tuple(getattr(m, name) for name in SEARCH_FIELDS)
+        )
+        transaction.on_commit(catalog_cache.invalidate)
+
+    result.updated += len(existing)
+    result.created += len(chunk) - len(existing)
+
+
+def import_catalog(records, archive=None, chunk_size=CHUNK_SIZE, report=None, on_chunk=None):
+    """Validate and upsert ``records`` from ``read_records``; returns an ``ImportResult``.
+
+    Every rejected row is passed to ``report(line, product_number, field, message)``
+    if given; ``on_chunk(result)`` is called after each chunk is written.
+    """
+    result = ImportResult()
+    chunk = {}
+    for line, values in records:
+        result.rows += 1
+        cleaned, errors = clean_row(values)
+        image = str(values.get('image') or '').strip()
+        if archive is not None and image and not errors:
+            try:
+                cleaned['image'], cleaned['image_variants'] = archive.get(image)
+            except ValueError as e:
+                errors.append(('image', str(e)))
+
+        if errors:
+            result.error_rows += 1
+            product_number = str(values.get('product_number') or '').strip()
+            for name, message in errors:
+                if len(result.errors) < MAX_KEPT_ERRORS:
+                    result.errors.append((line, product_number, name, message))
+                else:
+                    result.errors_truncated = True
+                if report:
+                    report(line, product_number, name, message)
+            continue
+
+        chunk[cleaned['product_number']] = cleaned
+        if len(chunk) >= chunk_size:
+            _write_chunk(chunk, result)
+            chunk = {}
+            if on_chunk:
+                on_chunk(result)
+    if chunk:
+        _write_chunk(chunk, result)
+        if on_chunk:
+            on_chunk(result)
+    return result
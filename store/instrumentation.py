@@ -0,0 +1,219 @@
+"""
+Per-request performance instrumentation.
+
+``PerformanceMiddleware`` (middleware.py) opens a ``RequestTimings`` for
+each request in a context variable, and code anywhere in the request,
+including ``sync_to_async`` threads, adds to it:
+
+* database: an execute wrapper on each connection counts queries and
+  their time per SQL statement, so repeated statements (N+1) stand out;
+* templates: the ``DjangoTemplates`` backend below times each render;
+* outbound HTTP: ``measure('http')`` around the call, as fda.py does.
+
+When the response is ready the middleware adds a ``Server-Timing``
+header, logs requests slower than ``PERF_SLOW_REQUEST_MS`` to the
+``store.perf`` logger as one JSON object with the most repeated SQL, and
+adds the request to per-view histograms (``snapshot()``, served to staff
+by ``performance_stats``). Histograms are kept per process.
+
+With ``PERF_INSTRUMENTATION`` off the middleware takes itself out of the
+stack (``MiddlewareNotUsed``), no execute wrapper is installed, and the
+template and HTTP hooks cost one context variable lookup.
+"""
+import contextvars
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends import django as django_backend
+
+logger = logging.getLogger('store.perf')
+
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+TOP_SQL = 5
+
+_current = contextvars.ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.spans = {}
+        # SQL text: [executions, seconds]
+        self.statements = {}
+        self._lock = threading.Lock()
+
+    def add_query(self, sql, elapsed):
+        with self._lock:
+            self.queries += 1
+            self.db += elapsed
+            stats = self.statements.setdefault(sql, [0, 0.0])
+            stats[0] += 1
+            stats[1] += elapsed
+
+    def add_span(self, name, elapsed):
+        with self._lock:
+            self.spans[name] = self.spans.get(name, 0.0) + elapsed
+
+    def repeated_sql(self, top=TOP_SQL):
+        """The statements run more than once, most often first."""
+        repeated = sorted(
+            ((sql, count, seconds) for sql, (count, seconds) in self.statements.items() if count > 1),
+            key=lambda row: (-row[1], -row[2]),
+        )
+        return [
+            {'sql': sql[:500], 'count': count, 'ms': round(seconds * 1000, 2)}
+            for sql, count, seconds in repeated[:top]
+        ]
+
+
+def _record_query(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add_query(sql, time.perf_counter() - start)
+
+
+def install_query_recorder(connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def enable():
+    """Record the queries of every connection opened from now on."""
+    connection_created.connect(install_query_recorder, dispatch_uid='store.perf')
+
+
+def start():
+    """Begin timing a request; returns the token for ``stop``."""
+    # Connections opened before instrumentation was enabled
+    for connection in connections.all(initialized_only=True):
+        install_query_recorder(connection)
+    return _current.set(RequestTimings())
+
+
+def stop(token):
+    timings = _current.get()
+    _current.reset(token)
+    return timings
+
+
+@contextmanager
+def measure(name):
+    """Add the time spent in the block to the current request's ``name`` span."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add_span(name, time.perf_counter() - start_time)
+
+
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        with measure('template'):
+            return super().render(context, request)
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """The stock Django template backend, with render time recorded per request."""
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
+
+
+def server_timing(timings, total):
+    parts = [f'db;dur={timings.db * 1000:.1f};desc="{timings.queries} queries"']
+    parts += [f'{name};dur={seconds * 1000:.1f}' for name, seconds in sorted(timings.spans.items())]
+    parts.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(parts)
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unresolved'
+
+
+def finish(request, response, timings):
+    """Report a finished request: header, slow log and histograms."""
+    total = time.perf_counter() - timings.start
+    view = _view_name(request)
+    if settings.PERF_SERVER_TIMING:
+        response.headers['Server-Timing'] = server_timing(timings, total)
+
+    total_ms = total * 1000
+    if total_ms >= settings.PERF_SLOW_REQUEST_MS:
+        logger.warning(json.dumps({
+            'event': 'slow_request',
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'total_ms': round(total_ms, 1),
+            'db_ms': round(timings.db * 1000, 1),
+            'queries': timings.queries,
+            **{f'{name}_ms': round(seconds * 1000, 1) for name, seconds in timings.spans.items()},
+            'repeated_sql': timings.repeated_sql(),
+        }))
+
+    bucket = next((i for i, limit in enumerate(BUCKETS_MS) if total_ms <= limit), len(BUCKETS_MS))
+    with _stats_lock:
+        stats = _stats.get(view)
+        if stats is None:
+            stats = _stats[view] = {
+                'count': 0, 'total_ms': 0.0, 'db_ms': 0.0, 'queries': 0, 'max_ms': 0.0,
+                'spans_ms': {}, 'buckets': [0] * (len(BUCKETS_MS) + 1),
+            }
+        stats['count'] += 1
+        stats['total_ms'] += total_ms
+        stats['db_ms'] += timings.db * 1000
+        stats['queries'] += timings.queries
+        stats['max_ms'] = max(stats['max_ms'], total_ms)
+        for name, seconds in timings.spans.items():
+            stats['spans_ms'][name] = stats['spans_ms'].get(name, 0.0) + seconds * 1000
+        stats['buckets'][bucket] += 1
+    return response
+
+
+def snapshot():
+    """Per-view request counts, means and latency histograms of this process."""
+    labels = [f'<={limit}ms' for limit in BUCKETS_MS] + [f'>{BUCKETS_MS[-1]}ms']
+    with _stats_lock:
+        return {
+            view: {
+                'count': stats['count'],
+                'mean_ms': round(stats['total_ms'] / stats['count'], 2),
+                'max_ms': round(stats['max_ms'], 2),
+                'mean_db_ms': round(stats['db_ms'] / stats['count'], 2),
+                'mean_queries': round(stats['queries'] / stats['count'], 2),
+                **{f'mean_{name}_ms': round(ms / stats['count'], 2) for name, ms in stats['spans_ms'].items()},
+                'histogram': dict(zip(labels, stats['buckets'])),
+            }
+            for view, stats in sorted(_stats.items())
+        }
+
+
+def reset():
+    with _stats_lock:
+        _stats.clear()
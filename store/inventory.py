@@ -0,0 +1,203 @@
+"""
+Batch inventory updates for stock-takes and price revisions.
+
+A batch is a list of patches such as::
+
+    {"product_number": "PC-12345", "quantity": 40, "price": "12.50", "version": 7}
+
+Each patch names its medicine by ``id`` or ``product_number`` and may carry
+the ``version`` it was read at (``Medicine.version``, the optimistic
+concurrency token). All patches are validated before anything is written;
+then every row's version is bumped, the bumped versions are compared with
+the tokens under the write lock, and the new values are written with
+``bulk_update``, all in one transaction. Any invalid patch or stale token
+fails the whole batch.
+
+Patches are grouped by the set of fields they change and each group is
+written with only those fields, so a patch never rewrites a column it
+didn't mention. Quantities are absolute; checkout's stock decrements do
+not bump the version.
+"""
+from collections import defaultdict
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F, IntegerField
+from django.utils import timezone
+
+from . import catalog_cache, search_index
+from .models import Medicine
+
+UPDATABLE_FIELDS = ('name', 'components', 'company_name', 'power', 'quantity', 'price')
+IDENTIFIERS = ('id', 'product_number')
+MAX_BATCH_SIZE = 5000
+CHUNK_SIZE = 500
+
+
+@dataclass
+class PatchResult:
+    index: int
+    medicine: Medicine = None
+    fields: dict = field(default_factory=dict)
+    version: int = None
+    errors: list = field(default_factory=list)
+    conflict: bool = False
+
+    def as_dict(self):
+        data = {'index': self.index}
+        if self.medicine is not None:
+            data.update(id=self.medicine.pk, product_number=self.medicine.product_number, version=self.medicine.version)
+        if self.errors:
+            data.update(status='error', errors=self.errors)
+        elif self.conflict:
+            data.update(status='conflict', errors=[f'Medicine changed since version {self.version}'])
+        else:
+            data['status'] = 'updated'
+        return data
+
+
+@dataclass
+class BatchResult:
+    results: list
+    applied: bool = False
+
+    @property
+    def conflicts(self):
+        return [r for r in self.results if r.conflict]
+
+    @property
+    def errors(self):
+        return [r for r in self.results if r.errors]
+
+
+class _Conflict(Exception):
+    pass
+
+
+def _lookup(patches):
+    """Fetch the medicines the patches refer to: ``(by_id, by_product_number)``."""
+    ids = {p['id'] for p in patches if isinstance(p, dict) and _is_id(p.get('id'))}
+    numbers = {p['product_number'] for p in patches
+               if isinstance(p, dict) and 'id' not in p and isinstance(p.get('product_number'), str)}
+    by_id = Medicine.objects.in_bulk(ids) if ids else {}
+    by_number = Medicine.objects.in_bulk(numbers, field_name='product_number') if numbers else {}
+    return by_id, by_number
+
+
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _whole_number(value):
+    """False for values ``IntegerField.clean`` would quietly truncate, like 40.5 (or take, like ``True``)."""
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, (float, Decimal)):
+        try:
+            return value == int(value)
+        except (ValueError, OverflowError):  # NaN, infinity
+            return False
+    return True
+
+
+def validate(patches):
+    """Resolve and validate every patch; returns a list of ``PatchResult``."""
+    by_id, by_number = _lookup(patches)
+    results, seen = [], set()
+    for index, patch in enumerate(patches):
+        result = PatchResult(index)
+        results.append(result)
+        if not isinstance(patch, dict):
+            result.errors.append('Patch must be an object')
+            continue
+
+        unknown = set(patch) - set(UPDATABLE_FIELDS) - set(IDENTIFIERS) - {'version'}
+        if unknown:
+            result.errors.append(f'Unknown fields: {", ".join(sorted(unknown))}')
+        if 'id' in patch:
+            if not _is_id(patch['id']):
+                result.errors.append('id must be an integer')
+                continue
+            result.medicine = by_id.get(patch['id'])
+        elif 'product_number' in patch:
+            if not isinstance(patch['product_number'], str):
+                result.errors.append('product_number must be a string')
+                continue
+            result.medicine = by_number.get(patch['product_number'])
+        else:
+            result.errors.append('Patch needs an id or product_number')
+            continue
+        if result.medicine is None:
+            result.errors.append('Medicine not found')
+            continue
+        if result.medicine.pk in seen:
+            result.errors.append('Medicine appears more than once in the batch')
+        seen.add(result.medicine.pk)
+
+        version = patch.get('version')
+        if version is not None and (not isinstance(version, int) or isinstance(version, bool)):
+            result.errors.append('version must be an integer')
+        result.version = version
+
+        for name in UPDATABLE_FIELDS:
+            if name not in patch:
+                continue
+            model_field = Medicine._meta.get_field(name)
+            if isinstance(model_field, IntegerField) and not _whole_number(patch[name]):
+                result.errors.append(f'{name}: must be a whole number')
+                continue
+            try:
+                result.fields[name] = model_field.clean(patch[name], result.medicine)
+            except ValidationError as e:
+                result.errors.extend(f'{name}: {message}' for message in e.messages)
+        if not result.fields and not result.errors:
+            result.errors.append(f'Nothing to update; patch one of: {", ".join(UPDATABLE_FIELDS)}')
+    return results
+
+
+def apply_patches(patches):
+    """Validate and apply a batch of patches; returns a ``BatchResult``."""
+    result = BatchResult(validate(patches))
+    if result.errors:
+        return result
+
+    ids = [r.medicine.pk for r in result.results]
+    try:
+        with transaction.atomic():
+            # Bumping first takes the write lock, so the comparison below can't race another batch.
+            now = timezone.now()
+            for start in range(0, len(ids), CHUNK_SIZE):
+                Medicine.objects.filter(pk__in=ids[start:start + CHUNK_SIZE]).update(
+                    version=F('version') + 1, updated_at=now,
+                )
+            current = {}
+            for start in range(0, len(ids), CHUNK_SIZE):
+                current.update(Medicine.objects.filter(pk__in=ids[start:start + CHUNK_SIZE]).values_list('pk', 'version'))
+            for r in result.results:
+                r.conflict = r.version is not None and current[r.medicine.pk] != r.version + 1
+            if result.conflicts:
+                raise _Conflict
+
+            groups = defaultdict(list)
+            for r in result.results:
+                for name, value in r.fields.items():
+                    setattr(r.medicine, name, value)
+                r.medicine.version = current[r.medicine.pk]
+                groups[tuple(sorted(r.fields))].append(r.medicine)
+            for fields, medicines in groups.items():
+                Medicine.objects.bulk_update(medicines, fields, batch_size=CHUNK_SIZE)
+
+            # bulk_update skips post_save, so refresh what the signals would have
+            reindex = [r.medicine for r in result.results if set(r.fields) & {'name', 'components', 'power'}]
+            if reindex:
+                search_index.index_medicines(reindex)
+            transaction.on_commit(catalog_cache.invalidate)
+    except _Conflict:
+        for r in result.results:
+            r.medicine.version = current[r.medicine.pk] - 1
+        return result
+
+    result.applied = True
+    return result
@@ -0,0 +1,269 @@
+"""
+Background jobs, queued in the database: no broker to run.
+
+Decorate a module-level function with ``@job`` and call
+``func.delay(*args, **kwargs)`` to have a worker (``manage.py run_jobs``)
+run it; calling ``func(...)`` still runs it inline. Arguments are stored
+as JSON, so pass ids rather than model instances.
+
+``delay`` inserts a ``Job`` row on the primary in the caller's
+transaction: a job queued inside ``atomic`` becomes visible to workers
+when the transaction commits and disappears with it on a rollback, so a
+job never runs for an order that wasn't placed and is never lost for one
+that was. Queueing costs one INSERT however much work the job does.
+
+Workers claim due jobs, oldest first, with one ``UPDATE`` that only
+matches rows still queued, so no job is claimed twice, and run each job
+outside any transaction with its own replica pin (see routers.py). A job
+that raises is retried until it has run ``max_attempts`` times, after
+``backoff`` seconds and twice as long before each further attempt (with
+jitter, capped at ``JOBS_RETRY_BACKOFF_MAX``); then it stays ``failed``
+with its traceback. A job still running after ``JOBS_LOCK_TIMEOUT`` is
+presumed lost with its worker and queued again, so jobs run at least
+once: write them so a second run does no harm.
+
+Finished jobs are kept for ``JOBS_KEEP_DONE`` seconds for ``stats()``
+(queue depth, how late the oldest due job is, throughput and run times
+per job), which staff can read from ``job_stats``.
+"""
+import functools
+import json
+import logging
+import os
+import random
+import socket
+import time
+import traceback
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count, F, Min
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import routers
+from .models import Job
+
+logger = logging.getLogger('store.jobs')
+
+# Seconds between a worker's checks for lost and old jobs
+MAINTENANCE_INTERVAL = 60
+
+_registry = {}
+
+
+class Task:
+    """A ``@job`` function: call it to run it now, ``delay`` it to run it in a worker."""
+
+    def __init__(self, func, max_attempts=None, backoff=None):
+        functools.update_wrapper(self, func)
+        self.func = func
+        self.name = f'{func.__module__}.{func.__qualname__}'
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def delay(self, *args, **kwargs):
+        """Queue a run with these arguments; returns the ``Job``."""
+        return Job.objects.create(
+            name=self.name,
+            payload={'args': list(args), 'kwargs': kwargs},
+            max_attempts=self.max_attempts or settings.JOBS_MAX_ATTEMPTS,
+            run_at=timezone.now(),
+        )
+
+    def retry_delay(self, attempt):
+        """Seconds to wait before running again after failed attempt number ``attempt``."""
+        base = settings.JOBS_RETRY_BACKOFF if self.backoff is None else self.backoff
+        return min(base * 2 ** (attempt - 1), settings.JOBS_RETRY_BACKOFF_MAX) * random.uniform(0.5, 1)
+
+
+def job(func=None, *, max_attempts=None, backoff=None):
+    """Make ``func`` a background job; use as ``@job`` or ``@job(max_attempts=3, backoff=30)``."""
+    def register(func):
+        task = Task(func, max_attempts, backoff)
+        _registry[task.name] = task
+        return task
+    return register(func) if func is not None else register
+
+
+def get_task(name):
+    """The ``Task`` called ``name``, importing its module if needed; ``None`` if there is none."""
+    if name not in _registry:
+        try:
+            import_string(name)
+        except ImportError:
+            return None
+    return _registry.get(name)
+
+
+def claim(worker, limit=1):
+    """Mark up to ``limit`` due jobs as running for ``worker`` and return them."""
+    now = timezone.now()
+    token = f'{worker}:{uuid.uuid4().hex[:8]}'
+    due = Job.objects.filter(status=Job.QUEUED, run_at__lte=now)
+    while True:
+        claimed = Job.objects.filter(
+            pk__in=due.order_by('run_at', 'pk').values('pk')[:limit], status=Job.QUEUED,
+        ).update(status=Job.RUNNING, locked_by=token, started_at=now, attempts=F('attempts') + 1)
+        # Nothing claimed: either nothing is due, or other workers took these rows first
+        if claimed or not due.exists():
+            break
+    if not claimed:
+        return []
+    return list(Job.objects.filter(status=Job.RUNNING, locked_by=token).order_by('run_at', 'pk'))
+
+
+def release(jobs):
+    """Put claimed jobs that were not started back in the queue."""
+    Job.objects.filter(
+        pk__in=[job.pk for job in jobs], status=Job.RUNNING, locked_by__in={job.locked_by for job in jobs},
+    ).update(status=Job.QUEUED, locked_by='', started_at=None, attempts=F('attempts') - 1)
+
+
+def run(job):
+    """Run a claimed job and record the outcome: ``'done'``, ``'retry'`` or ``'failed'``."""
+    task = get_task(job.name)
+    # Claimed in a batch: the run starts now, not at the claim
+    started = timezone.now()
+    token = routers.start_request()
+    try:
+        if task is None:
+            raise LookupError(f'No job called {job.name!r}')
+        task.func(*job.payload.get('args', ()), **job.payload.get('kwargs', {}))
+    except Exception:
+        error = traceback.format_exc()
+    else:
+        error = None
+    finally:
+        routers.end_request(token)
+
+    now = timezone.now()
+    if error is None:
+        _record(job, status=Job.DONE, started_at=started, finished_at=now, last_error='')
+        return 'done'
+    if task is not None and job.attempts < job.max_attempts:
+        delay = task.retry_delay(job.attempts)
+        logger.warning('Job %s #%s failed (attempt %s of %s), retrying in %.0fs',
+                       job.name, job.pk, job.attempts, job.max_attempts, delay)
+        _record(job, status=Job.QUEUED, run_at=now + timedelta(seconds=delay), last_error=error)
+        return 'retry'
+    logger.error('Job %s #%s failed after %s attempt(s)\n%s', job.name, job.pk, job.attempts, error)
+    _record(job, status=Job.FAILED, started_at=started, finished_at=now, last_error=error)
+    return 'failed'
+
+
+def _record(job, **fields):
+    """Store the outcome of ``job``, unless it was requeued and claimed again while it ran."""
+    if not Job.objects.filter(pk=job.pk, status=Job.RUNNING, locked_by=job.locked_by).update(locked_by='', **fields):
+        logger.warning('Job %s #%s was taken over by another worker while it ran; outcome not recorded',
+                       job.name, job.pk)
+
+
+def requeue_lost():
+    """Queue again (or fail, if out of attempts) jobs running longer than ``JOBS_LOCK_TIMEOUT``."""
+    now = timezone.now()
+    lost = Job.objects.filter(status=Job.RUNNING, started_at__lt=now - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT))
+    failed = lost.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, finished_at=now, locked_by='', last_error='Worker lost while running the job',
+    )
+    requeued = lost.update(status=Job.QUEUED, run_at=now, locked_by='')
+    return requeued + failed
+
+
+def purge():
+    """Delete jobs that finished more than ``JOBS_KEEP_DONE`` seconds ago; failed jobs are kept."""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOBS_KEEP_DONE)
+    deleted, _ = Job.objects.filter(status=Job.DONE, finished_at__lt=cutoff).delete()
+    return deleted
+
+
+class Worker:
+    """Runs due jobs one at a time until stopped; with ``burst`` it stops once none are due."""
+
+    def __init__(self, batch=10, poll_interval=None):
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self.batch = batch
+        self.poll_interval = settings.JOBS_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.stopping = False
+        self.counts = {'done': 0, 'retry': 0, 'failed': 0}
+
+    def stop(self, *args):
+        """Finish the current job and exit (also usable as a signal handler)."""
+        self.stopping = True
+
+    def run(self, burst=False):
+        start = time.monotonic()
+        maintained = None
+        while not self.stopping:
+            close_old_connections()
+            if maintained is None or time.monotonic() - maintained >= MAINTENANCE_INTERVAL:
+                if maintained is not None:
+                    self.log('worker_stats', start)
+                requeue_lost()
+                purge()
+                maintained = time.monotonic()
+            claimed = claim(self.name, self.batch)
+            if not claimed:
+                if burst:
+                    break
+                time.sleep(self.poll_interval)
+                continue
+            for i, job in enumerate(claimed):
+                if self.stopping:
+                    release(claimed[i:])
+                    break
+                self.counts[run(job)] += 1
+        close_old_connections()
+        self.log('worker_stopped', start)
+        return self.counts
+
+    def log(self, event, start):
+        elapsed = time.monotonic() - start
+        processed = sum(self.counts.values())
+        logger.info(json.dumps({
+            'event': event,
+            'worker': self.name,
+            **self.counts,
+            'seconds': round(elapsed, 1),
+            'jobs_per_second': round(processed / elapsed, 2) if elapsed else 0.0,
+        }))
+
+
+def stats(window=60 * 60):
+    """Queue depth and lag, and the throughput and run times of the last ``window`` seconds."""
+    now = timezone.now()
+    per_job = defaultdict(lambda: {'queued': 0, 'running': 0, 'failed': 0, 'finished': 0, 'mean_ms': 0.0, 'max_ms': 0.0})
+    totals = defaultdict(int)
+    for name, status, count in Job.objects.values_list('name', 'status').annotate(count=Count('pk')).order_by():
+        if status != Job.DONE:
+            per_job[name][status] = count
+            totals[status] += count
+
+    durations = defaultdict(list)
+    recent = Job.objects.filter(finished_at__gte=now - timedelta(seconds=window), started_at__isnull=False)
+    for name, started, finished in recent.values_list('name', 'started_at', 'finished_at'):
+        durations[name].append((finished - started).total_seconds() * 1000)
+    for name, samples in durations.items():
+        per_job[name].update(
+            finished=len(samples), mean_ms=round(sum(samples) / len(samples), 2), max_ms=round(max(samples), 2),
+        )
+
+    oldest_due = Job.objects.filter(status=Job.QUEUED, run_at__lte=now).aggregate(oldest=Min('run_at'))['oldest']
+    finished = sum(len(samples) for samples in durations.values())
+    return {
+        'queued': totals[Job.QUEUED],
+        'running': totals[Job.RUNNING],
+        'failed': totals[Job.FAILED],
+        'retrying': Job.objects.filter(status=Job.QUEUED, attempts__gt=0).count(),
+        'oldest_due_seconds': round((now - oldest_due).total_seconds(), 1) if oldest_due else 0.0,
+        'window_seconds': window,
+        'finished': finished,
+        'jobs_per_minute': round(finished / window * 60, 2),
+        'jobs': dict(sorted(per_job.items())),
+    }
@@ -0,0 +1,119 @@
+"""
+Staff product listing for the product management page.
+
+The page loads medicines a page at a time from ``api_medicine_list``.
+Pages are keyset-paginated: the cursor carries the sort value and id of
+the last row shown, so page 500 costs the same as page 1. Search, sort and
+stock filters all run in the database, and the catalog counters come from
+one aggregate query.
+"""
+import base64
+import json
+
+from django.db.models import Count, Q
+
+from . import images, search
+from .models import LOW_STOCK_THRESHOLD, Medicine
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# sort parameter: (field, descending)
+SORTS = {
+    'newest': ('created_at', True),
+    'oldest': ('created_at', False),
+    'name': ('name', False),
+    '-name': ('name', True),
+    'price': ('price', False),
+    '-price': ('price', True),
+    'quantity': ('quantity', False),
+    '-quantity': ('quantity', True),
+}
+
+STOCK_FILTERS = {
+    'in': Q(quantity__gt=LOW_STOCK_THRESHOLD),
+    'low': Q(quantity__gt=0, quantity__lte=LOW_STOCK_THRESHOLD),
+    'out': Q(quantity=0),
+}
+
+LISTING_FIELDS = (
+    'id', 'name', 'company_name', 'power', 'product_number', 'price', 'quantity',
+    'image', 'image_variants', 'created_at', 'version',
+)
+
+
+def stock_status(quantity):
+    if quantity > LOW_STOCK_THRESHOLD:
+        return 'in'
+    return 'low' if quantity > 0 else 'out'
+
+
+def stock_counts():
+    """Catalog size and low/out-of-stock counts, in a single query."""
+    return Medicine.objects.aggregate(
+        total=Count('id'),
+        low_stock=Count('id', filter=STOCK_FILTERS['low']),
+        out_of_stock=Count('id', filter=STOCK_FILTERS['out']),
+    )
+
+
+def encode_cursor(sort, medicine):
+    field, _ = SORTS[sort]
+    value = getattr(medicine, field)
+    raw = json.dumps([sort, value.isoformat() if hasattr(value, 'isoformat') else str(value), medicine.pk])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor, sort):
+    """Return ``(value, id)`` from a cursor; raises ``ValueError`` if malformed."""
+    try:
+        cursor_sort, value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if cursor_sort != sort:
+            raise ValueError('cursor is for another sort order')
+        field, _ = SORTS[sort]
+        return Medicine._meta.get_field(field).to_python(value), int(pk)
+    except (TypeError, ValueError, KeyError) as e:
+        raise ValueError(f'Invalid cursor: {cursor!r}') from e
+
+
+def medicine_page(query='', sort='newest', stock='', cursor=None, limit=PAGE_SIZE):
+    """Return ``(medicines, next_cursor)`` for one page of the staff listing.
+
+    Raises ``ValueError`` for an unknown sort or stock filter or a bad cursor.
+    """
+    if sort not in SORTS:
+        raise ValueError(f'Unknown sort: {sort!r}')
+    if stock and stock not in STOCK_FILTERS:
+        raise ValueError(f'Unknown stock filter: {stock!r}')
+
+    field, descending = SORTS[sort]
+    prefix = '-' if descending else ''
+    medicines = Medicine.objects.only(*LISTING_FIELDS).order_by(f'{prefix}{field}', f'{prefix}id')
+    if query:
+        medicines = search.filter_medicines(medicines, query)
+    if stock:
+        medicines = medicines.filter(STOCK_FILTERS[stock])
+    if cursor:
+        value, pk = decode_cursor(cursor, sort)
+        after = 'lt' if descending else 'gt'
+        medicines = medicines.filter(Q(**{f'{field}__{after}': value}) | Q(**{field: value, f'id__{after}': pk}))
+
+    page = list(medicines[:limit + 1])
+    if len(page) > limit:
+        return page[:limit], encode_cursor(sort, page[limit - 1])
+    return page, None
+
+
+def medicine_as_dict(medicine):
+    return {
+        'id': medicine.id,
+        'name': medicine.name,
+        'company_name': medicine.company_name,
+        'power': medicine.power,
+        'product_number': medicine.product_number,
+        'price': str(medicine.price),
+        'quantity': medicine.quantity,
+        'stock': stock_status(medicine.quantity),
+        'version': medicine.version,
+        'image_url': images.variant_url(medicine, 'thumb'),
+    }
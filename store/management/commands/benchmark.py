@@ -0,0 +1,80 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from store.benchmarks import SCENARIOS, compare
+
+
+class Command(BaseCommand):
+    help = 'Run performance benchmark scenarios against a throwaway test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f'Scenarios to run (default: all). Available: {", ".join(sorted(SCENARIOS))}')
+        parser.add_argument('--count', type=int, help='Override the number of rows a scenario generates')
+        parser.add_argument('--upstream-delay', type=float, default=0.05, help='Latency of the stub FDA server in seconds')
+        parser.add_argument('--workers', type=int, help='Concurrent clients for the load scenarios')
+        parser.add_argument('--output', help='Write results as JSON to this file')
+        parser.add_argument('--compare', metavar='BASELINE', help='Compare results with a JSON file written by --output and fail on regressions')
+        parser.add_argument('--tolerance', type=float, default=10.0, help='Percent change --compare tolerates (default: 10)')
+
+    def handle(self, *args, **options):
+        names = options['scenarios'] or sorted(SCENARIOS)
+        unknown = [name for name in names if name not in SCENARIOS]
+        if unknown:
+            raise CommandError(f'Unknown scenario(s): {", ".join(unknown)}')
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Cannot read baseline {options["compare"]}: {e}')
+
+        setup_test_environment()
+        tmpdir = tempfile.mkdtemp()
+        # Seeded images and variants stay out of the real media directory
+        media = override_settings(MEDIA_ROOT=os.path.join(tmpdir, 'media'))
+        media.enable()
+        # The primary and any read replicas (see store/routers.py)
+        old_names = {}
+        for connection in connections.all():
+            old_names[connection.alias] = connection.settings_dict['NAME']
+            if connection.vendor == 'sqlite':
+                # A file (not in-memory) database so threaded scenarios get real
+                # per-thread connections and can switch to WAL mode.
+                connection.settings_dict['TEST']['NAME'] = os.path.join(tmpdir, f'benchmark-{connection.alias}.sqlite3')
+            connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        results = {}
+        try:
+            for name in names:
+                self.stdout.write(f'Running {name}...')
+                results[name] = SCENARIOS[name](options)
+                self.stdout.write(json.dumps(results[name], indent=2, default=str))
+        finally:
+            for connection in connections.all():
+                connection.creation.destroy_test_db(old_names[connection.alias], verbosity=0)
+            teardown_test_environment()
+            media.disable()
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2, default=str)
+            self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
+
+        if baseline is not None:
+            self.report(baseline, results, options['tolerance'])
+
+    def report(self, baseline, results, tolerance):
+        regressions, improvements = compare(baseline, results, tolerance)
+        for label, rows, style in (('Improved', improvements, self.style.SUCCESS), ('Regressed', regressions, self.style.ERROR)):
+            for metric, old, new, change in rows:
+                self.stdout.write(style(f'{label}: {metric} {old} -> {new} ({change:+}%)'))
+        if regressions:
+            raise CommandError(f'{len(regressions)} metric(s) regressed by more than {tolerance:g}% against the baseline')
+        self.stdout.write(self.style.SUCCESS(f'No regressions beyond {tolerance:g}% against the baseline'))
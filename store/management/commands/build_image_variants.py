@@ -0,0 +1,75 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from store import catalog_cache, images
+from store.models import Medicine
+
+
+def render(data):
+    """Worker entry point: ``render_variants`` that reports errors instead of raising."""
+    try:
+        return images.render_variants(data), None
+    except Exception as e:
+        return None, f'{type(e).__name__}: {e}'
+
+
+class Command(BaseCommand):
+    help = 'Build resized WebP/JPEG derivatives for medicine images that lack them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Worker processes that resize images (1 resizes in this process)')
+        parser.add_argument('--batch-size', type=int, default=64,
+                            help='Originals held in memory at once')
+        parser.add_argument('--force', action='store_true', help='Rebuild derivatives that are already up to date')
+
+    def handle(self, *args, **options):
+        medicines = Medicine.objects.exclude(image='').only('id', 'image', 'image_variants').order_by('pk')
+        pending = [m for m in medicines.iterator() if options['force'] or not images.variants_for(m)]
+        if not pending:
+            self.stdout.write('All medicine images have derivatives.')
+            return
+
+        workers = max(1, options['workers'] or 1)
+        pool = ProcessPoolExecutor(workers) if workers > 1 else None
+        start = time.perf_counter()
+        built = failed = 0
+        try:
+            for i in range(0, len(pending), options['batch_size']):
+                batch, originals = [], []
+                for medicine in pending[i:i + options['batch_size']]:
+                    try:
+                        with medicine.image.open('rb') as f:
+                            originals.append(f.read())
+                    except OSError as e:
+                        self.stderr.write(f'{medicine.image.name}: {e}')
+                        failed += 1
+                        continue
+                    batch.append(medicine)
+
+                results = pool.map(render, originals) if pool else map(render, originals)
+                done = []
+                for medicine, (rendered, error) in zip(batch, results):
+                    if error:
+                        self.stderr.write(f'{medicine.image.name}: {error}')
+                        failed += 1
+                        continue
+                    variants = images.store_variants(medicine.image.name, *rendered)
+                    Medicine.objects.filter(pk=medicine.pk).update(image_variants=variants, updated_at=timezone.now())
+                    done.append(medicine.pk)
+                # update() bypasses post_save, so advance the catalog version here
+                if done:
+                    catalog_cache.invalidate()
+                built += len(done)
+        finally:
+            if pool:
+                pool.shutdown()
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Built derivatives for {built} image(s) in {elapsed:.1f}s with {workers} worker(s); {failed} failed.'
+        ))
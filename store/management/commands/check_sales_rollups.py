@@ -0,0 +1,24 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store import rollups
+
+
+class Command(BaseCommand):
+    help = 'Compare the daily sales rollups with the order lines they summarize'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat, help='First day to check (YYYY-MM-DD)')
+        parser.add_argument('--end', type=date.fromisoformat, help='Last day to check (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        mismatches = rollups.check(options['start'], options['end'])
+        for m in mismatches:
+            self.stdout.write(f'{m.table} {m.date} {m.key}: expected {m.expected}, stored {m.actual}')
+        if mismatches:
+            raise CommandError(
+                f'{len(mismatches)} rollup row(s) disagree with the order lines; '
+                'run rebuild_sales_rollups for the affected days.'
+            )
+        self.stdout.write(self.style.SUCCESS('Sales rollups match the order lines.'))
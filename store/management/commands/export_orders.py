@@ -0,0 +1,32 @@
+import sys
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store import exports
+
+
+class Command(BaseCommand):
+    help = 'Export completed order lines as CSV or JSON Lines, e.g. for a nightly accounting job'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat, help='First day to include (YYYY-MM-DD)')
+        parser.add_argument('--end', type=date.fromisoformat, help='Last day to include (YYYY-MM-DD)')
+        parser.add_argument('--format', choices=sorted(exports.FORMATS), default='csv')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output')
+        parser.add_argument('--output', help='File to write (default: standard output)')
+
+    def handle(self, *args, **options):
+        chunks = exports.export(options['format'], options['start'], options['end'], options['gzip'])
+        try:
+            if options['output']:
+                with open(options['output'], 'wb') as f:
+                    written = sum(f.write(chunk) for chunk in chunks)
+            else:
+                out = getattr(self.stdout, 'buffer', None) or sys.stdout.buffer
+                written = sum(out.write(chunk) for chunk in chunks)
+                out.flush()
+        except OSError as e:
+            raise CommandError(e)
+        if options['output']:
+            self.stderr.write(f'Wrote {written} bytes to {options["output"]}.')
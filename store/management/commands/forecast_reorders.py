@@ -0,0 +1,54 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store import forecasting
+
+
+class Command(BaseCommand):
+    help = 'Forecast demand from the daily sales rollups and list the medicines to reorder'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--method', choices=forecasting.METHODS, default='ewma')
+        parser.add_argument('--window', type=int, default=forecasting.WINDOW,
+                            help='Days for the moving average and demand variability')
+        parser.add_argument('--alpha', type=float, default=forecasting.ALPHA, help='Exponential smoothing factor')
+        parser.add_argument('--lead-time', type=int, default=forecasting.LEAD_TIME, help='Supplier lead time in days')
+        parser.add_argument('--cover-days', type=int, default=forecasting.COVER_DAYS,
+                            help='Days of demand each order should cover')
+        parser.add_argument('--history-days', type=int, default=forecasting.HISTORY_DAYS)
+        parser.add_argument('--limit', type=int, default=20, help='Suggestions to print')
+        parser.add_argument('--csv', help='Write every suggestion to this CSV file')
+
+    def handle(self, *args, **options):
+        if not 0 < options['alpha'] <= 1:
+            raise CommandError('--alpha must be in (0, 1]')
+        start = time.perf_counter()
+        forecast = forecasting.forecast(
+            options['method'], window=options['window'], alpha=options['alpha'], lead_time=options['lead_time'],
+            cover_days=options['cover_days'], history_days=options['history_days'],
+        )
+        elapsed = time.perf_counter() - start
+        suggestions = forecast.suggestions()
+
+        if options['csv']:
+            with open(options['csv'], 'w', newline='') as f:
+                writer = None
+                for i in range(0, len(suggestions), 1000):
+                    for row in forecast.rows(suggestions[i:i + 1000]):
+                        if writer is None:
+                            writer = csv.DictWriter(f, fieldnames=list(row))
+                            writer.writeheader()
+                        writer.writerow(row)
+
+        for row in forecast.rows(suggestions[:options['limit']]):
+            self.stdout.write(
+                f'{row["product_number"]:<16} {row["name"][:40]:<40} stock {row["stock"]:>6}  '
+                f'{row["demand"]:>7}/day  cover {row["days_of_cover"]:>6}  order {row["reorder_quantity"]:>6}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(suggestions)} of {len(forecast)} medicine(s) to reorder, '
+            f'{forecast.at_risk(options["lead_time"])} run out within the lead time '
+            f'(forecast took {elapsed:.2f}s).'
+        ))
@@ -0,0 +1,58 @@
+import csv
+import resource
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store import importer
+
+
+class Command(BaseCommand):
+    help = 'Create or update medicines from a CSV/XLSX price list, upserting on product_number'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='A .csv or .xlsx file with a header row')
+        parser.add_argument('--images', help='Zip of images named by the file\'s "image" column')
+        parser.add_argument('--chunk-size', type=int, default=importer.CHUNK_SIZE,
+                            help='Rows upserted per transaction')
+        parser.add_argument('--report', help='Write every rejected row to this CSV file')
+
+    def handle(self, *args, **options):
+        report_file = report = None
+        if options['report']:
+            report_file = open(options['report'], 'w', newline='')
+            writer = csv.writer(report_file)
+            writer.writerow(['line', 'product_number', 'field', 'message'])
+
+            def report(*row):
+                writer.writerow(row)
+
+        start = time.perf_counter()
+
+        def progress(result):
+            if options['verbosity'] >= 2:
+                self.stdout.write(f'{result.rows} rows ({result.rows / (time.perf_counter() - start):.0f}/s)')
+
+        try:
+            with open(options['path'], 'rb') as f:
+                archive = importer.ImageArchive(open(options['images'], 'rb')) if options['images'] else None
+                result = importer.import_catalog(
+                    importer.read_records(f, options['path']), archive=archive,
+                    chunk_size=options['chunk_size'], report=report, on_chunk=progress,
+                )
+        except (OSError, importer.ImportFileError) as e:
+            raise CommandError(e)
+        finally:
+            if report_file:
+                report_file.close()
+
+        elapsed = time.perf_counter() - start
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result.summary()} in {elapsed:.1f}s '
+            f'({result.rows / elapsed if elapsed else 0:.0f} rows/s, peak RSS {peak_mb:.0f} MB).'
+        ))
+        for line, number, name, message in ([] if report else result.errors[:20]):
+            self.stderr.write(f'line {line} ({number or "no product number"}): {name}: {message}')
+        if result.error_rows and not report:
+            self.stderr.write('Pass --report errors.csv for the full list of rejected rows.')
@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from store.models import LOW_STOCK_THRESHOLD, CartItem, Medicine, Order, OrderItem
+
+
+def canonical_queries():
+    """The hot-path queries of the shop, as ``(label, queryset)`` pairs.
+
+    Keep this list in step with the views: when a view gains a new filter or
+    ordering, add its query here so the index set stays justified.
+    """
+    now = timezone.now()
+    return [
+        ('home: newest medicines', Medicine.objects.order_by('-created_at')[:12]),
+        ('admin: filter by company', Medicine.objects.filter(company_name='GSK').order_by('-created_at')),
+        ('admin: filter by created_at', Medicine.objects.filter(created_at__gte=now).order_by('-created_at')),
+        ('search: name-ordered results', Medicine.objects.order_by('name')[:24]),
+        ('detail: medicine by id', Medicine.objects.filter(pk=1)),
+        ('product number lookup', Medicine.objects.filter(product_number='PN-1')),
+        ('restock: low stock', Medicine.objects.filter(quantity__lte=LOW_STOCK_THRESHOLD).order_by('quantity')),
+        ('cart: lines of a cart', CartItem.objects.filter(cart_id=1).select_related('medicine')),
+        ('profile: order history page', Order.objects.filter(user_id=1, is_completed=True).order_by('-order_date', '-id')[:21]),
+        ('profile: next history page', Order.objects.filter(
+            Q(order_date__lt=now) | Q(order_date=now, id__lt=1), user_id=1, is_completed=True,
+        ).order_by('-order_date', '-id')[:21]),
+        ('profile: items of orders', OrderItem.objects.filter(order_id__in=[1, 2, 3]).select_related('medicine')),
+        ('reports: orders in date range', Order.objects.filter(order_date__gte=now, order_date__lt=now)),
+        ('reports: sales of a medicine', OrderItem.objects.filter(medicine_id=1)),
+    ]
+
+
+def plan_problems(plan):
+    """Return the lines of a query plan that indicate a full scan or a sort."""
+    problems = []
+    for line in plan.splitlines():
+        text = line.strip()
+        if connection.vendor == 'sqlite':
+            # "SCAN t" is a full table scan; "SCAN t USING [COVERING] INDEX i" walks an index in order.
+            if (' SCAN ' in f' {text} ' and 'USING' not in text) or 'USE TEMP B-TREE' in text:
+                problems.append(text)
+        elif 'Seq Scan' in text or text.startswith('Sort'):
+            problems.append(text)
+    return problems
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the canonical shop queries and flag full table scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Print the full plan for every query')
+        parser.add_argument('--fail-on-scan', action='store_true', help='Exit with an error if any query does a full scan')
+
+    def handle(self, *args, **options):
+        flagged = 0
+        for label, queryset in canonical_queries():
+            plan = queryset.explain()
+            problems = plan_problems(plan)
+            if problems:
+                flagged += 1
+                self.stdout.write(self.style.WARNING(f'SCAN  {label}'))
+                for problem in problems:
+                    self.stdout.write(f'        {problem}')
+            else:
+                self.stdout.write(self.style.SUCCESS(f'ok    {label}'))
+            if options['verbose_plans']:
+                self.stdout.write('        ' + plan.replace('\n', '\n        '))
+
+        if flagged and options['fail_on_scan']:
+            raise CommandError(f'{flagged} canonical quer{"y" if flagged == 1 else "ies"} need an index')
+        self.stdout.write(f'{flagged} flagged query plan(s).')
@@ -0,0 +1,50 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand
+
+from store import fda
+from store.models import DrugLabelCache, Medicine
+
+
+class Command(BaseCommand):
+    help = 'Prefetch openFDA label data for every medicine in the catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=8, help='Maximum number of concurrent FDA requests')
+        parser.add_argument('--refresh', action='store_true', help='Refetch labels that are still fresh in the cache')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        names = {}
+        for name in Medicine.objects.values_list('name', flat=True).distinct():
+            key = fda.normalize_name(name)
+            if key:
+                names.setdefault(key, name)
+
+        skipped = 0
+        if not options['refresh']:
+            for entry in DrugLabelCache.objects.filter(key__in=list(names)):
+                if fda.cache_state(entry) == 'fresh':
+                    del names[entry.key]
+                    skipped += 1
+
+        results = asyncio.run(self.fetch_all(list(names.values()), options['concurrency']))
+        for name, (info, found) in zip(names.values(), results):
+            fda.store_label_info(fda.normalize_name(name), info, found)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Fetched {len(names)} label(s), skipped {skipped} cached in {time.perf_counter() - start:.1f}s'
+        ))
+
+    async def fetch_all(self, names, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(name):
+            async with semaphore:
+                return await fda.afetch_label_info(name)
+
+        try:
+            return await asyncio.gather(*(fetch(name) for name in names))
+        finally:
+            await fda.async_client().aclose()
@@ -0,0 +1,19 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from store import rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily sales rollups from order lines (idempotent; all days unless limited)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat, help='First day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--end', type=date.fromisoformat, help='Last day to rebuild (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        written = rollups.rebuild(options['start'], options['end'])
+        self.stdout.write(self.style.SUCCESS(
+            'Rebuilt ' + ', '.join(f'{count} {table} row(s)' for table, count in written.items()) + '.'
+        ))
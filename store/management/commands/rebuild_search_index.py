@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from store import search, search_index
+
+
+class Command(BaseCommand):
+    help = 'Recreate the medicine search indexes (full-text, ingredient and trigram) from the Medicine table'
+
+    def handle(self, *args, **options):
+        if search.fts_available():
+            search.install_fts(connection)
+            with connection.cursor() as cursor:
+                cursor.execute(f"INSERT INTO {search.FTS_TABLE}({search.FTS_TABLE}) VALUES ('optimize')")
+            self.stdout.write('Full-text index rebuilt.')
+        else:
+            self.stdout.write(self.style.WARNING('Full-text search needs SQLite FTS5; skipping.'))
+
+        total = search_index.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Ingredient and trigram index rebuilt for {total} medicine(s).'))
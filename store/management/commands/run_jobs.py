@@ -0,0 +1,82 @@
+import multiprocessing
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from store import jobs
+
+
+def work(options, results=None):
+    """Run one worker in this process; SIGTERM or SIGINT stops it after the current job."""
+    worker = jobs.Worker(batch=options['batch'], poll_interval=options['poll_interval'])
+    handlers = {}
+    if threading.current_thread() is threading.main_thread():
+        handlers = {signum: signal.signal(signum, worker.stop) for signum in (signal.SIGTERM, signal.SIGINT)}
+    try:
+        counts = worker.run(burst=options['burst'])
+    finally:
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+    if results is not None:
+        results.put(counts)
+    return counts
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs (see store/jobs.py) until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=settings.JOBS_WORKER_PROCESSES,
+                            help='Worker processes, each running one job at a time (default: JOBS_WORKER_PROCESSES)')
+        parser.add_argument('--batch', type=int, default=10, help='Jobs a worker claims at once')
+        parser.add_argument('--poll-interval', type=float, help='Seconds to wait when no job is due (default: JOBS_POLL_INTERVAL)')
+        parser.add_argument('--burst', action='store_true', help='Exit once no job is due')
+
+    def handle(self, *args, **options):
+        if options['processes'] < 1 or options['batch'] < 1:
+            raise CommandError('--processes and --batch must be at least 1.')
+
+        start = time.perf_counter()
+        if options['processes'] == 1:
+            counts = work(options)
+        else:
+            counts = self.supervise(options)
+        elapsed = time.perf_counter() - start
+
+        processed = sum(counts.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'Ran {processed} job(s) in {elapsed:.1f}s ({processed / elapsed:.1f}/s): '
+            f'{counts["done"]} done, {counts["retry"]} to retry, {counts["failed"]} failed'
+        ))
+
+    def supervise(self, options):
+        context = multiprocessing.get_context('fork')
+        # Each worker opens its own connections
+        connections.close_all()
+        results = context.SimpleQueue()
+        children = [context.Process(target=work, args=(options, results)) for _ in range(options['processes'])]
+        for child in children:
+            child.start()
+
+        def forward(signum, frame):
+            for child in children:
+                if child.is_alive():
+                    child.terminate()
+
+        handlers = {signum: signal.signal(signum, forward) for signum in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            for child in children:
+                child.join()
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+
+        counts = {'done': 0, 'retry': 0, 'failed': 0}
+        while not results.empty():
+            for outcome, count in results.get().items():
+                counts[outcome] += count
+        return counts
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store import seeding
+
+
+class Command(BaseCommand):
+    help = 'Add synthetic medicines, customers and orders for development and load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--medicines', type=int, default=1000)
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--orders', type=int, default=5000)
+        parser.add_argument('--days', type=int, default=365, help='Spread orders over this many past days')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, for reproducible data')
+        parser.add_argument('--password', default='password', help='Password of every seeded customer')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        result = seeding.seed(
+            medicines=options['medicines'], users=options['users'], orders=options['orders'],
+            days=options['days'], seed=options['seed'], password=options['password'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Added {result.medicines} medicine(s), {result.users} customer(s) and {result.orders} order(s) '
+            f'with {result.order_lines} line(s) in {time.perf_counter() - start:.1f}s.'
+        ))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store import routers
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database into the SQLite read replicas (SQLITE_REPLICAS)'
+
+    def handle(self, *args, **options):
+        synced = routers.sync_sqlite_replicas()
+        if not synced:
+            raise CommandError('No SQLite replicas configured; set SQLITE_REPLICAS.')
+        self.stdout.write(self.style.SUCCESS(f'Synced {", ".join(synced)}.'))
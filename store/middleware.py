@@ -0,0 +1,115 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.functional import SimpleLazyObject, empty
+
+from . import instrumentation, routers
+
+
+class PerformanceMiddleware:
+    """Time every request (see instrumentation.py); list it first in MIDDLEWARE."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PERF_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        instrumentation.enable()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = instrumentation.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            timings = instrumentation.stop(token)
+        return instrumentation.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        token = instrumentation.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            timings = instrumentation.stop(token)
+        return instrumentation.finish(request, response, timings)
+
+
+class ReplicaPinningMiddleware:
+    """Read-your-writes across requests for the database router (see routers.py)."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = routers.start_request(pinned=routers.PIN_COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = routers.end_request(token)
+        return self.remember(response, wrote)
+
+    async def __acall__(self, request):
+        token = routers.start_request(pinned=routers.PIN_COOKIE in request.COOKIES)
+        try:
+            response = await self.get_response(request)
+        finally:
+            wrote = routers.end_request(token)
+        return self.remember(response, wrote)
+
+    def remember(self, response, wrote):
+        if wrote:
+            response.set_cookie(
+                routers.PIN_COOKIE, '1', max_age=settings.DATABASE_REPLICA_PIN_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
+
+
+class SharedUserMiddleware:
+    """Make ``request.user`` and ``await request.auser()`` share one lookup.
+
+    Django caches the two separately, so an async view that checks
+    ``auser()`` and then renders a template reading ``request.user`` would
+    load the user twice. List it right after AuthenticationMiddleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        # Returns the coroutine of an async stack unawaited, for the caller to await
+        self.share(request)
+        return self.get_response(request)
+
+    @staticmethod
+    def share(request):
+        load = request.auser
+
+        async def auser():
+            user = request.user
+            if not isinstance(user, SimpleLazyObject):
+                # Replaced, e.g. by login()
+                return user
+            if user._wrapped is empty:
+                user._wrapped = await load()
+            return user._wrapped
+
+        request.auser = auser
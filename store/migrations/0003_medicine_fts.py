@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from store.search import drop_fts, install_fts
+
+
+def forwards(apps, schema_editor):
+    install_fts(schema_editor.connection)
+
+
+def backwards(apps, schema_editor):
+    drop_fts(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0002_druglabelcache'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from store.search_index import parse_components, trigrams
+
+
+def build_index(apps, schema_editor):
+    Medicine = apps.get_model('store', 'Medicine')
+    MedicineIngredient = apps.get_model('store', 'MedicineIngredient')
+    MedicineTrigram = apps.get_model('store', 'MedicineTrigram')
+    ingredients, grams = [], []
+    for medicine in Medicine.objects.only('id', 'name', 'components', 'power').iterator():
+        for name, strength, unit in parse_components(medicine.components, medicine.power):
+            ingredients.append(MedicineIngredient(medicine_id=medicine.pk, ingredient=name, strength=strength, unit=unit))
+        grams.extend(MedicineTrigram(medicine_id=medicine.pk, trigram=gram) for gram in trigrams(medicine.name))
+    MedicineIngredient.objects.bulk_create(ingredients, batch_size=2000)
+    MedicineTrigram.objects.bulk_create(grams, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0003_medicine_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MedicineIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ingredient', models.CharField(max_length=200)),
+                ('strength', models.DecimalField(blank=True, decimal_places=4, max_digits=14, null=True)),
+                ('unit', models.CharField(blank=True, max_length=10)),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingredients', to='store.medicine')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ingredient', 'strength'], name='store_medic_ingredi_c559da_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MedicineTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigrams', to='store.medicine')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['trigram', 'medicine'], name='store_medic_trigram_f48571_idx')],
+            },
+        ),
+        migrations.RunPython(build_index, migrations.RunPython.noop),
+    ]
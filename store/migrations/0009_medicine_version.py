@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:41
+
+from django.db import migrations, models
+
+from store.search import install_fts
+
+
+def reinstall_fts(apps, schema_editor):
+    # SQLite rebuilds store_medicine to add the column, which drops the FTS triggers
+    install_fts(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_medicine_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicine',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.RunPython(reinstall_fts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill(apps, schema_editor):
+    # Roll up the orders placed before the rollups existed (same as rollups.rebuild)
+    OrderItem = apps.get_model('store', 'OrderItem')
+    revenue = Sum(F('quantity') * F('price'), output_field=DecimalField(max_digits=14, decimal_places=2))
+    items = OrderItem.objects.filter(order__is_completed=True).annotate(day=TruncDate('order__order_date'))
+    for model_name, column, lookup in (('DailyMedicineSales', 'medicine_id', 'medicine_id'),
+                                       ('DailyCompanySales', 'company_name', 'medicine__company_name')):
+        model = apps.get_model('store', model_name)
+        rows = items.values_list('day', lookup).annotate(
+            units=Sum('quantity'), revenue=revenue, order_lines=Count('id')
+        ).order_by()
+        model.objects.bulk_create([
+            model(date=day, **{column: key}, units=units, revenue=total, order_lines=lines)
+            for day, key, units, total, lines in rows
+        ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_medicine_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCompanySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('company_name', models.CharField(max_length=200)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('order_lines', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('date', 'company_name'), name='unique_daily_company_sales')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyMedicineSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('order_lines', models.PositiveIntegerField(default=0)),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='store.medicine')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('date', 'medicine'), name='unique_daily_medicine_sales')],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.6 on 2026-10-18 21:05
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+from store.search import install_fts
+
+
+def backfill(apps, schema_editor):
+    # Existing medicines were last changed no later than they were created, as far as anyone knows
+    apps.get_model('store', 'Medicine').objects.update(updated_at=F('created_at'))
+    apps.get_model('store', 'CatalogVersion').objects.create(pk=1, updated_at=django.utils.timezone.now())
+    # SQLite rebuilds store_medicine to add the column, which drops the FTS triggers
+    install_fts(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicine',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='medicine',
+            index=models.Index(fields=['updated_at'], name='medicine_updated_idx'),
+        ),
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=1)),
+                ('updated_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -3,6 +3,11 @@ from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 
+from . import images
+
+# Stock at or below this level is "low" (restock reports, partial index below)
+LOW_STOCK_THRESHOLD = 10
+
 class Medicine(models.Model):
     name = models.CharField(max_length=200)
     components = models.TextField()
@@ -12,11 +17,57 @@ class Medicine(models.Model):
     power = models.CharField(max_length=50)
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))])
     image = models.ImageField(upload_to='medicines/')
+    # Resized WebP/JPEG copies of the image (see images.py)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Last change of any kind, stock included; the Last-Modified of the product page (see conditional.py)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Optimistic concurrency token: bumped on every edit (see inventory.py)
+    version = models.PositiveIntegerField(default=1, editable=False)
+    
+    class Meta:
+        indexes = [
+            # Newest-first catalog (home page, product management)
+            models.Index(fields=['-created_at'], name='medicine_created_idx'),
+            # Admin list filter by company, newest first
+            models.Index(fields=['company_name', '-created_at'], name='medicine_company_created_idx'),
+            # Name-ordered search results
+            models.Index(fields=['name'], name='medicine_name_idx'),
+            # Changed-since queries
+            models.Index(fields=['updated_at'], name='medicine_updated_idx'),
+            # Restock reports only ever look at the low end of the stock range
+            models.Index(
+                fields=['quantity'],
+                name='medicine_low_stock_idx',
+                condition=models.Q(quantity__lte=LOW_STOCK_THRESHOLD),
+            ),
+        ]
     
     def __str__(self):
         return f"{self.name} - {self.company_name}"
 
+    def save(self, *args, **kwargs):
+        changed = set()
+        if self.image and not self.image._committed:
+            images.process_upload(self)
+            changed.add('image_variants')
+        if not self._state.adding:
+            self.version = models.F('version') + 1
+            changed.update(('version', 'updated_at'))
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], *changed}
+        super().save(*args, **kwargs)
+        if 'version' in changed:
+            self.refresh_from_db(fields=['version'])
+
+class CatalogVersion(models.Model):
+    """Single row counting changes to the catalog as a whole (see conditional.py)."""
+    version = models.PositiveBigIntegerField(default=1)
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Catalog v{self.version}"
+
 class Order(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     order_date = models.DateTimeField(auto_now_add=True)
@@ -25,6 +76,18 @@ class Order(models.Model):
     final_amount = models.DecimalField(max_digits=10, decimal_places=2)
     is_completed = models.BooleanField(default=False)
     
+    class Meta:
+        indexes = [
+            # Order history: a user's completed orders, newest first (see orders.order_history)
+            models.Index(
+                fields=['user', '-order_date', '-id'],
+                name='order_user_history_idx',
+                condition=models.Q(is_completed=True),
+            ),
+            # Date-range sales reports and exports
+            models.Index(fields=['order_date'], name='order_date_idx'),
+        ]
+    
     def __str__(self):
         return f"Order #{self.id} - {self.user.username}"
 
@@ -35,4 +98,130 @@ class OrderItem(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     
     def __str__(self):
-        return f"{self.medicine.name} x{self.quantity}"
\ No newline at end of file
+        return f"{self.medicine.name} x{self.quantity}"
+
+class DrugLabelCache(models.Model):
+    """openFDA label info cached per normalized medicine name."""
+    key = models.CharField(max_length=200, unique=True)
+    info = models.JSONField()
+    found = models.BooleanField(default=False)
+    fetched_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return self.key
+
+
+class MedicineIngredient(models.Model):
+    """One parsed active ingredient of a medicine (see search_index.py)."""
+    medicine = models.ForeignKey(Medicine, related_name='ingredients', on_delete=models.CASCADE)
+    ingredient = models.CharField(max_length=200)
+    strength = models.DecimalField(max_digits=14, decimal_places=4, null=True, blank=True)
+    unit = models.CharField(max_length=10, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['ingredient', 'strength'])]
+
+    def __str__(self):
+        return f"{self.ingredient} {self.strength or ''}{self.unit}".strip()
+
+
+class MedicineTrigram(models.Model):
+    """A character trigram of a medicine name, for fuzzy name lookup."""
+    medicine = models.ForeignKey(Medicine, related_name='trigrams', on_delete=models.CASCADE)
+    trigram = models.CharField(max_length=3)
+
+    class Meta:
+        indexes = [models.Index(fields=['trigram', 'medicine'])]
+
+
+class Cart(models.Model):
+    """A shopping cart; the session only stores its id (see cart.py)."""
+    user = models.OneToOneField(User, null=True, blank=True, related_name='cart', on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Cart #{self.id} - {self.user.username if self.user_id else 'anonymous'}"
+
+
+class CartItem(models.Model):
+    cart = models.ForeignKey(Cart, related_name='items', on_delete=models.CASCADE)
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=1)
+    added_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'medicine'], name='unique_cart_medicine'),
+        ]
+
+    def __str__(self):
+        return f"{self.medicine_id} x{self.quantity}"
+
+
+class DailyMedicineSales(models.Model):
+    """Completed-order sales of one medicine on one day (see rollups.py)."""
+    date = models.DateField()
+    medicine = models.ForeignKey(Medicine, related_name='daily_sales', on_delete=models.CASCADE)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    order_lines = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'medicine'], name='unique_daily_medicine_sales'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.medicine_id}: {self.units}"
+
+
+class DailyCompanySales(models.Model):
+    """Completed-order sales of one company's medicines on one day (see rollups.py)."""
+    date = models.DateField()
+    company_name = models.CharField(max_length=200)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    order_lines = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'company_name'], name='unique_daily_company_sales'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.company_name}: {self.units}"
+
+
+class Job(models.Model):
+    """A queued call of a ``@job`` function (see jobs.py)."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    name = models.CharField(max_length=200)
+    # {"args": [...], "kwargs": {...}}
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=1)
+    run_at = models.DateTimeField()
+    # Claim token of the worker running the job
+    locked_by = models.CharField(max_length=100, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Workers look for due jobs oldest first
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+            # Throughput stats and the clean-up of finished jobs
+            models.Index(fields=['finished_at'], name='job_finished_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
@@ -0,0 +1,217 @@
+"""
+Order placement.
+
+Stock is decremented with conditional ``UPDATE ... SET quantity = quantity - n
+WHERE quantity >= n`` statements inside the order transaction, so two
+concurrent checkouts can never both take the last units: the second update
+matches no row and is reported as a shortfall. Lines are processed in
+medicine id order, which gives every transaction the same lock order and
+avoids deadlocks on databases with row locks.
+
+Work that can wait (the low-stock alert to the managers, re-warming the
+catalog cache) is queued as background jobs in the same transaction
+(see jobs.py), so checkout costs the same however much follow-up work
+an order brings. The sales rollups stay in the transaction: they are
+two upserts, and the report must not lag behind the orders.
+
+Order history is paginated by keyset: the cursor encodes the
+``(order_date, id)`` of the last order shown, so every page is an index
+range scan no matter how deep the customer pages.
+"""
+import base64
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import Decimal
+
+from django.core.mail import mail_managers
+from django.db import transaction
+from django.db.models import F, Prefetch, Q
+from django.utils import timezone
+
+from . import catalog_cache, jobs, rollups, routers
+from .models import LOW_STOCK_THRESHOLD, CartItem, Medicine, Order, OrderItem
+
+
+@dataclass
+class Shortfall:
+    medicine_id: int
+    name: str
+    requested: int
+    available: int
+
+
+@dataclass
+class OrderResult:
+    order: Order = None
+    shortfalls: list = field(default_factory=list)
+
+    @property
+    def ok(self):
+        return self.order is not None
+
+
+class _OutOfStock(Exception):
+    def __init__(self, shortfalls):
+        self.shortfalls = shortfalls
+
+
+def order_totals(lines, discount_percentage=Decimal('0')):
+    """Return ``(total, final_amount)`` for cart lines and a discount percentage."""
+    total = sum((line.price * line.quantity for line in lines), Decimal('0.00'))
+    return total, total - total * (discount_percentage / Decimal('100'))
+
+
+def place_order(user, lines, discount_percentage=Decimal('0'), cart_id=None):
+    """Create a completed order for ``lines`` (``cart.CartLine``) and take the stock.
+
+    Returns an ``OrderResult``; if any line can't be fulfilled nothing is
+    written and ``shortfalls`` lists every short line. The cart
+    ``cart_id``, if given, is emptied in the same transaction, so it is
+    kept exactly when the order isn't placed.
+    """
+    lines = sorted(lines, key=lambda line: line.medicine.pk)
+    total, final_amount = order_totals(lines, discount_percentage)
+
+    try:
+        with transaction.atomic():
+            now = timezone.now()
+            short = [
+                line for line in lines
+                if not Medicine.objects.filter(pk=line.medicine.pk, quantity__gte=line.quantity)
+                .update(quantity=F('quantity') - line.quantity, updated_at=now)
+            ]
+            if short:
+                raise _OutOfStock(short)
+
+            order = Order.objects.create(
+                user=user,
+                total_amount=total,
+                discount_percentage=discount_percentage,
+                final_amount=final_amount,
+                is_completed=True
+            )
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, medicine_id=line.medicine.pk, quantity=line.quantity, price=line.price)
+                for line in lines
+            ])
+            rollups.record_order(order, lines)
+            if cart_id is not None:
+                CartItem.objects.filter(cart_id=cart_id).delete()
+            medicine_ids = [line.medicine.pk for line in lines]
+            # The stock badges changed: the home grid is cached under the catalog version
+            transaction.on_commit(catalog_cache.invalidate)
+            notify_low_stock.delay([[line.medicine.pk, line.quantity] for line in lines])
+            if catalog_cache.shared():
+                catalog_cache.warm.delay(medicine_ids)
+    except _OutOfStock as e:
+        available = dict(
+            Medicine.objects.filter(pk__in=[line.medicine.pk for line in e.shortfalls])
+            .values_list('pk', 'quantity')
+        )
+        return OrderResult(shortfalls=[
+            Shortfall(
+                medicine_id=line.medicine.pk,
+                name=line.medicine.name,
+                requested=line.quantity,
+                available=available.get(line.medicine.pk, 0),
+            )
+            for line in e.shortfalls
+        ])
+
+    return OrderResult(order=order)
+
+
+@jobs.job
+def notify_low_stock(sold):
+    """Email the managers the medicines an order took down to ``LOW_STOCK_THRESHOLD``.
+
+    ``sold`` is a list of ``[medicine_id, units]``; a medicine that was
+    already low before the order is not reported again. Returns how many
+    medicines were reported.
+    """
+    sold = dict(sold)
+    # Stock as of now, not as of a lagging replica
+    routers.pin()
+    low = [
+        medicine for medicine in
+        Medicine.objects.filter(pk__in=sold, quantity__lte=LOW_STOCK_THRESHOLD).only('name', 'product_number', 'quantity')
+        if medicine.quantity + sold[medicine.pk] > LOW_STOCK_THRESHOLD
+    ]
+    if low:
+        mail_managers(
+            f'Low stock: {", ".join(medicine.name for medicine in low)}',
+            '\n'.join(f'{medicine.name} ({medicine.product_number}): {medicine.quantity} left' for medicine in low),
+        )
+    return len(low)
+
+
+HISTORY_PAGE_SIZE = 20
+
+
+def encode_cursor(order):
+    raw = f'{order.order_date.isoformat()}|{order.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return ``(order_date, id)`` from a cursor; raises ``ValueError`` if malformed."""
+    try:
+        order_date, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(order_date), int(pk)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'Invalid cursor: {cursor!r}') from e
+
+
+def _history(user, cursor):
+    items = OrderItem.objects.select_related('medicine').only(
+        'id', 'order', 'quantity', 'price', 'medicine__id', 'medicine__name'
+    )
+    orders = (
+        Order.objects.filter(user=user, is_completed=True)
+        .only('id', 'order_date', 'total_amount', 'discount_percentage', 'final_amount')
+        .order_by('-order_date', '-id')
+        .prefetch_related(Prefetch('items', queryset=items))
+    )
+    if cursor:
+        order_date, pk = decode_cursor(cursor)
+        orders = orders.filter(Q(order_date__lt=order_date) | Q(order_date=order_date, id__lt=pk))
+    return orders
+
+
+def _history_page(page, limit):
+    if len(page) > limit:
+        return page[:limit], encode_cursor(page[limit - 1])
+    return page, None
+
+
+def order_history(user, cursor=None, limit=HISTORY_PAGE_SIZE):
+    """Return ``(orders, next_cursor)`` for a page of ``user``'s completed orders.
+
+    Items and their medicine names are prefetched, so a page costs two
+    queries however many orders and lines it holds.
+    """
+    return _history_page(list(_history(user, cursor)[:limit + 1]), limit)
+
+
+async def aorder_history(user, cursor=None, limit=HISTORY_PAGE_SIZE):
+    """``order_history`` for async views."""
+    return _history_page([order async for order in _history(user, cursor)[:limit + 1]], limit)
+
+
+def order_as_dict(order):
+    return {
+        'id': order.id,
+        'order_date': order.order_date.isoformat(),
+        'total_amount': str(order.total_amount),
+        'discount_percentage': str(order.discount_percentage),
+        'final_amount': str(order.final_amount),
+        'items': [
+            {
+                'medicine_id': item.medicine_id,
+                'name': item.medicine.name,
+                'quantity': item.quantity,
+                'price': str(item.price),
+            }
+            for item in order.items.all()
+        ],
+    }
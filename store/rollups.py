@@ -0,0 +1,234 @@
+"""
+Daily sales rollups for the sales report.
+
+``DailyMedicineSales`` holds units, revenue (quantity x unit price, before
+order discounts) and line count per ``(date, medicine)``;
+``DailyCompanySales`` the same per ``(date, company_name)``. Dates are
+days of ``order_date`` in the site's time zone, and only completed
+orders count.
+
+``place_order`` adds each new order's lines inside the order
+transaction, with one ``INSERT ... ON CONFLICT DO UPDATE`` per table
+that adds to the day's running totals, so concurrent checkouts can't
+lose an update. When orders or medicines are deleted, handlers in
+``signals.py`` note the days their completed lines were sold on before
+the delete (no query for an order, one for a medicine) and recompute
+just those days from what is left once it has run, in the same
+transaction. Order lines themselves have no handler, so Django deletes
+them in bulk; ``OrderItemAdmin`` does the same for lines deleted on
+their own. The sales report reads only these tables, so it costs the
+same however long the shop has been trading.
+
+``rebuild`` recomputes any range of days from ``OrderItem``; it is
+idempotent and doubles as the catch-up job after bulk changes to
+orders. ``check`` compares the rollups with ``OrderItem`` without
+changing anything. Company rows keep the company a medicine had when it
+was sold, so after a medicine's company is changed ``check`` reports the
+old days until they are rebuilt.
+"""
+import threading
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import exports
+from .models import DailyCompanySales, DailyMedicineSales, OrderItem
+
+CENT = Decimal('0.01')
+REVENUE = Sum(F('quantity') * F('price'), output_field=DecimalField(max_digits=14, decimal_places=2))
+TOP_SIZE = 10
+BATCH_SIZE = 2000
+
+# rollup model: its key column besides the date, and the OrderItem lookup it comes from
+ROLLUPS = {
+    DailyMedicineSales: ('medicine_id', 'medicine_id'),
+    DailyCompanySales: ('company_name', 'medicine__company_name'),
+}
+
+
+def _upsert_sql(model, key):
+    table = connection.ops.quote_name(model._meta.db_table)
+    return (
+        f'INSERT INTO {table} (date, {key}, units, revenue, order_lines) VALUES (%s, %s, %s, %s, %s) '
+        f'ON CONFLICT (date, {key}) DO UPDATE SET units = {table}.units + excluded.units, '
+        f'revenue = {table}.revenue + excluded.revenue, order_lines = {table}.order_lines + excluded.order_lines'
+    )
+
+
+def add_lines(day, lines):
+    """Add order lines sold on ``day`` to both rollups.
+
+    ``lines`` are ``(medicine_id, company_name, quantity, unit_price)`` tuples.
+    """
+    totals = {model: {} for model in ROLLUPS}
+    for medicine_id, company_name, quantity, price in lines:
+        for model, key in ((DailyMedicineSales, medicine_id), (DailyCompanySales, company_name)):
+            units, revenue, count = totals[model].get(key, (0, 0, 0))
+            totals[model][key] = (units + quantity, revenue + quantity * price, count + 1)
+
+    with connection.cursor() as cursor:
+        for model, (column, _) in ROLLUPS.items():
+            if not totals[model]:
+                continue
+            cursor.executemany(_upsert_sql(model, column), [
+                (day, key, units, str(revenue), count) for key, (units, revenue, count) in totals[model].items()
+            ])
+
+
+def record_order(order, lines):
+    """Add a just-placed completed order's ``cart.CartLine`` lines to the rollups."""
+    add_lines(timezone.localdate(order.order_date), [
+        (line.medicine.pk, line.medicine.company_name, line.quantity, line.price) for line in lines
+    ])
+
+
+_deleted = threading.local()
+
+
+def _deleted_days():
+    if not hasattr(_deleted, 'days'):
+        _deleted.days = set()
+    return _deleted.days
+
+
+def deleting_order(order):
+    """Note the day of an order that is about to be deleted."""
+    if order.is_completed:
+        _deleted_days().add(timezone.localdate(order.order_date))
+
+
+def deleting_lines(items):
+    """Note the days of the ``OrderItem`` queryset ``items``, which is about to be deleted."""
+    _deleted_days().update(
+        items.filter(order__is_completed=True).annotate(day=TruncDate('order__order_date'))
+        .values_list('day', flat=True).order_by().distinct()
+    )
+
+
+def rebuild_deleted():
+    """Recompute the days noted by ``deleting_order``/``deleting_lines`` once the rows are gone."""
+    days = _deleted_days()
+    if days:
+        _deleted.days = set()
+        rebuild(days=days)
+
+
+def _raw_totals(model, start=None, end=None, days=None):
+    """``{(date, key): (units, revenue, order_lines)}`` aggregated from ``OrderItem``."""
+    _, lookup = ROLLUPS[model]
+    rows = (
+        OrderItem.objects.filter(order__is_completed=True, **exports.date_bounds(start, end))
+        .annotate(day=TruncDate('order__order_date'))
+        .filter(**({'day__in': days} if days is not None else {}))
+        .values_list('day', lookup)
+        .annotate(units=Sum('quantity'), revenue=REVENUE, order_lines=Count('id'))
+        .order_by()
+    )
+    return {(day, key): (units, money(revenue), lines) for day, key, units, revenue, lines in rows}
+
+
+def money(value):
+    """Sums of decimals come back from SQLite unrounded; round them to paise."""
+    return Decimal(value or 0).quantize(CENT)
+
+
+def _day_range(start=None, end=None):
+    bounds = {}
+    if start:
+        bounds['date__gte'] = start
+    if end:
+        bounds['date__lte'] = end
+    return bounds
+
+
+def rebuild(start=None, end=None, days=None):
+    """Recompute the rollups of days ``start`` to ``end`` (all days if omitted), or of just ``days``.
+
+    Returns ``{model name: rows written}``.
+    """
+    if days is not None:
+        days = sorted(days)
+        start, end = days[0], days[-1]
+    written = {}
+    with transaction.atomic():
+        for model, (column, _) in ROLLUPS.items():
+            rows = model.objects.filter(**_day_range(start, end))
+            (rows.filter(date__in=days) if days is not None else rows).delete()
+            rows = [
+                model(date=day, **{column: key}, units=units, revenue=revenue, order_lines=lines)
+                for (day, key), (units, revenue, lines) in _raw_totals(model, start, end, days).items()
+            ]
+            model.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+            written[model.__name__] = len(rows)
+    return written
+
+
+@dataclass
+class Mismatch:
+    table: str
+    date: object
+    key: object
+    expected: tuple
+    actual: tuple
+
+
+def check(start=None, end=None):
+    """Compare the rollups with ``OrderItem``; returns a list of ``Mismatch``."""
+    mismatches = []
+    for model, (column, _) in ROLLUPS.items():
+        expected = _raw_totals(model, start, end)
+        actual = {
+            (day, key): (units, money(revenue), lines)
+            for day, key, units, revenue, lines in model.objects.filter(**_day_range(start, end))
+            .values_list('date', column, 'units', 'revenue', 'order_lines')
+            # days whose every line was deleted keep an all-zero row
+            if units or revenue or lines
+        }
+        for day, key in sorted(expected.keys() | actual.keys(), key=str):
+            if expected.get((day, key)) != actual.get((day, key)):
+                mismatches.append(Mismatch(model.__name__, day, key, expected.get((day, key)), actual.get((day, key))))
+    return mismatches
+
+
+def report(start, end, top=TOP_SIZE):
+    """Sales between two dates (inclusive), read from the rollups only."""
+    days = {
+        row['date']: row for row in DailyCompanySales.objects.filter(date__gte=start, date__lte=end)
+        .values('date').annotate(units=Sum('units'), revenue=Sum('revenue'), order_lines=Sum('order_lines'))
+        .order_by('date')
+    }
+    daily = []
+    day = start
+    while day <= end:
+        row = days.get(day, {})
+        daily.append({'date': day, 'units': row.get('units') or 0, 'revenue': money(row.get('revenue')),
+                      'order_lines': row.get('order_lines') or 0})
+        day += timedelta(days=1)
+
+    medicines = list(
+        DailyMedicineSales.objects.filter(date__gte=start, date__lte=end)
+        .values('medicine_id', 'medicine__name', 'medicine__company_name')
+        .annotate(units=Sum('units'), revenue=Sum('revenue'))
+        .order_by('-revenue', 'medicine_id')[:top]
+    )
+    companies = list(
+        DailyCompanySales.objects.filter(date__gte=start, date__lte=end)
+        .values('company_name').annotate(units=Sum('units'), revenue=Sum('revenue'))
+        .order_by('-revenue', 'company_name')[:top]
+    )
+    for row in medicines + companies:
+        row['revenue'] = money(row['revenue'])
+    return {
+        'start': start,
+        'end': end,
+        'units': sum(d['units'] for d in daily),
+        'revenue': sum((d['revenue'] for d in daily), Decimal('0.00')),
+        'daily': daily,
+        'medicines': medicines,
+        'companies': companies,
+    }
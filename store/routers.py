@@ -0,0 +1,139 @@
+"""
+Primary/replica database routing and connection tuning.
+
+``PrimaryReplicaRouter`` sends reads of the catalog and of order history
+(``REPLICATED_MODELS``: product pages, search, the profile page, reports)
+to one of ``DATABASE_REPLICAS``, and everything else to ``default``, the
+primary: all writes, the checkout transaction (any read inside an
+``atomic`` block on the primary stays on it, and ``select_for_update``
+counts as a write), and reads of sessions, users, carts and the catalog
+version behind the ETags, which must never be stale. Without replicas
+every query goes to ``default``.
+
+Replicas lag, so a caller that wrote to a replicated model reads from the
+primary afterwards (read-your-writes). The pin lives in a context
+variable: outside requests it lasts for the thread, while
+``ReplicaPinningMiddleware`` scopes it to one request and carries it
+over to the visitor's next requests for ``DATABASE_REPLICA_PIN_SECONDS``
+with a cookie, so an order shows up in the history right after checkout.
+That only holds while replicas lag by less than the pin: streaming
+PostgreSQL replicas normally do, but SQLite replicas are only as fresh as
+the last ``sync_replicas``, which must then run more often than
+``DATABASE_REPLICA_PIN_SECONDS``.
+
+``apply_sqlite_pragmas`` runs ``SQLITE_PRAGMAS`` on every new SQLite
+connection: ``busy_timeout`` makes writers queue instead of failing and
+``mmap_size`` reads pages without copying. With ``SQLITE_WAL=1`` it also
+switches the file to WAL, which lets readers run alongside the writer,
+with ``synchronous=NORMAL``, which is safe with WAL and saves an fsync
+per commit. WAL is opt-in because it is a property of the database file
+rather than of the connection. ``sync_sqlite_replicas`` copies the primary file into
+SQLite replicas, which is how a two-file setup is "replicated" locally.
+"""
+import contextvars
+import random
+import sqlite3
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICATED_MODELS = {
+    'store.medicine', 'store.order', 'store.orderitem',
+    'store.dailymedicinesales', 'store.dailycompanysales',
+}
+PIN_COOKIE = 'db_pin'
+
+
+class RoutingState:
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+_state = contextvars.ContextVar('db_routing', default=None)
+
+
+def _current():
+    state = _state.get()
+    if state is None:
+        state = RoutingState()
+        _state.set(state)
+    return state
+
+
+def start_request(pinned=False):
+    """Route a request, already pinned to the primary if ``pinned``; returns the token for ``end_request``."""
+    return _state.set(RoutingState(pinned))
+
+
+def end_request(token):
+    """Whether the request wrote to a replicated model."""
+    state = _state.get()
+    _state.reset(token)
+    return state.wrote
+
+
+def pin():
+    """Read from the primary from now on (for the rest of the request, outside one the thread)."""
+    state = _current()
+    state.pinned = state.wrote = True
+
+
+def is_pinned():
+    state = _state.get()
+    return state is not None and state.pinned
+
+
+def replicas():
+    return settings.DATABASE_REPLICAS
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        available = replicas()
+        if not available or model._meta.label_lower not in REPLICATED_MODELS or is_pinned():
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(available)
+
+    def db_for_write(self, model, **hints):
+        if model._meta.label_lower in REPLICATED_MODELS:
+            pin()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replicas():
+            return False
+        return None
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+
+
+def sync_sqlite_replicas():
+    """Copy the primary SQLite database into every SQLite replica; returns their aliases."""
+    primary = connections[DEFAULT_DB_ALIAS]
+    primary.ensure_connection()
+    synced = []
+    for alias in replicas():
+        replica = connections[alias]
+        if replica.vendor != 'sqlite':
+            continue
+        replica.close()
+        target = sqlite3.connect(replica.settings_dict['NAME'])
+        try:
+            primary.connection.backup(target)
+        finally:
+            target.close()
+        synced.append(alias)
+    return synced
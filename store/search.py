@@ -0,0 +1,187 @@
+"""
+Full-text medicine search.
+
+On SQLite the catalog is indexed by an FTS5 table (``store_medicine_fts``)
+that mirrors ``name``, ``company_name`` and ``components`` of
+``store_medicine``. It is an external-content table kept in sync by
+triggers, so bulk inserts and updates are indexed too. Results are ranked
+with BM25 (name matches weigh most) and every query term is matched as a
+prefix, which makes the same query usable for as-you-type suggestions.
+
+Queries that name an ingredient and a strength ("paracetamol 500") are
+answered from the ingredient index first, and queries the full-text index
+cannot match fall back to fuzzy ingredient and trigram name lookups (see
+``search_index.py``), so common misspellings still find something.
+
+Other databases fall back to the ``icontains`` search.
+
+Migrations that rebuild ``store_medicine`` on SQLite (e.g. adding a NOT
+NULL column) drop its triggers; they must call ``install_fts`` again.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from . import search_index
+from .models import Medicine
+
+FTS_TABLE = 'store_medicine_fts'
+FTS_COLUMNS = ('name', 'company_name', 'components')
+# bm25() column weights, in FTS_COLUMNS order
+FTS_WEIGHTS = (10.0, 4.0, 1.0)
+
+FTS_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, company_name, components,
+        content='store_medicine', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON store_medicine BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, company_name, components)
+        VALUES (new.id, new.name, new.company_name, new.components);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON store_medicine BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, company_name, components)
+        VALUES ('delete', old.id, old.name, old.company_name, old.components);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, company_name, components ON store_medicine BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, company_name, components)
+        VALUES ('delete', old.id, old.name, old.company_name, old.components);
+        INSERT INTO {FTS_TABLE}(rowid, name, company_name, components)
+        VALUES (new.id, new.name, new.company_name, new.components);
+    END""",
+]
+
+DROP_FTS_SQL = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ai',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ad',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_au',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+
+def fts_available(using=connection):
+    return using.vendor == 'sqlite'
+
+
+def install_fts(using=connection):
+    """Create the FTS table and triggers (if missing) and rebuild the index."""
+    if not fts_available(using):
+        return
+    with using.cursor() as cursor:
+        for sql in FTS_SQL:
+            cursor.execute(sql)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def drop_fts(using=connection):
+    if not fts_available(using):
+        return
+    with using.cursor() as cursor:
+        for sql in DROP_FTS_SQL:
+            cursor.execute(sql)
+
+
+def fts_query(query):
+    """Turn free text into an FTS5 query that prefix-matches every term."""
+    terms = re.findall(r'\w+', query.lower())
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+class FTSResults:
+    """Lazy, BM25-ranked search results that ``Paginator`` can slice.
+
+    Only the requested page of ids is read from the index; the matching
+    ``Medicine`` rows are then loaded with a single ``in_bulk``.
+    """
+
+    def __init__(self, match):
+        self.match = match
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT count(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [self.match])
+                self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def ids(self, offset, limit):
+        weights = ', '.join(str(w) for w in FTS_WEIGHTS)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s OFFSET %s',
+                [self.match, limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        offset = index.start or 0
+        limit = (index.stop - offset) if index.stop is not None else -1
+        ids = self.ids(offset, limit)
+        medicines = Medicine.objects.in_bulk(ids)
+        return [medicines[pk] for pk in ids if pk in medicines]
+
+
+def like_search(query):
+    """The plain ``icontains`` search used where FTS5 is not available."""
+    return Medicine.objects.filter(
+        Q(name__icontains=query) |
+        Q(company_name__icontains=query) |
+        Q(components__icontains=query)
+    ).order_by('name')
+
+
+def filter_medicines(queryset, query):
+    """Restrict ``queryset`` to medicines matching ``query``, keeping its ordering.
+
+    Matches name, company and components through the full-text index, plus
+    a (case-sensitive) product number prefix through its unique index.
+    """
+    sku = Q(product_number__gte=query, product_number__lt=query + '\U0010ffff')
+    if not fts_available():
+        return queryset.filter(
+            Q(name__icontains=query) | Q(company_name__icontains=query) | Q(components__icontains=query) | sku
+        )
+    match = fts_query(query)
+    if not match:
+        return queryset.filter(sku)
+    matching = RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+    return queryset.filter(Q(pk__in=matching) | sku)
+
+
+def search_medicines(query):
+    """Return ranked results for ``query``, suitable for ``Paginator``."""
+    _, strengths = search_index.parse_query(query)
+    if strengths:
+        results = search_index.ingredient_search(query)
+        if results is not None and results.exists():
+            return results
+
+    if fts_available():
+        match = fts_query(query)
+        if not match:
+            return Medicine.objects.none()
+        results = FTSResults(match)
+    else:
+        results = like_search(query)
+    if results.count():
+        return results
+
+    results = search_index.ingredient_search(query)
+    if results is not None and results.exists():
+        return results
+    return search_index.fuzzy_name_search(query)
+
+
+def suggest(query, limit=8):
+    """Top matches for as-you-type suggestions."""
+    return list(search_medicines(query)[:limit])
@@ -0,0 +1,227 @@
+"""
+Precomputed ingredient and trigram indexes for typo-tolerant search.
+
+``Medicine.components`` and ``Medicine.power`` are parsed into normalized
+``(ingredient, strength, unit)`` rows (``MedicineIngredient``), and the
+medicine name is split into character trigrams (``MedicineTrigram``).
+Both are plain indexed tables, so lookups only touch the posting lists of
+the query's ingredients/trigrams rather than scanning the catalog.
+
+The indexes are refreshed by the ``post_save`` handler in ``signals.py``
+and rebuilt in bulk by ``manage.py rebuild_search_index``.
+"""
+import difflib
+import math
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.db.models import Count
+from django.db.models.functions import Length
+
+from .models import Medicine, MedicineIngredient, MedicineTrigram
+
+STRENGTH_RE = re.compile(r'(\d+(?:\.\d+)?)\s*(mcg|µg|ug|mg|gm|g|ml|iu|%)?(?![a-z])', re.IGNORECASE)
+SPLIT_RE = re.compile(r'[,+;&]|\band\b|\bwith\b', re.IGNORECASE)
+# Pharmacopoeia suffixes and dosage-form words that are not part of the salt name
+NOISE_WORDS = {'ip', 'bp', 'usp', 'ep', 'tablet', 'tablets', 'tab', 'capsule', 'capsules', 'cap', 'syrup', 'each', 'contains'}
+UNIT_SCALE = {'mcg': Decimal('0.001'), 'µg': Decimal('0.001'), 'ug': Decimal('0.001'), 'mg': Decimal(1), 'g': Decimal(1000), 'gm': Decimal(1000)}
+
+FUZZY_CANDIDATES = 50
+FUZZY_THRESHOLD = 0.3
+INGREDIENT_CUTOFF = 0.75
+
+
+def normalize_strength(value, unit):
+    """Return ``(strength, unit)`` with mass units converted to mg."""
+    try:
+        value = Decimal(value)
+    except InvalidOperation:
+        return None, ''
+    unit = (unit or '').lower()
+    if unit in UNIT_SCALE:
+        return (value * UNIT_SCALE[unit]).normalize(), 'mg'
+    return value.normalize(), unit
+
+
+def normalize_ingredient(text):
+    words = re.findall(r'[a-z][a-z0-9-]*', text.lower())
+    return ' '.join(w for w in words if w not in NOISE_WORDS)
+
+
+def parse_components(components, power=''):
+    """Split a components string into ``(ingredient, strength, unit)`` tuples.
+
+    ``power`` supplies the strength for a single-ingredient medicine whose
+    components do not state one, e.g. components="Paracetamol", power="500mg".
+    """
+    parsed = []
+    for part in SPLIT_RE.split(components or ''):
+        match = STRENGTH_RE.search(part)
+        strength, unit = normalize_strength(*match.groups()) if match else (None, '')
+        name = normalize_ingredient(STRENGTH_RE.sub(' ', part))
+        if name:
+            parsed.append((name, strength, unit))
+
+    if len(parsed) == 1 and parsed[0][1] is None and power:
+        match = STRENGTH_RE.search(power)
+        if match:
+            parsed[0] = (parsed[0][0], *normalize_strength(*match.groups()))
+    return parsed
+
+
+def trigrams(text):
+    """Character trigrams of each word, padded like pg_trgm ("  w", " wo", ...)."""
+    grams = set()
+    for word in re.findall(r'\w+', text.lower()):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def name_similarity(query_grams, name):
+    """Best trigram similarity of the query against the whole name or any word of it."""
+    scores = [similarity(query_grams, trigrams(name))]
+    scores.extend(similarity(query_grams, trigrams(word)) for word in name.split())
+    return max(scores)
+
+
+def _index_rows(medicine):
+    ingredients = [
+        (medicine.pk, name, strength, unit)
+        for name, strength, unit in parse_components(medicine.components, medicine.power)
+    ]
+    grams = [(medicine.pk, gram) for gram in trigrams(medicine.name)]
+    return ingredients, grams
+
+
+def _insert_sql(model, columns):
+    return (f'INSERT INTO {model._meta.db_table} ({", ".join(columns)}) '
+            f'VALUES ({", ".join(["%s"] * len(columns))})')
+
+
+def index_medicines(medicines):
+    """Replace the index rows of ``medicines`` in one transaction."""
+    medicines = list(medicines)
+    ids = [m.pk for m in medicines]
+    ingredients, grams = [], []
+    for medicine in medicines:
+        rows = _index_rows(medicine)
+        ingredients.extend(rows[0])
+        grams.extend(rows[1])
+
+    # Plain executemany: a catalog import writes ~15 trigram rows per
+    # medicine, and building model instances for them dominated the time.
+    with transaction.atomic(), connection.cursor() as cursor:
+        MedicineIngredient.objects.filter(medicine_id__in=ids).delete()
+        MedicineTrigram.objects.filter(medicine_id__in=ids).delete()
+        cursor.executemany(
+            _insert_sql(MedicineIngredient, ['medicine_id', 'ingredient', 'strength', 'unit']),
+            [(pk, name, connection.ops.adapt_decimalfield_value(strength, 14, 4), unit)
+             for pk, name, strength, unit in ingredients],
+        )
+        cursor.executemany(_insert_sql(MedicineTrigram, ['medicine_id', 'trigram']), grams)
+
+
+def index_medicine(medicine):
+    index_medicines([medicine])
+
+
+def rebuild(batch_size=2000):
+    """Rebuild both indexes for the whole catalog; returns the medicine count."""
+    MedicineIngredient.objects.all().delete()
+    MedicineTrigram.objects.all().delete()
+    total = 0
+    qs = Medicine.objects.only('id', 'name', 'components', 'power').order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(qs.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return total
+        index_medicines(batch)
+        total += len(batch)
+        last_pk = batch[-1].pk
+
+
+def resolve_ingredient(word):
+    """Map a (possibly misspelled) ingredient to names present in the index."""
+    if MedicineIngredient.objects.filter(ingredient=word).exists():
+        return [word]
+    prefixed = list(
+        MedicineIngredient.objects.filter(ingredient__startswith=word)
+        .values_list('ingredient', flat=True).distinct()[:10]
+    )
+    if prefixed:
+        return prefixed
+    return difflib.get_close_matches(word, _close_vocabulary(word), n=3, cutoff=INGREDIENT_CUTOFF)
+
+
+def _close_vocabulary(word):
+    """Indexed ingredients that might be within ``INGREDIENT_CUTOFF`` of ``word``.
+
+    difflib's ratio is at most ``2 * shorter / (len(a) + len(b))``, which
+    bounds the length of a match, and misspellings seldom get the first
+    letter wrong, so only that letter's stretch of the index is read.
+    """
+    shortest = int(len(word) * INGREDIENT_CUTOFF / (2 - INGREDIENT_CUTOFF))
+    longest = math.ceil(len(word) * (2 - INGREDIENT_CUTOFF) / INGREDIENT_CUTOFF)
+    return list(
+        MedicineIngredient.objects.filter(ingredient__gte=word[0], ingredient__lt=chr(ord(word[0]) + 1))
+        .annotate(length=Length('ingredient')).filter(length__range=(shortest, longest))
+        .values_list('ingredient', flat=True).distinct()
+    )
+
+
+def parse_query(query):
+    """Split a query like "paracetamol 500mg" into ingredient words and strengths."""
+    strengths = [normalize_strength(*m.groups()) for m in STRENGTH_RE.finditer(query)]
+    words = normalize_ingredient(STRENGTH_RE.sub(' ', query))
+    return words, strengths
+
+
+def ingredient_search(query):
+    """Medicines containing the query's ingredients (at its strength, if given).
+
+    Returns ``None`` when the query doesn't name a known ingredient.
+    """
+    words, strengths = parse_query(query)
+    if not words:
+        return None
+
+    # Try the whole phrase first ("clavulanic acid"), then word by word.
+    groups = [resolve_ingredient(words)]
+    if not groups[0]:
+        groups = [resolve_ingredient(word) for word in words.split()]
+        if not all(groups):
+            return None
+
+    medicines = Medicine.objects.all()
+    for i, names in enumerate(groups):
+        lookup = {'ingredients__ingredient__in': names}
+        if i < len(strengths) and strengths[i][0] is not None:
+            lookup['ingredients__strength'] = strengths[i][0]
+        medicines = medicines.filter(**lookup)
+    return medicines.distinct().order_by('name')
+
+
+def fuzzy_name_search(query, limit=FUZZY_CANDIDATES):
+    """Medicines whose names are trigram-similar to ``query``, best first."""
+    query_grams = trigrams(query)
+    if not query_grams:
+        return []
+
+    candidates = (
+        MedicineTrigram.objects.filter(trigram__in=query_grams)
+        .values('medicine_id').annotate(hits=Count('id')).order_by('-hits')[:limit]
+    )
+    medicines = Medicine.objects.in_bulk([c['medicine_id'] for c in candidates])
+    scored = [(name_similarity(query_grams, m.name), m) for m in medicines.values()]
+    scored = [item for item in scored if item[0] >= FUZZY_THRESHOLD]
+    scored.sort(key=lambda item: (-item[0], item[1].name))
+    return [m for _, m in scored]
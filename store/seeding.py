@@ -0,0 +1,175 @@
+"""
+Synthetic shop data for development and load testing (``manage.py seed_data``).
+
+Medicines get brand-like names, one to three active ingredients with a
+strength, and a product image per company; the images are drawn once with
+Pillow, so a large catalog shares a handful of files (run
+``build_image_variants`` afterwards for the resized copies). Customers
+share one password hash, computed once.
+
+Orders follow the shape of a pharmacy's history: popularity is Zipf-like,
+so a few hundred medicines make up most lines; most orders have one to
+three lines of one or two units; order times spread over the last
+``days`` days, busier in the daytime.
+
+Everything is written with ``bulk_create`` in one transaction. The search
+index and the sales rollups are then rebuilt in one pass each.
+"""
+import io
+import itertools
+import random
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from . import catalog_cache, rollups, search_index
+from .models import Medicine, Order, OrderItem
+
+INGREDIENTS = [
+    'Paracetamol', 'Ibuprofen', 'Amoxicillin', 'Clavulanic Acid', 'Cetirizine', 'Azithromycin',
+    'Metformin', 'Atorvastatin', 'Amlodipine', 'Pantoprazole', 'Omeprazole', 'Losartan',
+    'Diclofenac', 'Caffeine', 'Levocetirizine', 'Montelukast', 'Domperidone', 'Ranitidine',
+    'Ciprofloxacin', 'Vitamin C', 'Zinc', 'Calcium Carbonate', 'Vitamin D3', 'Aceclofenac',
+]
+BRAND_PARTS = ['Cro', 'Dol', 'Comb', 'Pan', 'Azi', 'Glu', 'Ator', 'Amlo', 'Cet', 'Mon', 'Lev', 'Zin', 'Cal', 'Ome', 'Dic']
+BRAND_SUFFIXES = ['cin', 'o', 'iflam', 'tra', 'thral', 'cophage', 'va', 'dac', 'zine', 'tair', 'ocet', 'covit', 'pol', 'fen']
+COMPANIES = ['GSK', 'Micro Labs', 'Sanofi', 'Cipla', 'Sun Pharma', 'Alkem', 'Mankind', 'Lupin', 'Zydus', 'Torrent']
+STRENGTHS = ['5mg', '10mg', '20mg', '40mg', '250mg', '500mg', '650mg', '1g']
+
+# (value, weight)
+LINES_PER_ORDER = ((1, 40), (2, 25), (3, 15), (4, 10), (5, 6), (6, 4))
+UNITS_PER_LINE = ((1, 60), (2, 20), (3, 10), (4, 5), (5, 3), (10, 2))
+HOUR_WEIGHTS = (1, 1, 1, 1, 1, 2, 4, 6, 8, 10, 12, 12, 11, 10, 10, 10, 11, 12, 13, 12, 10, 7, 4, 2)
+ZIPF_EXPONENT = 1.1
+BATCH_SIZE = 5000
+IMAGE_DIR = 'medicines/seed'
+
+
+def synthetic_medicine(i, rng):
+    """An unsaved ``Medicine`` with plausible name, salts and strength."""
+    salts = rng.sample(INGREDIENTS, rng.choice([1, 1, 2, 3]))
+    strength = rng.choice(STRENGTHS)
+    return Medicine(
+        name=f'{rng.choice(BRAND_PARTS)}{rng.choice(BRAND_SUFFIXES)} {rng.choice(["", "Plus", "Forte", "SR", "Advance"])}'.strip(),
+        components=', '.join(f'{salt} {strength}' for salt in salts),
+        product_number=f'SYN-{i:08d}',
+        quantity=rng.randint(0, 500),
+        company_name=rng.choice(COMPANIES),
+        power=strength,
+        price=Decimal(rng.randint(100, 50000)) / 100,
+        image='medicines/dummpy.jpeg',
+    )
+
+
+def company_image(company, rng):
+    """Storage name of the placeholder pack shot for ``company``, drawing it if needed."""
+    name = f'{IMAGE_DIR}/{company.lower().replace(" ", "-")}.jpg'
+    if not default_storage.exists(name):
+        color = tuple(rng.randint(40, 200) for _ in range(3))
+        image = Image.new('RGB', (640, 640), (245, 247, 250))
+        draw = ImageDraw.Draw(image)
+        draw.rounded_rectangle((120, 180, 520, 460), radius=40, fill=color)
+        draw.text((150, 300), company, fill='white', font_size=48)
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=85)
+        name = default_storage.save(name, ContentFile(buffer.getvalue()))
+    return name
+
+
+@dataclass
+class SeedResult:
+    medicines: int = 0
+    users: int = 0
+    orders: int = 0
+    order_lines: int = 0
+
+
+def seed_medicines(count, rng):
+    offset = Medicine.objects.filter(product_number__startswith='SYN-').count()
+    images = {company: company_image(company, rng) for company in COMPANIES}
+    for start in range(offset, offset + count, BATCH_SIZE):
+        batch = [synthetic_medicine(i, rng) for i in range(start, min(offset + count, start + BATCH_SIZE))]
+        for medicine in batch:
+            medicine.image = images[medicine.company_name]
+        Medicine.objects.bulk_create(batch, batch_size=BATCH_SIZE)
+
+
+def seed_users(count, password):
+    offset = User.objects.filter(username__startswith='customer').count()
+    hashed = make_password(password)
+    User.objects.bulk_create([
+        User(username=f'customer{i:06d}', email=f'customer{i:06d}@example.com', password=hashed)
+        for i in range(offset, offset + count)
+    ], batch_size=BATCH_SIZE)
+
+
+def seed_orders(count, days, rng):
+    """``count`` completed orders from existing customers over the last ``days`` days."""
+    users = list(User.objects.filter(is_staff=False).values_list('pk', flat=True))
+    medicines = list(Medicine.objects.values_list('pk', 'price'))
+    if not users or not medicines:
+        return 0
+    rng.shuffle(medicines)
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) ** ZIPF_EXPONENT for rank in range(len(medicines))))
+    line_counts, line_weights = zip(*LINES_PER_ORDER)
+    units, unit_weights = zip(*UNITS_PER_LINE)
+    now = timezone.now()
+
+    lines_written = 0
+    for start in range(0, count, BATCH_SIZE):
+        orders, baskets = [], []
+        for _ in range(min(BATCH_SIZE, count - start)):
+            picks = {
+                pk: price for pk, price in
+                rng.choices(medicines, cum_weights=cum_weights, k=rng.choices(line_counts, line_weights)[0])
+            }
+            basket = [(pk, price, rng.choices(units, unit_weights)[0]) for pk, price in picks.items()]
+            total = sum(price * quantity for _, price, quantity in basket)
+            orders.append(Order(user_id=rng.choice(users), total_amount=total, final_amount=total, is_completed=True))
+            baskets.append(basket)
+        Order.objects.bulk_create(orders, batch_size=BATCH_SIZE)
+
+        # order_date is auto_now_add, so the spread-out dates go in afterwards
+        for order in orders:
+            order.order_date = (now - timedelta(days=rng.randrange(days))).replace(
+                hour=rng.choices(range(24), HOUR_WEIGHTS)[0], minute=rng.randrange(60), second=rng.randrange(60),
+            )
+            if order.order_date > now:
+                order.order_date -= timedelta(days=1)
+        Order.objects.bulk_update(orders, ['order_date'], batch_size=1000)
+
+        items = [
+            OrderItem(order=order, medicine_id=pk, quantity=quantity, price=price)
+            for order, basket in zip(orders, baskets) for pk, price, quantity in basket
+        ]
+        OrderItem.objects.bulk_create(items, batch_size=BATCH_SIZE)
+        lines_written += len(items)
+    return lines_written
+
+
+def seed(medicines=0, users=0, orders=0, days=365, seed=0, password='password'):
+    """Add the given numbers of medicines, customers and orders; returns a ``SeedResult``."""
+    rng = random.Random(seed)
+    result = SeedResult(medicines=medicines, users=users)
+    with transaction.atomic():
+        if medicines:
+            seed_medicines(medicines, rng)
+        if users:
+            seed_users(users, password)
+        if orders:
+            result.order_lines = seed_orders(orders, days, rng)
+            result.orders = orders if result.order_lines else 0
+        if medicines:
+            search_index.rebuild()
+            transaction.on_commit(catalog_cache.invalidate)
+        if result.orders:
+            rollups.rebuild()
+    return result
@@ -0,0 +1,97 @@
+"""
+Serializers for the read-only catalog API (see api.py).
+
+``MedicineFeedSerializer`` is written by hand for throughput: every field
+is a plain getter picked once per serializer, and a medicine is serialized
+by one dict comprehension over the requested fields. ``ModelSerializer``
+instead runs a ``Field`` object with its own attribute lookup, validators
+and type coercion per attribute per object. Output matches what a
+``ModelSerializer`` of the same fields would produce: decimals as strings,
+datetimes as ISO 8601 in the current time zone with ``Z`` for UTC.
+"""
+from operator import attrgetter
+
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.utils import timezone
+from django.utils.encoding import filepath_to_uri
+from rest_framework import serializers
+
+from . import listing
+
+
+def _datetime(name):
+    get = attrgetter(name)
+
+    def to_representation(medicine):
+        value = get(medicine).astimezone(timezone.get_current_timezone()).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return to_representation
+
+
+def media_url(name):
+    """``default_storage.url(name)``, without its ``urljoin`` for local media."""
+    if isinstance(default_storage, FileSystemStorage):
+        return default_storage.base_url + filepath_to_uri(name).lstrip('/')
+    return default_storage.url(name)
+
+
+def _image_url(variant):
+    """``images.variant_url`` for the feed, which calls it twice per medicine."""
+    def to_representation(medicine):
+        # The raw value: the descriptor builds a new FieldFile on every access
+        image = medicine.__dict__['image']
+        name = getattr(image, 'name', image)
+        if not name:
+            return ''
+        variants = medicine.image_variants or {}
+        if variants.get('source') == name and variant in variants:
+            name = variants[variant]['jpg']
+        return media_url(name)
+    return to_representation
+
+
+# field name: (model fields to load, getter)
+FIELDS = {
+    'id': (('id',), attrgetter('id')),
+    'name': (('name',), attrgetter('name')),
+    'components': (('components',), attrgetter('components')),
+    'product_number': (('product_number',), attrgetter('product_number')),
+    'company_name': (('company_name',), attrgetter('company_name')),
+    'power': (('power',), attrgetter('power')),
+    'price': (('price',), lambda m: str(m.price)),
+    'quantity': (('quantity',), attrgetter('quantity')),
+    'stock': (('quantity',), lambda m: listing.stock_status(m.quantity)),
+    'image_url': (('image', 'image_variants'), _image_url('medium')),
+    'thumbnail_url': (('image', 'image_variants'), _image_url('thumb')),
+    'version': (('version',), attrgetter('version')),
+    'created_at': (('created_at',), _datetime('created_at')),
+    'updated_at': (('updated_at',), _datetime('updated_at')),
+}
+DEFAULT_FIELDS = tuple(FIELDS)
+
+
+def parse_fields(value):
+    """The field names of a ``?fields=`` parameter; raises ``ValueError`` for unknown ones."""
+    if not value:
+        return DEFAULT_FIELDS
+    names = list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in names if name not in FIELDS]
+    if unknown:
+        raise ValueError(f'Unknown field(s): {", ".join(unknown)}. Available: {", ".join(FIELDS)}')
+    return tuple(names) or DEFAULT_FIELDS
+
+
+def model_fields(names):
+    """Columns to pass to ``only()`` for serializing ``names``."""
+    return list(dict.fromkeys(column for name in names for column in FIELDS[name][0]))
+
+
+class MedicineFeedSerializer(serializers.BaseSerializer):
+    """Read-only ``Medicine`` serializer limited to ``fields`` (default: all)."""
+
+    def __init__(self, *args, fields=DEFAULT_FIELDS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.getters = [(name, FIELDS[name][1]) for name in fields]
+
+    def to_representation(self, instance):
+        return {name: get(instance) for name, get in self.getters}
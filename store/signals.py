@@ -0,0 +1,67 @@
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import auth, cart, catalog_cache, rollups, search_index
+from .models import Medicine, Order, OrderItem
+
+
+INDEXED_FIELDS = {'name', 'components', 'power'}
+
+
+@receiver(post_save, sender=Medicine)
+def reindex_medicine(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Keep the ingredient/trigram search index in step with saved medicines."""
+    if raw or (update_fields is not None and not INDEXED_FIELDS & set(update_fields)):
+        return
+    search_index.index_medicine(instance)
+
+
+@receiver(post_save, sender=Medicine)
+@receiver(post_delete, sender=Medicine)
+def invalidate_catalog_cache(sender, instance, raw=False, **kwargs):
+    """Re-render the medicine's card and the home grid on the next request."""
+    if not raw:
+        catalog_cache.invalidate()
+
+
+@receiver(pre_delete, sender=Order)
+def note_deleted_order(sender, instance, **kwargs):
+    rollups.deleting_order(instance)
+
+
+@receiver(pre_delete, sender=Medicine)
+def note_deleted_medicine(sender, instance, **kwargs):
+    rollups.deleting_lines(OrderItem.objects.filter(medicine=instance))
+
+
+@receiver(post_delete, sender=Order)
+@receiver(post_delete, sender=Medicine)
+def update_sales_rollups(sender, instance, **kwargs):
+    """Recompute the daily rollups of the days a deletion took order lines from.
+
+    Django sends every ``pre_delete`` of a delete before any ``post_delete``,
+    so the first one recomputes each day once however many orders went.
+    """
+    rollups.rebuild_deleted()
+
+
+@receiver(user_logged_in)
+def merge_anonymous_cart(sender, request, user, **kwargs):
+    """Fold the cart built before logging in into the user's own cart."""
+    if request is None or not hasattr(request, 'session'):
+        return
+    source_id = request.session.get(cart.SESSION_KEY)
+    if source_id is not None:
+        request.session[cart.SESSION_KEY] = cart.merge_carts(source_id, user)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    """Reload the user from the database on their next request."""
+    auth.forget(instance.pk)
+    # Again once committed, in case a request cached the old row in between
+    transaction.on_commit(lambda: auth.forget(instance.pk))
@@ -0,0 +1,33 @@
+from django import template
+from django.utils.html import format_html
+
+from store import images
+
+register = template.Library()
+
+
+@register.simple_tag
+def medicine_picture(medicine, sizes='100vw', variant='medium', css_class='', style=''):
+    """A ``<picture>`` with WebP and JPEG ``srcset``s of the medicine's derivatives.
+
+    Falls back to a plain ``<img>`` of the original until derivatives exist.
+    """
+    if not images.variants_for(medicine):
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" style="{}" loading="lazy">',
+            medicine.image.url if medicine.image else '', medicine.name, css_class, style,
+        )
+    return format_html(
+        '<picture style="display: contents">'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" style="{}" loading="lazy">'
+        '</picture>',
+        images.srcset(medicine, 'webp'), sizes,
+        images.variant_url(medicine, variant), images.srcset(medicine, 'jpg'), sizes,
+        medicine.name, css_class, style,
+    )
+
+
+@register.filter
+def thumbnail_url(medicine):
+    return images.variant_url(medicine, 'thumb')
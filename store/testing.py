@@ -0,0 +1,70 @@
+"""
+Helpers shared by store/tests.py and the benchmark command.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class StubFDAServer:
+    """A local stand-in for api.fda.gov/drug/label.json.
+
+    ``labels`` maps a brand name to the label result returned for it; any
+    other name gets a 404 like the real API. ``delay`` adds latency to every
+    response. Use as a context manager; ``url`` is the endpoint to put in
+    ``FDA_API_URL``.
+    """
+
+    def __init__(self, labels=None, delay=0.0):
+        self.labels = labels or {}
+        self.delay = delay
+        self.hits = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}/drug/label.json'
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with stub._lock:
+                    stub.hits += 1
+                if stub.delay:
+                    time.sleep(stub.delay)
+                search = parse_qs(urlparse(self.path).query).get('search', [''])[0]
+                name = search.split(':', 1)[-1].strip('"')
+                if name in stub.labels:
+                    status, body = 200, {'results': [stub.labels[name]]}
+                else:
+                    status, body = 404, {'error': {'code': 'NOT_FOUND'}}
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                try:
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client gave up waiting
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
@@ -1,3 +1,1484 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import Count, F
+from django.contrib.sessions.models import Session
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+import numpy as np
+from PIL import Image
+from rest_framework import serializers
+
+from . import (
+    auth, benchmarks, cart, catalog_cache, exports, fda, forecasting, images, instrumentation, jobs, listing,
+    orders, rollups, routers, search, search_index,
+)
+from .models import (
+    Cart, CartItem, CatalogVersion, DailyCompanySales, DailyMedicineSales, DrugLabelCache, Job, Medicine, Order,
+    OrderItem,
+)
+from .serializers import MedicineFeedSerializer
+from .middleware import ReplicaPinningMiddleware
+from .testing import StubFDAServer
+
+GIF_BYTES = (
+    b'GIF89a\x01\x00\x01\x00\x00\x00\x00!\xf9\x04\x01\x00\x00\x00\x00'
+    b',\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;'
+)
+
+JOB_CALLS = []
+
+
+@jobs.job(max_attempts=2, backoff=60)
+def record_call(value, fail=False):
+    JOB_CALLS.append(value)
+    if fail:
+        raise ValueError(f'{value} failed')
+
+
+def use_temp_media(test):
+    """Point MEDIA_ROOT at a throwaway directory for the duration of ``test``."""
+    media_root = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+    settings_override = override_settings(MEDIA_ROOT=media_root)
+    settings_override.enable()
+    test.addCleanup(settings_override.disable)
+    return media_root
+
+
+def use_stub_fda(test, labels):
+    """Serve ``labels`` from a stub openFDA for the duration of ``test``; returns the stub."""
+    stub = StubFDAServer(labels).__enter__()
+    test.addCleanup(stub.__exit__, None, None, None)
+    settings_override = override_settings(FDA_API_URL=stub.url)
+    settings_override.enable()
+    test.addCleanup(settings_override.disable)
+    return stub
+
+
+def create_medicine(**kwargs):
+    defaults = {
+        'name': 'Crocin',
+        'components': 'Paracetamol',
+        'product_number': 'PN-1',
+        'quantity': 10,
+        'company_name': 'GSK',
+        'power': '500mg',
+        'price': Decimal('25.50'),
+        'image': 'medicines/dummpy.jpeg',
+    }
+    defaults.update(kwargs)
+    return Medicine.objects.create(**defaults)
+
+
+class DrugLabelCacheTests(TestCase):
+    labels = {
+        'Crocin': {
+            'description': ['Pain reliever'],
+            'indications_and_usage': ['Fever and headache'],
+            'warnings': ['Liver damage'],
+        },
+    }
+
+    def setUp(self):
+        self.stub = use_stub_fda(self, self.labels)
+
+    def test_normalize_name(self):
+        self.assertEqual(fda.normalize_name('  Crocin   Advance!! '), 'crocin advance')
+
+    def test_prefetch_labels_skips_fresh_entries(self):
+        create_medicine()
+        create_medicine(name='Unknownol', product_number='PN-2')
+        call_command('prefetch_labels', concurrency=2, stdout=mock.MagicMock())
+        self.assertEqual(DrugLabelCache.objects.count(), 2)
+        self.assertEqual(self.stub.hits, 2)
+
+        call_command('prefetch_labels', stdout=mock.MagicMock())
+        self.assertEqual(self.stub.hits, 2)
+
+
+class DrugLabelLookupTests(TransactionTestCase):
+    """Label lookups and the pages that make them; lookups write the cache from their own threads, so these tests commit."""
+    # Reads go to any replicas, which mirror the test database
+    databases = '__all__'
+
+    def setUp(self):
+        self.stub = use_stub_fda(self, DrugLabelCacheTests.labels)
+
+    def wait_for_label(self, key):
+        deadline = time.monotonic() + 5
+        while not DrugLabelCache.objects.filter(key=key).exists():
+            self.assertLess(time.monotonic(), deadline, f'{key} was never cached')
+            time.sleep(0.05)
+
+    def lookup(self, name):
+        """The label as the views get it, with a budget the stub always meets."""
+        info, pending = async_to_sync(fda.aget_label_info_within)(name, 5)
+        self.assertFalse(pending)
+        return info
+
+    def test_found_label_is_cached(self):
+        info = self.lookup('Crocin')
+        self.assertEqual(info['description'], 'Pain reliever')
+        self.assertEqual(info['side_effects'], 'Liver damage')
+        self.assertEqual(info['precautions'], 'Liver damage')
+
+        self.assertEqual(self.lookup('crocin '), info)
+        self.assertEqual(self.stub.hits, 1)
+        self.assertTrue(DrugLabelCache.objects.get(key='crocin').found)
+
+    def test_missing_label_is_negatively_cached(self):
+        info = self.lookup('Unknownol')
+        self.assertEqual(info, fda.default_label_info())
+        self.lookup('Unknownol')
+        self.assertEqual(self.stub.hits, 1)
+
+        entry = DrugLabelCache.objects.get(key='unknownol')
+        self.assertFalse(entry.found)
+        self.assertLess(entry.expires_at, timezone.now() + timedelta(seconds=fda.settings.FDA_LABEL_TTL))
+
+    def test_stale_entry_is_served_while_revalidating(self):
+        self.lookup('Crocin')
+        DrugLabelCache.objects.update(
+            info={'description': 'old'}, expires_at=timezone.now() - timedelta(seconds=5)
+        )
+
+        with mock.patch.object(fda, '_refresh_in_background') as refresh:
+            self.assertEqual(self.lookup('Crocin'), {'description': 'old'})
+        refresh.assert_called_once_with('crocin', 'Crocin')
+
+    def test_expired_entry_is_refetched(self):
+        self.lookup('Crocin')
+        DrugLabelCache.objects.update(
+            info={'description': 'old'}, expires_at=timezone.now() - timedelta(days=30)
+        )
+        self.assertEqual(self.lookup('Crocin')['description'], 'Pain reliever')
+        self.assertEqual(self.stub.hits, 2)
+
+    def test_detail_page_uses_cache(self):
+        medicine = create_medicine()
+        url = reverse('medicine_detail', args=[medicine.id])
+        self.assertContains(self.client.get(url), 'Fever and headache')
+        self.assertContains(self.client.get(url), 'Fever and headache')
+        self.assertEqual(self.stub.hits, 1)
+
+    def test_detail_page_renders_placeholders_when_budget_expires(self):
+        medicine = create_medicine()
+        self.stub.delay = 0.5
+        with override_settings(FDA_LABEL_BUDGET=0.01):
+            response = self.client.get(reverse('medicine_detail', args=[medicine.id]))
+        self.assertTrue(response.context['label_pending'])
+        self.assertContains(response, reverse('medicine_label', args=[medicine.id]))
+        self.assertNotContains(response, 'Fever and headache')
+
+        # The lookup outlives the request and fills the cache
+        self.wait_for_label('crocin')
+        data = self.client.get(reverse('medicine_label', args=[medicine.id])).json()
+        self.assertEqual((data['pending'], data['medicine_info']['uses']), (False, 'Fever and headache'))
+        self.assertEqual(self.stub.hits, 1)
+
+    def test_label_endpoint_waits_within_the_budget(self):
+        medicine = create_medicine()
+        self.stub.delay = 0.5
+        with override_settings(FDA_LABEL_BUDGET=0.01):
+            data = self.client.get(reverse('medicine_label', args=[medicine.id])).json()
+        self.assertTrue(data['pending'])
+        self.wait_for_label('crocin')
+
+    def test_label_endpoint_returns_info(self):
+        medicine = create_medicine()
+        response = self.client.get(reverse('medicine_label', args=[medicine.id]))
+        self.assertEqual(response.json()['medicine_info']['uses'], 'Fever and headache')
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.crocin = create_medicine(name='Crocin Advance', components='Paracetamol 500mg')
+        self.dolo = create_medicine(name='Dolo', components='Paracetamol 650mg', product_number='PN-2', company_name='Micro Labs')
+        self.combiflam = create_medicine(name='Combiflam', components='Ibuprofen, Paracetamol', product_number='PN-3')
+
+    def names(self, query):
+        return [m.name for m in search.search_medicines(query)[:10]]
+
+    def test_prefix_match_ranks_name_hits_first(self):
+        self.assertEqual(len(self.names('paracet')), 3)
+        self.assertEqual(self.names('croc'), ['Crocin Advance'])
+        self.assertEqual(self.names('micro'), ['Dolo'])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.dolo.name = 'Dolopar'
+        self.dolo.save()
+        self.assertEqual(self.names('dolopar'), ['Dolopar'])
+        self.combiflam.delete()
+        self.assertEqual(self.names('ibuprofen'), [])
+
+    def test_bulk_updates_are_indexed(self):
+        Medicine.objects.filter(pk=self.crocin.pk).update(components='Caffeine')
+        self.assertEqual(self.names('caffeine'), ['Crocin Advance'])
+
+    def test_punctuation_only_query(self):
+        self.assertEqual(self.names('"*'), [])
+
+    def test_home_search_is_paginated(self):
+        for i in range(30):
+            create_medicine(name=f'Paracip {i}', product_number=f'PX-{i}')
+        response = self.client.get(reverse('home'), {'q': 'paracip'})
+        self.assertEqual(len(response.context['medicines']), 24)
+        self.assertEqual(response.context['page_obj'].paginator.count, 30)
+        response = self.client.get(reverse('home'), {'q': 'paracip', 'page': 2})
+        self.assertEqual(len(response.context['medicines']), 6)
+
+    def test_suggest_endpoint(self):
+        response = self.client.get(reverse('search_suggest'), {'q': 'com'})
+        self.assertEqual([r['name'] for r in response.json()['results']], ['Combiflam'])
+
+    def test_rebuild_command(self):
+        call_command('rebuild_search_index', stdout=mock.MagicMock())
+        self.assertEqual(self.names('dolo'), ['Dolo'])
+
+
+class SearchIndexTests(TestCase):
+    def setUp(self):
+        self.crocin = create_medicine(name='Crocin Advance', components='Paracetamol IP 500mg')
+        self.dolo = create_medicine(name='Dolo 650', components='Paracetamol', power='650 mg', product_number='PN-2')
+        self.augmentin = create_medicine(
+            name='Augmentin', components='Amoxicillin 0.5g + Clavulanic Acid 125mg', product_number='PN-3'
+        )
+
+    def names(self, query):
+        return [m.name for m in search.search_medicines(query)[:10]]
+
+    def test_parse_components(self):
+        self.assertEqual(
+            search_index.parse_components('Amoxicillin 0.5g + Clavulanic Acid (125 mg)'),
+            [('amoxicillin', Decimal('500'), 'mg'), ('clavulanic acid', Decimal('125'), 'mg')],
+        )
+        self.assertEqual(search_index.parse_components('Paracetamol', '650 mg'), [('paracetamol', Decimal('650'), 'mg')])
+
+    def test_ingredient_at_strength(self):
+        self.assertEqual(self.names('paracetamol 500'), ['Crocin Advance'])
+        self.assertEqual(self.names('paracetamol 650mg'), ['Dolo 650'])
+        self.assertEqual(self.names('amoxicillin 500mg'), ['Augmentin'])
+
+    def test_misspelled_ingredient(self):
+        self.assertEqual(self.names('paracetmol 500'), ['Crocin Advance'])
+        self.assertEqual(self.names('amoxycillin'), ['Augmentin'])
+        # Only ingredients with the same first letter and a length that could match are compared
+        self.assertEqual(search_index._close_vocabulary('amoxycillin'), ['amoxicillin'])
+        self.assertEqual(search_index._close_vocabulary('paracetmol'), ['paracetamol'])
+
+    def test_misspelled_name(self):
+        self.assertEqual(self.names('augmentn'), ['Augmentin'])
+        self.assertEqual(self.names('crocn'), ['Crocin Advance'])
+
+    def test_index_follows_saves(self):
+        self.dolo.components = 'Ibuprofen 400mg'
+        self.dolo.save()
+        self.assertEqual(self.names('ibuprofen 400'), ['Dolo 650'])
+        self.assertFalse(self.dolo.ingredients.filter(ingredient='paracetamol').exists())
+
+    def test_api_add_medicine_is_indexed(self):
+        use_temp_media(self)
+        staff = User.objects.create_user('staff', password='pw', is_staff=True)
+        self.client.force_login(staff)
+        image = SimpleUploadedFile('p.gif', GIF_BYTES, content_type='image/gif')
+        response = self.client.post(reverse('api_add_medicine'), {
+            'name': 'Cetzine', 'components': 'Cetirizine 10mg', 'product_number': 'PN-9',
+            'quantity': 5, 'company_name': 'GSK', 'power': '10mg', 'price': '12.00', 'image': image,
+        })
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.names('cetrizine 10mg'), ['Cetzine'])
+
+
+class CartTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='pw')
+        self.client.force_login(self.user)
+        self.medicines = [
+            create_medicine(name=f'Med {i}', product_number=f'PN-{i}', quantity=50, price=Decimal('2.50'))
+            for i in range(30)
+        ]
+
+    def fill_cart(self, medicines, quantity=2):
+        user_cart, _ = Cart.objects.get_or_create(user=self.user)
+        CartItem.objects.filter(cart=user_cart).delete()
+        CartItem.objects.bulk_create([CartItem(cart=user_cart, medicine=m, quantity=quantity) for m in medicines])
+        session = self.client.session
+        session[cart.SESSION_KEY] = user_cart.id
+        session.save()
+        return user_cart
+
+    def test_cart_view_query_count_is_constant(self):
+        # session + user + one bulk medicine lookup
+        self.fill_cart(self.medicines[:1])
+        with self.assertNumQueries(3):
+            self.client.get(reverse('cart_view'))
+
+        self.fill_cart(self.medicines)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('cart_view'))
+        self.assertEqual(len(response.context['cart_items']), 30)
+        self.assertEqual(response.context['total'], Decimal('150.00'))
+
+    def test_checkout_page_query_count_is_constant(self):
+        self.fill_cart(self.medicines)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('checkout'))
+        self.assertEqual(response.context['total'], Decimal('150.00'))
+
+    def test_deleted_medicines_leave_the_cart(self):
+        self.fill_cart(self.medicines[:3])
+        self.medicines[1].delete()
+        response = self.client.get(reverse('cart_view'))
+        self.assertEqual([line.medicine for line in response.context['cart_items']], [self.medicines[0], self.medicines[2]])
+
+    def test_prices_are_live(self):
+        self.fill_cart(self.medicines[:1], quantity=4)
+        Medicine.objects.filter(pk=self.medicines[0].pk).update(price=Decimal('3.00'))
+        response = self.client.get(reverse('cart_view'))
+        self.assertEqual(response.context['total'], Decimal('12.00'))
+
+    def test_cart_changes_do_not_write_the_session(self):
+        medicine = self.medicines[0]
+        self.client.post(reverse('add_to_cart', args=[medicine.id]))
+        session_key = self.client.session.session_key
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('add_to_cart', args=[medicine.id]))
+            self.client.post(reverse('update_cart', args=[medicine.id]), {'quantity': '5'})
+        session_writes = [q for q in queries if 'django_session' in q['sql'] and not q['sql'].startswith('SELECT')]
+        self.assertEqual(session_writes, [])
+        self.assertEqual(CartItem.objects.get(medicine=medicine).quantity, 5)
+        self.assertEqual(self.client.session.session_key, session_key)
+
+    def test_legacy_session_cart_is_imported(self):
+        session = self.client.session
+        session['cart'] = {str(self.medicines[0].id): {'name': 'x', 'price': '1.00', 'quantity': 3, 'image': ''}}
+        session.save()
+        response = self.client.get(reverse('cart_view'))
+        self.assertEqual(response.context['cart_items'][0].quantity, 3)
+        self.assertNotIn('cart', self.client.session)
+
+    def test_anonymous_cart_is_merged_at_login(self):
+        self.fill_cart(self.medicines[:1], quantity=1)
+        anonymous = Cart.objects.create()
+        CartItem.objects.create(cart=anonymous, medicine=self.medicines[0], quantity=2)
+        CartItem.objects.create(cart=anonymous, medicine=self.medicines[1], quantity=1)
+        self.client.logout()
+        session = self.client.session
+        session[cart.SESSION_KEY] = anonymous.id
+        session.save()
+
+        self.client.post(reverse('login'), {'username': 'buyer', 'password': 'pw'})
+        response = self.client.get(reverse('cart_view'))
+        self.assertEqual([(line.medicine, line.quantity) for line in response.context['cart_items']],
+                         [(self.medicines[0], 3), (self.medicines[1], 1)])
+        self.assertFalse(Cart.objects.filter(pk=anonymous.pk).exists())
+
+    def test_add_and_update(self):
+        medicine = self.medicines[0]
+        self.client.post(reverse('add_to_cart', args=[medicine.id]))
+        self.client.post(reverse('add_to_cart', args=[medicine.id]))
+        self.assertEqual(CartItem.objects.get(medicine=medicine).quantity, 2)
+
+        self.client.post(reverse('update_cart', args=[medicine.id]), {'quantity': '51'})
+        self.assertEqual(CartItem.objects.get(medicine=medicine).quantity, 2)
+        self.client.post(reverse('update_cart', args=[medicine.id]), {'quantity': '0'})
+        self.assertFalse(CartItem.objects.filter(medicine=medicine).exists())
+
+    def test_cart_totals(self):
+        line = cart.CartLine(medicine=self.medicines[0], quantity=3, price=Decimal('2.50'))
+        self.assertEqual(cart.Cart(lines=[line, line]).total, Decimal('15.00'))
+
+    async def test_cart_over_asgi(self):
+        # The async cart views, through the ASGI handler
+        await self.async_client.aforce_login(self.user)
+        medicine = self.medicines[0]
+        response = await self.async_client.post(reverse('add_to_cart', args=[medicine.id]))
+        self.assertRedirects(response, reverse('cart_view'), fetch_redirect_response=False)
+        await self.async_client.post(reverse('add_to_cart', args=[medicine.id]))
+        await self.async_client.post(reverse('update_cart', args=[self.medicines[1].id]), {'quantity': '3'})
+
+        response = await self.async_client.get(reverse('cart_view'))
+        self.assertEqual([(line.medicine.pk, line.quantity) for line in response.context['cart_items']], [(medicine.pk, 2)])
+        self.assertContains(response, 'Med 0 added to cart!')
+
+        await self.async_client.post(reverse('remove_from_cart', args=[medicine.id]))
+        response = await self.async_client.get(reverse('cart_view'))
+        self.assertEqual(response.context['cart_items'], [])
+
+
+class PlaceOrderTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='pw')
+        self.a = create_medicine(name='A', product_number='PN-A', quantity=5, price=Decimal('10.00'))
+        self.b = create_medicine(name='B', product_number='PN-B', quantity=1, price=Decimal('4.00'))
+
+    def lines(self, *items):
+        return [cart.CartLine(medicine=m, quantity=q, price=m.price) for m, q in items]
+
+    def test_order_is_placed_and_stock_taken(self):
+        result = orders.place_order(self.user, self.lines((self.b, 1), (self.a, 2)), Decimal('10'))
+        self.assertTrue(result.ok)
+        self.assertEqual(result.order.total_amount, Decimal('24.00'))
+        self.assertEqual(result.order.final_amount, Decimal('21.60'))
+        self.assertEqual(result.order.items.count(), 2)
+        self.a.refresh_from_db()
+        self.b.refresh_from_db()
+        self.assertEqual((self.a.quantity, self.b.quantity), (3, 0))
+
+    def test_shortfall_rolls_back_every_line(self):
+        # Someone else bought B after this cart was loaded
+        Medicine.objects.filter(pk=self.b.pk).update(quantity=0)
+        result = orders.place_order(self.user, self.lines((self.a, 2), (self.b, 1)))
+        self.assertFalse(result.ok)
+        self.assertEqual(result.shortfalls, [orders.Shortfall(self.b.pk, 'B', requested=1, available=0)])
+        self.a.refresh_from_db()
+        self.assertEqual(self.a.quantity, 5)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+
+    def test_checkout_view_reports_shortfall(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('add_to_cart', args=[self.b.id]))
+        Medicine.objects.filter(pk=self.b.pk).update(quantity=0)
+        response = self.client.post(reverse('checkout'), follow=True)
+        self.assertContains(response, 'Not enough stock for B')
+
+    def test_checkout_view_places_order(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('add_to_cart', args=[self.a.id]))
+        response = self.client.post(reverse('checkout'))
+        order = Order.objects.get()
+        self.assertRedirects(response, reverse('order_success', args=[order.id]))
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_cart_is_kept_when_the_order_rolls_back(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('add_to_cart', args=[self.a.id]))
+        # Fails after the cart was emptied, inside the order transaction
+        with mock.patch.object(orders.notify_low_stock, 'delay', side_effect=RuntimeError):
+            response = self.client.post(reverse('checkout'), follow=True)
+        self.assertContains(response, 'An error occurred during checkout')
+        self.assertFalse(Order.objects.exists())
+        self.assertTrue(CartItem.objects.exists())
+
+
+class OrderHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='pw')
+        self.client.force_login(self.user)
+        self.medicines = [create_medicine(name=f'Med {i}', product_number=f'PN-{i}') for i in range(3)]
+
+    def make_orders(self, count):
+        for _ in range(count):
+            order = Order.objects.create(user=self.user, total_amount=10, final_amount=10, is_completed=True)
+            OrderItem.objects.bulk_create([OrderItem(order=order, medicine=m, quantity=1, price=1) for m in self.medicines])
+
+    def test_profile_query_count_is_constant(self):
+        # session + user + cart badge + orders + prefetched items
+        self.make_orders(2)
+        with self.assertNumQueries(5):
+            self.client.get(reverse('profile'))
+        self.make_orders(40)
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('profile'))
+        self.assertEqual(len(response.context['orders']), orders.HISTORY_PAGE_SIZE)
+        self.assertContains(response, 'Med 2 (x1)')
+
+    async def test_history_over_asgi(self):
+        await sync_to_async(self.make_orders)(3)
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('profile'))
+        self.assertEqual(len(response.context['orders']), 3)
+        data = (await self.async_client.get(reverse('api_order_history'))).json()
+        self.assertEqual(len(data['orders']), 3)
+        self.assertIsNone(data['next_cursor'])
+
+    def test_keyset_pagination_visits_every_order_once(self):
+        self.make_orders(45)
+        Order.objects.create(user=self.user, total_amount=1, final_amount=1, is_completed=False)
+        seen, cursor = [], None
+        while True:
+            response = self.client.get(reverse('api_order_history'), {'cursor': cursor} if cursor else {})
+            data = response.json()
+            seen.extend(order['id'] for order in data['orders'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        expected = list(Order.objects.filter(is_completed=True).order_by('-order_date', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(data['orders'][0]['items']), 3)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('api_order_history'), {'cursor': 'nope'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(reverse('profile'), {'cursor': 'nope'}).status_code, 200)
+
+
+class IndexAdvisorTests(TestCase):
+    def test_canonical_queries_use_indexes(self):
+        call_command('index_advisor', fail_on_scan=True, stdout=mock.MagicMock())
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.medicine = create_medicine(name='Crocin', quantity=6)
+
+    def test_cached_home_reads_only_the_catalog_version(self):
+        self.client.get(reverse('home'))
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Crocin')
+        self.assertNotContains(response, catalog_cache.CSRF_PLACEHOLDER)
+        self.assertContains(response, 'name="csrfmiddlewaretoken"')
+
+    def test_staff_edits_show_immediately(self):
+        staff = User.objects.create_user('staff', password='pw', is_staff=True)
+        self.client.force_login(staff)
+        self.client.get(reverse('home'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('api_update_medicine', args=[self.medicine.id]), '{"name": "Crocin Advance"}',
+                             content_type='application/json')
+        self.assertContains(self.client.get(reverse('home')), 'Crocin Advance')
+
+        self.client.delete(reverse('api_delete_medicine', args=[self.medicine.id]))
+        self.assertNotContains(self.client.get(reverse('home')), 'Crocin')
+
+    def test_changes_from_other_processes_show_immediately(self):
+        self.client.get(reverse('home'))
+        # Another worker's edit: the database changes, this process's cache doesn't
+        Medicine.objects.filter(pk=self.medicine.pk).update(name='Crocin Advance', updated_at=timezone.now())
+        CatalogVersion.objects.update(version=F('version') + 1)
+        self.assertContains(self.client.get(reverse('home')), 'Crocin Advance')
+
+    def test_checkout_refreshes_stock_badge(self):
+        self.assertContains(self.client.get(reverse('home')), 'In Stock')
+        user = User.objects.create_user('buyer', password='pw')
+        with self.captureOnCommitCallbacks(execute=True):
+            orders.place_order(user, [cart.CartLine(medicine=self.medicine, quantity=6, price=self.medicine.price)])
+        self.assertContains(self.client.get(reverse('home')), 'Out of Stock')
+
+    def test_cards_are_rendered_from_the_primary(self):
+        # As read from a replica that hasn't seen the rename yet
+        lagging = Medicine.objects.get(pk=self.medicine.pk)
+        lagging.name = 'Old Name'
+        lagging._state.db = 'replica1'
+        html = catalog_cache.render_cards([lagging])
+        self.assertIn('Crocin', html)
+        self.assertNotIn('Old Name', html)
+
+    def test_warm_renders_the_home_grid_ahead_of_visitors(self):
+        self.client.get(reverse('home'))
+        catalog_cache.invalidate()
+        catalog_cache.warm([self.medicine.pk])
+        with self.assertNumQueries(1):  # the catalog version
+            self.assertContains(self.client.get(reverse('home')), 'Crocin')
+        # The in-process cache isn't worth warming from a separate worker
+        self.assertFalse(catalog_cache.shared())
+
+
+@mock.patch('store.fda.aget_label_info_within', new=mock.AsyncMock(return_value=({}, False)))
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.medicine = create_medicine(name='Crocin', quantity=6)
+        self.detail = reverse('medicine_detail', args=[self.medicine.id])
+
+    def revalidate(self, path, response, **extra):
+        return self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag'], **extra)
+
+    def test_unchanged_pages_are_not_modified(self):
+        for path in (reverse('home'), self.detail, reverse('search_suggest') + '?q=cro'):
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('public', response['Cache-Control'])
+            self.assertIn('Cookie', response['Vary'])
+            again = self.revalidate(path, response)
+            self.assertEqual(again.status_code, 304)
+            self.assertEqual(again.content, b'')
+            self.assertEqual(
+                self.client.get(path, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304,
+            )
+
+    def test_changes_are_sent_again(self):
+        home, detail = self.client.get(reverse('home')), self.client.get(self.detail)
+        user = User.objects.create_user('buyer', password='pw')
+        with self.captureOnCommitCallbacks(execute=True):
+            orders.place_order(user, [cart.CartLine(medicine=self.medicine, quantity=1, price=self.medicine.price)])
+        self.assertContains(self.revalidate(self.detail, detail), '5 available')
+        self.assertEqual(self.revalidate(reverse('home'), home).status_code, 200)
+
+        home = self.client.get(reverse('home'))
+        with self.captureOnCommitCallbacks(execute=True):
+            create_medicine(name='Dolo', product_number='PN-2')
+        self.assertContains(self.revalidate(reverse('home'), home), 'Dolo')
+
+        # Another worker's change reaches the database only, not this process's cache
+        home = self.client.get(reverse('home'))
+        CatalogVersion.objects.update(version=F('version') + 1)
+        self.assertEqual(self.revalidate(reverse('home'), home).status_code, 200)
+
+    def test_signed_in_pages_are_private_and_follow_the_cart(self):
+        self.client.force_login(User.objects.create_user('buyer', password='pw'))
+        response = self.client.get(self.detail)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertFalse(response.has_header('Last-Modified'))
+        self.assertEqual(self.revalidate(self.detail, response).status_code, 304)
+
+        self.client.post(reverse('add_to_cart', args=[self.medicine.id]))
+        # The message about the added item must not be swallowed by a 304
+        flashed = self.revalidate(self.detail, response)
+        self.assertContains(flashed, 'Crocin added to cart!')
+        self.assertFalse(flashed.has_header('ETag'))
+        self.assertEqual(self.revalidate(self.detail, response).status_code, 200)
+
+    def test_missing_medicine(self):
+        self.assertEqual(self.client.get(reverse('medicine_detail', args=[self.medicine.id + 1])).status_code, 404)
+
+
+def jpeg_bytes(size=(1200, 800)):
+    """A photo-like JPEG carrying EXIF metadata, as phones produce."""
+    exif = Image.Exif()
+    exif[0x010F] = 'PhoneMaker'  # Make
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(buffer, 'JPEG', exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        self.media_root = use_temp_media(self)
+        cache.clear()
+
+    def test_upload_builds_stripped_hashed_variants(self):
+        staff = User.objects.create_user('staff', password='pw', is_staff=True)
+        self.client.force_login(staff)
+        data = jpeg_bytes()
+        response = self.client.post(reverse('api_add_medicine'), {
+            'name': 'Cetzine', 'components': 'Cetirizine 10mg', 'product_number': 'PN-9', 'quantity': 5,
+            'company_name': 'GSK', 'power': '10mg', 'price': '12.00',
+            'image': SimpleUploadedFile('photo.jpg', data, content_type='image/jpeg'),
+        })
+        self.assertEqual(response.status_code, 200, response.content)
+
+        medicine = Medicine.objects.get(product_number='PN-9')
+        variants = images.variants_for(medicine)
+        self.assertEqual(variants['source'], medicine.image.name)
+        self.assertEqual((variants['thumb']['width'], variants['thumb']['height']), (200, 200))
+        self.assertEqual((variants['medium']['width'], variants['medium']['height']), (640, 427))
+        self.assertEqual(variants['medium']['webp'], f'medicines/derived/{images.content_hash(data)}-medium.webp')
+        with default_storage.open(variants['thumb']['jpg']) as f:
+            self.assertEqual(dict(Image.open(f).getexif()), {})
+
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, f'/media/{variants["thumb"]["webp"]} 200w')
+        self.assertContains(response, f'/media/{variants["medium"]["jpg"]} 640w')
+
+    def test_backfill_command(self):
+        os.makedirs(os.path.join(self.media_root, 'medicines'))
+        for name in ('a.jpg', 'b.jpg'):
+            with open(os.path.join(self.media_root, 'medicines', name), 'wb') as f:
+                f.write(jpeg_bytes())
+        a = create_medicine(image='medicines/a.jpg')
+        b = create_medicine(image='medicines/b.jpg', product_number='PN-2')
+        missing = create_medicine(image='medicines/missing.jpg', product_number='PN-3')
+        self.client.get(reverse('home'))
+
+        call_command('build_image_variants', workers=2, stdout=io.StringIO(), stderr=io.StringIO())
+
+        a.refresh_from_db()
+        b.refresh_from_db()
+        missing.refresh_from_db()
+        self.assertEqual(a.image_variants['thumb'], b.image_variants['thumb'])  # identical originals share files
+        self.assertTrue(default_storage.exists(a.image_variants['medium']['webp']))
+        self.assertEqual(missing.image_variants, {})
+        self.assertContains(self.client.get(reverse('home')), images.variant_url(a, 'medium'))
+
+
+class ProductListingTests(TestCase):
+    def setUp(self):
+        self.medicines = [
+            create_medicine(name=name, product_number=f'PN-{i}', quantity=quantity, price=Decimal(price),
+                            company_name=company)
+            for i, (name, quantity, price, company) in enumerate([
+                ('Crocin', 50, '25.00', 'GSK'), ('Dolo', 5, '30.00', 'Micro Labs'), ('Azithral', 0, '95.00', 'Alembic'),
+                ('Combiflam', 12, '30.00', 'Sanofi'), ('Pan', 0, '12.00', 'Alkem'), ('Zincovit', 200, '105.00', 'Apex'),
+                ('Benadryl', 3, '30.00', 'J&J'),
+            ])
+        ]
+        self.staff = User.objects.create_user('staff', password='pw', is_staff=True)
+
+    def walk(self, limit=2, **kwargs):
+        names, cursor = [], None
+        while True:
+            page, cursor = listing.medicine_page(cursor=cursor, limit=limit, **kwargs)
+            names.extend(m.name for m in page)
+            if cursor is None:
+                return names
+
+    def test_keyset_pages_cover_every_sort_without_gaps(self):
+        self.assertEqual(self.walk(sort='name'), sorted(m.name for m in self.medicines))
+        by_price = sorted(self.medicines, key=lambda m: (-m.price, -m.id))
+        self.assertEqual(self.walk(sort='-price'), [m.name for m in by_price])
+        self.assertEqual(self.walk(sort='newest'), [m.name for m in reversed(self.medicines)])
+
+    def test_filters_and_counts(self):
+        self.assertEqual(self.walk(sort='name', stock='out'), ['Azithral', 'Pan'])
+        self.assertEqual(self.walk(sort='name', stock='low'), ['Benadryl', 'Dolo'])
+        self.assertEqual(self.walk(sort='name', query='micro'), ['Dolo'])
+        self.assertEqual(self.walk(sort='name', query='PN-5'), ['Zincovit'])
+        with self.assertNumQueries(1):
+            self.assertEqual(listing.stock_counts(), {'total': 7, 'low_stock': 2, 'out_of_stock': 2})
+        with self.assertRaises(ValueError):
+            listing.medicine_page(sort='name', cursor=listing.encode_cursor('price', self.medicines[0]))
+
+    def test_api(self):
+        url = reverse('api_medicine_list')
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(self.staff)
+        data = self.client.get(url, {'sort': 'name', 'limit': 4}).json()
+        self.assertEqual([m['name'] for m in data['results']], ['Azithral', 'Benadryl', 'Combiflam', 'Crocin'])
+        self.assertEqual(data['results'][0]['stock'], 'out')
+        self.assertEqual(data['counts']['total'], 7)
+
+        data = self.client.get(url, {'sort': 'name', 'limit': 4, 'cursor': data['next_cursor']}).json()
+        self.assertEqual([m['name'] for m in data['results']], ['Dolo', 'Pan', 'Zincovit'])
+        self.assertIsNone(data['next_cursor'])
+        self.assertNotIn('counts', data)
+
+        self.assertEqual(self.client.get(url, {'cursor': 'garbage'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'sort': 'colour'}).status_code, 400)
+
+    def test_page_does_not_render_the_catalog(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('admin_product_management'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'Zincovit')
+        self.assertContains(response, reverse('api_medicine_list'))
+
+
+class BatchInventoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.crocin = create_medicine(name='Crocin', quantity=10, price=Decimal('25.50'))
+        self.dolo = create_medicine(name='Dolo', product_number='PN-2', quantity=4, price=Decimal('30.00'))
+        self.client.force_login(User.objects.create_user('staff', password='pw', is_staff=True))
+
+    def post(self, patches):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('api_batch_update_medicines'), patches, content_type='application/json')
+
+    def test_batch_applies_patches_with_bulk_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post([
+                {'id': self.crocin.id, 'quantity': 40, 'version': self.crocin.version},
+                {'product_number': 'PN-2', 'price': 12.35, 'quantity': '7'},
+            ])
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual([r['status'] for r in response.json()['results']], ['updated', 'updated'])
+        self.assertEqual(response.json()['results'][0]['version'], self.crocin.version + 1)
+        self.crocin.refresh_from_db()
+        self.dolo.refresh_from_db()
+        self.assertEqual((self.crocin.quantity, self.crocin.price), (40, Decimal('25.50')))
+        self.assertEqual((self.dolo.quantity, self.dolo.price), (7, Decimal('12.35')))
+        # one UPDATE per group of patched fields, not one per medicine
+        updates = [q for q in queries if q['sql'].startswith('UPDATE "store_medicine" SET "price"') or
+                   q['sql'].startswith('UPDATE "store_medicine" SET "quantity"')]
+        self.assertEqual(len(updates), 2)
+
+    def test_invalid_patch_rejects_whole_batch(self):
+        response = self.post([
+            {'id': self.crocin.id, 'quantity': 40},
+            {'id': self.dolo.id, 'price': '-1'},
+            {'product_number': 'NOPE', 'quantity': 1},
+            {'id': self.crocin.id, 'colour': 'red'},
+            {'id': self.dolo.id, 'quantity': 40.5},
+            {'id': [self.dolo.id], 'quantity': 3},
+            {'product_number': {'PN': 2}, 'quantity': 3},
+        ])
+        self.assertEqual(response.status_code, 400)
+        results = response.json()['results']
+        self.assertEqual([r['status'] for r in results], ['updated'] + ['error'] * 6)
+        self.assertIn('Medicine not found', results[2]['errors'])
+        self.assertIn('quantity: must be a whole number', results[4]['errors'])
+        self.assertEqual(results[5]['errors'], ['id must be an integer'])
+        self.assertEqual(results[6]['errors'], ['product_number must be a string'])
+        self.crocin.refresh_from_db()
+        self.assertEqual(self.crocin.quantity, 10)
+
+    def test_stale_version_is_a_conflict(self):
+        read_version = self.crocin.version
+        self.crocin.name = 'Crocin Advance'
+        self.crocin.save()  # another admin's edit bumps the version
+        response = self.post([
+            {'id': self.dolo.id, 'quantity': 1, 'version': self.dolo.version},
+            {'id': self.crocin.id, 'quantity': 1, 'version': read_version},
+        ])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual([r['status'] for r in response.json()['results']], ['updated', 'conflict'])
+        self.assertEqual(response.json()['results'][1]['version'], read_version + 1)
+        self.dolo.refresh_from_db()
+        self.assertEqual(self.dolo.quantity, 4)
+
+    def test_single_update_keeps_decimal_precision(self):
+        url = reverse('api_update_medicine', args=[self.crocin.id])
+        response = self.client.post(url, {'price': '0.07', 'version': self.crocin.version}, content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.crocin.refresh_from_db()
+        self.assertEqual(self.crocin.price, Decimal('0.07'))
+
+        response = self.client.post(url, {'price': '1.00', 'version': 1}, content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+
+
+class CatalogImportTests(TestCase):
+    HEADER = 'Product Number,Name,Components,Company Name,Power,Quantity,Price,Image\n'
+
+    def setUp(self):
+        use_temp_media(self)
+        self.existing = create_medicine(name='Crocin', product_number='IMP-1', quantity=5)
+        self.client.force_login(User.objects.create_user('staff', password='pw', is_staff=True))
+
+    def upload(self, body, **files):
+        data = {'file': SimpleUploadedFile('prices.csv', (self.HEADER + body).encode())}
+        data.update(files)
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('api_import_medicines'), data)
+
+    def test_upserts_valid_rows_and_reports_invalid_ones(self):
+        response = self.upload(
+            'IMP-1,Crocin Advance,Paracetamol 500mg,GSK,500mg,40,26.00,\n'
+            'IMP-2,Dolo 650,Paracetamol 650mg,Micro Labs,650mg,12,30.5,\n'
+            '\n'
+            'IMP-3,Broken,Something,Acme,1mg,-2,0,\n'
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['rows'], data['created'], data['updated'], data['rejected']), (3, 1, 1, 1))
+        self.assertEqual({(e['line'], e['field']) for e in data['errors']}, {(5, 'quantity'), (5, 'price')})
+
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.name, self.existing.quantity), ('Crocin Advance', 40))
+        self.assertEqual(self.existing.version, 2)
+        self.assertEqual(self.existing.image.name, 'medicines/dummpy.jpeg')
+        dolo = Medicine.objects.get(product_number='IMP-2')
+        self.assertEqual(dolo.price, Decimal('30.50'))
+        self.assertTrue(dolo.ingredients.filter(ingredient='paracetamol').exists())
+        self.assertFalse(Medicine.objects.filter(product_number='IMP-3').exists())
+
+    def test_attaches_images_from_zip(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as z:
+            z.writestr('photos/Dolo.JPG', jpeg_bytes())
+        response = self.upload(
+            'IMP-2,Dolo 650,Paracetamol 650mg,Micro Labs,650mg,12,30.50,dolo.jpg\n'
+            'IMP-4,Dolo 650 Strip,Paracetamol 650mg,Micro Labs,650mg,3,9.00,dolo.jpg\n'
+            'IMP-5,Missing,Paracetamol 650mg,Micro Labs,650mg,3,9.00,nope.jpg\n',
+            images=SimpleUploadedFile('images.zip', archive.getvalue()),
+        )
+        data = response.json()
+        self.assertEqual((data['created'], data['rejected']), (2, 1))
+        self.assertIn('nope.jpg is not in the images zip', data['errors'][0]['message'])
+        first, second = Medicine.objects.filter(product_number__in=['IMP-2', 'IMP-4']).order_by('product_number')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(images.variants_for(first))
+        self.assertTrue(default_storage.exists(first.image_variants['thumb']['webp']))
+
+    def test_rejects_file_without_required_columns(self):
+        response = self.client.post(reverse('api_import_medicines'), {
+            'file': SimpleUploadedFile('prices.csv', b'sku,name\nA,B\n'),
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Missing column(s): product_number', response.json()['message'])
+
+    def test_command_reads_xlsx_in_chunks(self):
+        from openpyxl import Workbook
+
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(self.HEADER.strip().split(','))
+        for i in range(25):
+            sheet.append([f'XL-{i}', f'Medicine {i}', 'Cetirizine 10mg', 'Cipla', '10mg', i, 12.5, None])
+        sheet.append(['XL-bad', '', 'Cetirizine 10mg', 'Cipla', '10mg', 1, 1, None])
+        path = os.path.join(use_temp_media(self), 'prices.xlsx')
+        workbook.save(path)
+        report = os.path.join(os.path.dirname(path), 'errors.csv')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_medicines', path, chunk_size=10, report=report, stdout=io.StringIO())
+        self.assertEqual(Medicine.objects.filter(product_number__startswith='XL-').count(), 25)
+        self.assertEqual(Medicine.objects.get(product_number='XL-3').price, Decimal('12.50'))
+        with open(report) as f:
+            self.assertEqual(f.read().splitlines()[1], '27,XL-bad,name,This field is required.')
+
+
+class OrderExportTests(TestCase):
+    def setUp(self):
+        self.buyer = User.objects.create_user('buyer', password='pw')
+        crocin = create_medicine(name='Crocin', product_number='PN-1')
+        dolo = create_medicine(name='Dolo, 650', product_number='PN-2', company_name='Micro Labs')
+        for day, medicines in ((1, [crocin]), (2, [crocin, dolo]), (3, [dolo])):
+            order = Order.objects.create(user=self.buyer, total_amount=10, final_amount=10, is_completed=True)
+            Order.objects.filter(pk=order.pk).update(order_date=timezone.make_aware(timezone.datetime(2026, 3, day, 23, 30)))
+            OrderItem.objects.bulk_create([OrderItem(order=order, medicine=m, quantity=3, price='2.50') for m in medicines])
+        Order.objects.create(user=self.buyer, total_amount=1, final_amount=1, is_completed=False)
+        self.client.force_login(User.objects.create_user('staff', password='pw', is_staff=True))
+
+    def get(self, **params):
+        response = self.client.get(reverse('export_orders'), params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_export_of_date_range(self):
+        with self.assertNumQueries(3):  # session, user, the export itself
+            response, body = self.get(start='2026-03-02', end='2026-03-03')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('orders-2026-03-02-2026-03-03.csv', response['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(body.decode())))
+        self.assertEqual([r['medicine'] for r in rows], ['Crocin', 'Dolo, 650', 'Dolo, 650'])
+        self.assertEqual((rows[0]['customer'], rows[0]['line_total']), ('buyer', '7.50'))
+
+    async def test_asgi_streams_without_reading_everything_first(self):
+        await self.async_client.aforce_login(await User.objects.aget(username='staff'))
+        with mock.patch.object(exports, 'BUFFER_SIZE', 1):
+            response = await self.async_client.get(reverse('export_orders'))
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), 5)  # one per row (the first with the header), then the empty rest
+        self.assertEqual(len(list(csv.DictReader(io.StringIO(b''.join(chunks).decode())))), 4)
+
+    def test_gzipped_jsonl(self):
+        response, body = self.get(format='jsonl', gzip='1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        lines = [json.loads(line) for line in gzip.decompress(body).decode().splitlines()]
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[-1]['company'], 'Micro Labs')
+
+    def test_bad_parameters_and_non_staff(self):
+        self.assertEqual(self.client.get(reverse('export_orders'), {'start': 'March'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('export_orders'), {'format': 'xml'}).status_code, 400)
+        self.client.force_login(self.buyer)
+        self.assertEqual(self.client.get(reverse('export_orders')).status_code, 302)
+
+    def test_command_writes_file(self):
+        path = os.path.join(use_temp_media(self), 'orders.csv.gz')
+        call_command('export_orders', '--start=2026-03-01', '--end=2026-03-01', '--gzip', f'--output={path}', stderr=io.StringIO())
+        with gzip.open(path, 'rt') as f:
+            self.assertEqual(len(f.read().splitlines()), 2)
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.buyer = User.objects.create_user('buyer', password='pw')
+        self.crocin = create_medicine(name='Crocin', product_number='PN-1', quantity=100, price=Decimal('2.50'))
+        self.dolo = create_medicine(name='Dolo', product_number='PN-2', quantity=100, price=Decimal('3.10'),
+                                    company_name='Micro Labs')
+
+    def buy(self, *items):
+        lines = [cart.CartLine(medicine=m, quantity=q, price=m.price) for m, q in items]
+        return orders.place_order(self.buyer, lines).order
+
+    def test_checkout_updates_rollups(self):
+        self.buy((self.crocin, 2), (self.dolo, 1))
+        self.buy((self.crocin, 3))
+        today = timezone.localdate()
+        crocin = DailyMedicineSales.objects.get(date=today, medicine=self.crocin)
+        self.assertEqual((crocin.units, crocin.revenue, crocin.order_lines), (5, Decimal('12.50'), 2))
+        self.assertEqual(DailyCompanySales.objects.get(date=today, company_name='Micro Labs').revenue, Decimal('3.10'))
+        self.assertEqual(rollups.check(), [])
+
+    def test_deleted_orders_are_subtracted(self):
+        order = self.buy((self.crocin, 2), (self.dolo, 1))
+        self.buy((self.crocin, 1))
+        order.delete()
+        self.assertEqual(DailyMedicineSales.objects.get(medicine=self.crocin).units, 1)
+        self.assertEqual(rollups.check(), [])
+        self.dolo.delete()
+        self.assertEqual(rollups.check(), [])
+
+    def test_deletes_cost_the_same_however_many_lines(self):
+        medicines = [create_medicine(name=f'Med {i}', product_number=f'PN-{i + 10}', quantity=10) for i in range(6)]
+        small = self.buy((self.crocin, 1), (self.dolo, 1))
+        large = self.buy(*[(m, 1) for m in medicines])
+        self.buy((self.crocin, 1))
+        with CaptureQueriesContext(connection) as small_delete:
+            small.delete()
+        with CaptureQueriesContext(connection) as large_delete:
+            large.delete()
+        self.assertEqual(len(large_delete), len(small_delete))
+        self.assertEqual(rollups.check(), [])
+
+    def test_deletes_after_a_company_change_leave_no_stale_rows(self):
+        self.buy((self.dolo, 1))
+        order = self.buy((self.crocin, 2))
+        Medicine.objects.filter(pk=self.dolo.pk).update(company_name='Abbott')
+        order.delete()
+        self.assertEqual(rollups.check(), [])
+        self.assertEqual(list(DailyCompanySales.objects.values_list('company_name', flat=True)), ['Abbott'])
+
+    def test_admin_deletes_single_lines(self):
+        order = self.buy((self.crocin, 2), (self.dolo, 1))
+        self.client.force_login(User.objects.create_superuser('admin', password='pw'))
+        item = order.items.get(medicine=self.dolo)
+        self.client.post(reverse('admin:store_orderitem_delete', args=[item.pk]), {'post': 'yes'})
+        self.assertFalse(OrderItem.objects.filter(pk=item.pk).exists())
+        self.assertEqual(rollups.check(), [])
+
+    def test_check_finds_drift_and_rebuild_fixes_it(self):
+        self.buy((self.crocin, 2))
+        DailyMedicineSales.objects.update(units=7)
+        DailyCompanySales.objects.all().delete()
+        mismatches = rollups.check()
+        self.assertEqual({m.table for m in mismatches}, {'DailyMedicineSales', 'DailyCompanySales'})
+        with self.assertRaises(CommandError):
+            call_command('check_sales_rollups', stdout=io.StringIO())
+
+        call_command('rebuild_sales_rollups', stdout=io.StringIO())
+        self.assertEqual(rollups.check(), [])
+        self.assertEqual(DailyMedicineSales.objects.get().units, 2)
+
+    def test_report_reads_only_rollups(self):
+        self.buy((self.crocin, 4), (self.dolo, 10))
+        self.client.force_login(User.objects.create_user('staff', password='pw', is_staff=True))
+        with self.assertNumQueries(5):  # session, user, daily totals, top medicines, top companies
+            response = self.client.get(reverse('api_sales_report'), {'end': timezone.localdate().isoformat()})
+        data = response.json()
+        self.assertEqual(len(data['daily']), 30)
+        self.assertEqual(data['revenue'], '41.00')
+        self.assertEqual([m['medicine__name'] for m in data['medicines']], ['Dolo', 'Crocin'])
+        self.assertEqual(self.client.get(reverse('api_sales_report'), {'start': '2026-02-01', 'end': '2026-01-01'}).status_code, 400)
+
+        response = self.client.get(reverse('sales_report'))
+        self.assertContains(response, 'Micro Labs')
+
+
+class ForecastingTests(TestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.steady = create_medicine(name='Steady', product_number='PN-1', quantity=20)
+        self.slow = create_medicine(name='Slow', product_number='PN-2', quantity=500)
+        self.unsold = create_medicine(name='Unsold', product_number='PN-3', quantity=0)
+        for age in range(1, 29):
+            DailyMedicineSales.objects.create(date=self.today - timedelta(days=age), medicine=self.steady,
+                                              units=4, revenue=10, order_lines=1)
+        # today's partial sales are ignored
+        DailyMedicineSales.objects.create(date=self.today, medicine=self.steady, units=400, revenue=1000, order_lines=1)
+        DailyMedicineSales.objects.create(date=self.today - timedelta(days=3), medicine=self.slow,
+                                          units=28, revenue=10, order_lines=1)
+
+    def test_moving_average_reorder_point(self):
+        with self.assertNumQueries(2):  # catalog, history
+            forecast = forecasting.forecast('sma', lead_time=7, cover_days=30)
+        steady, slow, unsold = (int(np.flatnonzero(forecast.ids == m.pk)[0]) for m in (self.steady, self.slow, self.unsold))
+        self.assertAlmostEqual(forecast.demand[steady], 4.0)
+        self.assertAlmostEqual(forecast.std[steady], 0.0)
+        self.assertAlmostEqual(forecast.days_of_cover[steady], 5.0)
+        # 4/day for 7 + 30 days, less the 20 in stock
+        self.assertEqual(forecast.reorder_quantity[steady], 128)
+        # one lumpy sale: 1/day on average, but enough safety stock to order
+        self.assertAlmostEqual(forecast.demand[slow], 1.0)
+        self.assertGreater(forecast.safety_stock[slow], 10)
+        self.assertEqual(forecast.reorder_quantity[slow], 0)
+        self.assertTrue(np.isinf(forecast.days_of_cover[unsold]))
+        self.assertEqual(forecast.reorder_quantity[unsold], 0)
+        self.assertEqual(forecast.at_risk(7), 1)
+
+        [row] = forecast.rows(forecast.suggestions())
+        self.assertEqual((row['name'], row['stockout_date']), ('Steady', self.today + timedelta(days=5)))
+
+    def test_exponential_smoothing_weights_recent_days(self):
+        DailyMedicineSales.objects.filter(medicine=self.steady, date__lt=self.today - timedelta(days=7)).update(units=0)
+        forecast = forecasting.forecast('ewma', alpha=0.5)
+        steady = int(np.flatnonzero(forecast.ids == self.steady.pk)[0])
+        # ages 1..7 before today are ages 0..6 before the last complete day
+        self.assertAlmostEqual(forecast.demand[steady], 4 * (1 - 0.5 ** 7), places=6)
+        with self.assertRaises(ValueError):
+            forecasting.forecast('arima')
+
+    def test_report_page_and_command(self):
+        self.client.force_login(User.objects.create_user('staff', password='pw', is_staff=True))
+        response = self.client.get(reverse('reorder_report'), {'method': 'sma'})
+        self.assertContains(response, 'Steady')
+        self.assertEqual(response.context['to_reorder'], 1)
+        response = self.client.get(reverse('reorder_report'), {'lead_time': 'soon'})
+        self.assertEqual(response.context['lead_time'], forecasting.LEAD_TIME)
+
+        out = io.StringIO()
+        call_command('forecast_reorders', '--method=sma', stdout=out)
+        self.assertIn('1 of 3 medicine(s) to reorder', out.getvalue())
+
+
+class CatalogAPITests(TestCase):
+    def setUp(self):
+        self.medicines = [create_medicine(name=f'Med {i}', product_number=f'PN-{i}') for i in range(5)]
+        self.url = reverse('api_v1_medicine_list')
+
+    def test_pages_follow_the_cursor(self):
+        seen, url = [], self.url + '?limit=2&fields=id,name'
+        while url:
+            data = self.client.get(url).json()
+            self.assertTrue(all(set(row) == {'id', 'name'} for row in data['results']))
+            seen += [row['id'] for row in data['results']]
+            url = data['next']
+        self.assertEqual(seen, [m.id for m in self.medicines])
+
+    def test_matches_model_serializer(self):
+        class Naive(serializers.ModelSerializer):
+            class Meta:
+                model = Medicine
+                fields = ['id', 'name', 'components', 'product_number', 'company_name', 'power', 'price',
+                          'quantity', 'version', 'created_at', 'updated_at']
+
+        medicine = Medicine.objects.get(pk=self.medicines[0].pk)
+        self.assertEqual(MedicineFeedSerializer(medicine, fields=Naive.Meta.fields).data, Naive(medicine).data)
+        data = MedicineFeedSerializer(medicine, fields=['image_url', 'thumbnail_url']).data
+        self.assertEqual(data, {'image_url': images.variant_url(medicine, 'medium'),
+                                'thumbnail_url': images.variant_url(medicine, 'thumb')})
+
+    def test_updated_since_returns_changes_oldest_first(self):
+        since = timezone.now()
+        changed = self.medicines[3], self.medicines[1]
+        for medicine in changed:
+            medicine.quantity = 1
+            medicine.save()
+        data = self.client.get(self.url, {'updated_since': since.isoformat(), 'fields': 'id,stock'}).json()
+        self.assertEqual(data['results'], [{'id': m.id, 'stock': 'low'} for m in changed])
+
+    def test_bad_parameters(self):
+        for params in ({'fields': 'id,secret'}, {'updated_since': 'yesterday'}, {'cursor': 'nope'}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_v1_medicine_detail', args=[999])).status_code, 404)
+
+    def test_gzip(self):
+        response = self.client.get(reverse('api_v1_medicine_detail', args=[self.medicines[0].id]),
+                                   HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.content))['name'], 'Med 0')
+
+
+@override_settings(PERF_INSTRUMENTATION=True, PERF_SLOW_REQUEST_MS=0)
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        instrumentation.reset()
+        self.addCleanup(instrumentation.reset)
+        self.medicine = create_medicine()
+
+    def test_server_timing_and_slow_log(self):
+        with self.assertLogs('store.perf', 'WARNING') as logs:
+            response = self.client.get(reverse('home'))
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'^db;dur=[\d.]+;desc="\d+ queries", template;dur=[\d.]+, total;dur=[\d.]+$')
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual((entry['event'], entry['view'], entry['status']), ('slow_request', 'home', 200))
+        self.assertIn('template_ms', entry)
+
+    def test_outbound_http_is_timed(self):
+        # The lookup thread can't write the cache while the test's transaction is open
+        with StubFDAServer({}) as stub, override_settings(FDA_API_URL=stub.url), self.assertLogs('store.perf'), \
+                mock.patch.object(fda, 'store_label_info'):
+            response = self.client.get(reverse('medicine_detail', args=[self.medicine.id]))
+        self.assertIn('http;dur=', response['Server-Timing'])
+
+    def test_repeated_queries_are_reported(self):
+        token = instrumentation.start()
+        for _ in range(3):
+            Medicine.objects.get(pk=self.medicine.pk)
+        timings = instrumentation.stop(token)
+        self.assertEqual(timings.queries, 3)
+        [repeated] = timings.repeated_sql()
+        self.assertEqual(repeated['count'], 3)
+        self.assertIn('store_medicine', repeated['sql'])
+
+    def test_histograms_for_staff(self):
+        with self.assertLogs('store.perf'):
+            self.client.get(reverse('home'))
+            self.assertEqual(self.client.get(reverse('performance_stats')).status_code, 302)
+            self.client.force_login(User.objects.create_user('staff', password='pw', is_staff=True))
+            stats = self.client.get(reverse('performance_stats')).json()['views']
+        self.assertEqual(stats['home']['count'], 1)
+        self.assertEqual(sum(stats['home']['histogram'].values()), 1)
+
+    @override_settings(PERF_INSTRUMENTATION=False)
+    def test_disabled(self):
+        self.assertFalse(self.client.get(reverse('home')).has_header('Server-Timing'))
+
+
+class SeedDataTests(TestCase):
+    def setUp(self):
+        use_temp_media(self)
+
+    def test_seed_data(self):
+        out = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('seed_data', '--medicines=40', '--users=5', '--orders=300', '--seed=1', stdout=out)
+        self.assertIn('Added 40 medicine(s), 5 customer(s) and 300 order(s)', out.getvalue())
+        self.assertEqual(Medicine.objects.count(), 40)
+        self.assertEqual(User.objects.filter(username__startswith='customer').count(), 5)
+        self.assertEqual(Order.objects.count(), 300)
+        self.assertTrue(User.objects.get(username='customer000000').check_password('password'))
+        self.assertTrue(default_storage.exists(Medicine.objects.first().image.name))
+
+        # Popularity is skewed: the top fifth of medicines sells most lines
+        lines = sorted(OrderItem.objects.values('medicine').annotate(n=Count('id')).values_list('n', flat=True), reverse=True)
+        self.assertGreater(sum(lines[:8]), sum(lines) / 2)
+        self.assertLess(Order.objects.order_by('order_date').first().order_date, timezone.now() - timedelta(days=30))
+        self.assertEqual(rollups.check(), [])
+        self.assertTrue(search.search_medicines(Medicine.objects.first().name.split()[0])[:1])
+
+        # Running it again adds to the data rather than colliding with it
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('seed_data', '--medicines=10', '--users=2', '--orders=0', stdout=io.StringIO())
+        self.assertEqual(Medicine.objects.count(), 50)
+        self.assertEqual(User.objects.filter(username__startswith='customer').count(), 7)
+
+
+class BenchmarkCompareTests(TestCase):
+    def test_compare(self):
+        baseline = {'e2e': {'checkout': {'req_per_s': 100, 'p95_ms': 10.0, 'queries_per_request': 13, 'n': 50}}}
+        results = {'e2e': {'checkout': {'req_per_s': 80, 'p95_ms': 5.0, 'queries_per_request': 14, 'n': 10}}}
+        regressions, improvements = benchmarks.compare(baseline, results, tolerance=10)
+        self.assertEqual(regressions, [('e2e.checkout.req_per_s', 100, 80, -20.0)])
+        self.assertEqual(improvements, [('e2e.checkout.p95_ms', 10.0, 5.0, -50.0)])
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class DatabaseRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.router = routers.PrimaryReplicaRouter()
+        token = routers.start_request()
+        self.addCleanup(routers.end_request, token)
+
+    def test_catalog_and_history_reads_use_the_replica(self):
+        self.assertEqual(self.router.db_for_read(Medicine), 'replica')
+        self.assertEqual(self.router.db_for_read(Order), 'replica')
+        self.assertEqual(self.router.db_for_read(User), 'default')
+        self.assertEqual(self.router.db_for_read(Session), 'default')
+        self.assertEqual(self.router.db_for_read(CartItem), 'default')
+        # Behind the catalog ETags, which must never go back in time
+        self.assertEqual(self.router.db_for_read(CatalogVersion), 'default')
+        with mock.patch.object(connection, 'in_atomic_block', True):
+            self.assertEqual(self.router.db_for_read(Medicine), 'default')
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(self.router.db_for_read(Medicine), 'default')
+
+    def test_reads_follow_own_writes(self):
+        self.assertEqual(self.router.db_for_write(Session), 'default')
+        self.assertEqual(self.router.db_for_read(Medicine), 'replica')
+        self.assertEqual(self.router.db_for_write(Order), 'default')
+        self.assertEqual(self.router.db_for_read(Medicine), 'default')
+
+        # The next request starts unpinned
+        token = routers.start_request()
+        self.assertEqual(self.router.db_for_read(Medicine), 'replica')
+        self.assertFalse(routers.end_request(token))
+
+    def test_middleware_pins_the_visitor(self):
+        reads = []
+
+        def write(request):
+            self.router.db_for_write(Order)
+            return HttpResponse()
+
+        def read(request):
+            reads.append(self.router.db_for_read(Medicine))
+            return HttpResponse()
+
+        response = ReplicaPinningMiddleware(write)(RequestFactory().post('/checkout/'))
+        self.assertEqual(response.cookies[routers.PIN_COOKIE]['max-age'], 10)
+        self.assertNotIn(routers.PIN_COOKIE, ReplicaPinningMiddleware(read)(RequestFactory().get('/')).cookies)
+
+        request = RequestFactory().get('/profile/')
+        request.COOKIES[routers.PIN_COOKIE] = '1'
+        ReplicaPinningMiddleware(read)(request)
+        self.assertEqual(reads, ['replica', 'default'])
+
+
+class SQLitePragmaTests(TestCase):
+    def test_pragmas_applied_on_connect(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA synchronous')
+            # NORMAL only with SQLITE_WAL, FULL otherwise
+            self.assertEqual(cursor.fetchone()[0], 1 if 'journal_mode' in settings.SQLITE_PRAGMAS else 2)
+
+
+# What settings turn on with REDIS_URL or CACHE_DIR
+@override_settings(
+    SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+    AUTHENTICATION_BACKENDS=['store.auth.CachedModelBackend', 'django.contrib.auth.backends.ModelBackend'],
+)
+class SessionAuthCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('buyer', password='pw', email='old@example.com')
+        self.medicine = create_medicine(name='Crocin', quantity=6)
+        order = Order.objects.create(user=self.user, total_amount=10, final_amount=10, is_completed=True)
+        OrderItem.objects.create(order=order, medicine=self.medicine, quantity=1, price=10)
+        self.client.force_login(self.user)
+        self.client.post(reverse('add_to_cart', args=[self.medicine.id]))
+        use_stub_fda(self, {})
+        # Cached up front: a lookup thread can't write while the test's transaction is open
+        fda.store_label_info(fda.normalize_name(self.medicine.name), *fda.fetch_label_info(self.medicine.name))
+
+    def assertPageQueries(self, path, expected):
+        self.client.get(path)  # warm the caches
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200, path)
+        tables = [q['sql'] for q in queries if 'django_session' in q['sql'] or 'auth_user' in q['sql']]
+        self.assertEqual(tables, [], path)
+        self.assertEqual(len(queries), expected, f'{path}: {[q["sql"] for q in queries]}')
+
+    def test_page_views_run_no_session_or_auth_queries(self):
+        self.assertPageQueries(reverse('home'), 2)  # cart badge, catalog version
+        # catalog version and cart badge (ETag), result count, page ids, rows
+        self.assertPageQueries(reverse('home') + '?q=crocin', 5)
+        self.assertPageQueries(reverse('search_suggest') + '?q=cro', 5)
+        # updated_at (ETag), cart badge, the medicine, its cached FDA label
+        self.assertPageQueries(reverse('medicine_detail', args=[self.medicine.id]), 4)
+        self.assertPageQueries(reverse('cart_view'), 1)  # cart lines
+        self.assertPageQueries(reverse('profile'), 3)  # cart badge, orders, items
+        self.assertPageQueries(reverse('api_order_history'), 2)  # orders, items
+
+    def test_messages_travel_in_a_cookie(self):
+        response = self.client.post(reverse('add_to_cart', args=[self.medicine.id]))
+        self.assertIn('messages', response.cookies)
+        self.assertContains(self.client.get(reverse('cart_view')), 'Crocin added to cart!')
+
+    def test_saving_the_user_refreshes_the_cache(self):
+        self.client.get(reverse('profile'))
+        self.client.post(reverse('profile'), {'email': 'new@example.com'})
+        self.assertEqual(self.client.get(reverse('profile')).context['user'].email, 'new@example.com')
+
+        # A new password signs the old session out
+        self.user.refresh_from_db()
+        self.user.set_password('changed')
+        self.user.save()
+        self.assertRedirects(self.client.get(reverse('profile')), f"{reverse('login')}?next={reverse('profile')}")
+
+    def test_inactive_users_are_rejected_from_the_cache(self):
+        self.client.get(reverse('profile'))
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        auth.forget(self.user.pk)
+        self.assertEqual(self.client.get(reverse('profile')).status_code, 302)
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        JOB_CALLS.clear()
+
+    def run_jobs(self):
+        with self.assertLogs('store.jobs', 'INFO'):
+            call_command('run_jobs', burst=True, stdout=io.StringIO())
+
+    def test_jobs_are_queued_with_the_transaction(self):
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                record_call.delay('rolled back')
+                raise ValueError
+        with transaction.atomic():
+            queued = record_call.delay('committed', fail=False)
+        self.assertEqual(list(Job.objects.values_list('pk', flat=True)), [queued.pk])
+
+        self.run_jobs()
+        self.assertEqual(JOB_CALLS, ['committed'])
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Job.DONE, 1))
+
+    def test_failed_jobs_are_retried_with_backoff_then_failed(self):
+        queued = record_call.delay('flaky', fail=True)
+        self.run_jobs()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Job.QUEUED, 1))
+        self.assertIn('flaky failed', queued.last_error)
+        # Half to all of the 60s backoff, and not due before then
+        self.assertGreaterEqual(queued.run_at, timezone.now() + timedelta(seconds=29))
+        self.run_jobs()
+        self.assertEqual(JOB_CALLS, ['flaky'])
+
+        Job.objects.filter(pk=queued.pk).update(run_at=timezone.now())
+        self.run_jobs()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Job.FAILED, 2))
+        self.assertEqual(JOB_CALLS, ['flaky', 'flaky'])
+
+    def test_claimed_jobs_are_not_claimed_again(self):
+        first, second = record_call.delay(1), record_call.delay(2)
+        [slow] = jobs.claim('a', 1)
+        self.assertEqual(slow, first)
+        self.assertEqual(jobs.claim('b', 5), [second])
+        self.assertEqual(jobs.claim('c', 5), [])
+
+        # Worker "a" looks dead, so its job is requeued and taken over
+        Job.objects.filter(pk=first.pk).update(started_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(jobs.requeue_lost(), 1)
+        [retaken] = jobs.claim('d', 5)
+
+        # "a" finishes after all; the outcome belongs to "d"
+        with self.assertLogs('store.jobs', 'WARNING'):
+            jobs.run(slow)
+        retaken.refresh_from_db()
+        self.assertEqual(retaken.status, Job.RUNNING)
+        self.assertTrue(retaken.locked_by.startswith('d:'))
+
+    def test_unknown_jobs_fail_without_retrying(self):
+        Job.objects.create(name='store.tests.no_such_job', max_attempts=5, run_at=timezone.now())
+        self.run_jobs()
+        self.assertEqual(Job.objects.get().status, Job.FAILED)
+
+    @override_settings(MANAGERS=[('Stock', 'stock@example.com')])
+    def test_checkout_queues_the_low_stock_alert(self):
+        user = User.objects.create_user('buyer')
+        low = create_medicine(name='Low', product_number='PN-LOW', quantity=12)
+        already = create_medicine(name='Already', product_number='PN-AL', quantity=3)
+        lines = [cart.CartLine(medicine=m, quantity=2, price=m.price) for m in (low, already)]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(orders.place_order(user, lines).ok)
+        self.assertEqual(mail.outbox, [])
+
+        self.run_jobs()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('Low (PN-LOW): 10 left', mail.outbox[0].body)
+        self.assertNotIn('Already', mail.outbox[0].body)
+
+    def test_stats(self):
+        record_call.delay('ok')
+        record_call.delay('bad', fail=True)
+        self.run_jobs()
+        record_call.delay('waiting')
+
+        stats = jobs.stats()
+        self.assertEqual((stats['queued'], stats['retrying'], stats['finished']), (2, 1, 1))
+        self.assertEqual(stats['jobs']['store.tests.record_call']['finished'], 1)
+
+        staff = User.objects.create_user('staff', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(reverse('job_stats')).json()['queued'], 2)
@@ -1,11 +1,12 @@
 from django.urls import path
-from . import views
+from . import api, views
 from store.views import add_product
 from django.contrib.admin.views.decorators import staff_member_required
 
 urlpatterns = [
     path('', views.home, name='home'),
     path('medicine/<int:medicine_id>/', views.medicine_detail, name='medicine_detail'),
+    path('medicine/<int:medicine_id>/label/', views.medicine_label, name='medicine_label'),
     path('register/', views.register_view, name='register'),
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
@@ -18,7 +19,21 @@ urlpatterns = [
     path('order/success/<int:order_id>/', views.order_success, name='order_success'),
     # Protect the add_product view so only staff users access it
     path('admin/add-product/', staff_member_required(add_product), name='add_product'),
+    path('api/orders/', views.api_order_history, name='api_order_history'),
+    path('api/orders/export/', views.export_orders, name='export_orders'),
+    path('reports/sales/', views.sales_report, name='sales_report'),
+    path('api/sales/', views.api_sales_report, name='api_sales_report'),
+    path('reports/reorder/', views.reorder_report, name='reorder_report'),
+    path('api/performance/', views.performance_stats, name='performance_stats'),
+    path('api/jobs/', views.job_stats, name='job_stats'),
+    path('api/search/suggest/', views.search_suggest, name='search_suggest'),
+    path('api/medicines/', views.api_medicine_list, name='api_medicine_list'),
     path('api/medicine/', views.api_add_medicine, name='api_add_medicine'),
+    path('api/medicine/import/', views.api_import_medicines, name='api_import_medicines'),
+    path('api/medicine/batch/', views.api_batch_update_medicines, name='api_batch_update_medicines'),
     path('api/medicine/<int:medicine_id>/', views.api_update_medicine, name='api_update_medicine'),
     path('api/medicine/<int:medicine_id>/delete/', views.api_delete_medicine, name='api_delete_medicine'),
+    # Read-only catalog API (see api.py)
+    path('api/v1/medicines/', api.MedicineList.as_view(), name='api_v1_medicine_list'),
+    path('api/v1/medicines/<int:medicine_id>/', api.MedicineDetail.as_view(), name='api_v1_medicine_detail'),
 ]
@@ -1,31 +1,60 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib import messages
-from django.http import JsonResponse
-from django.db import transaction
-from django.db.models import Q
-from .models import Medicine, Order, OrderItem
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.core.paginator import Paginator
+from django.conf import settings
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from .forms import MedicineForm
+from .models import Medicine, Order
+from . import cart, catalog_cache, conditional, exports, fda, forecasting, importer, instrumentation, inventory, jobs, listing, orders, rollups, search
+from datetime import date, timedelta
 from decimal import Decimal
 import json
 
-def home(request):
-    medicines = Medicine.objects.all().order_by('-created_at')[:12]
+SEARCH_PAGE_SIZE = 24
+
+@conditional.cache_policy
+@conditional.condition(conditional.catalog_etag, conditional.catalog_last_modified)
+async def home(request):
+    # Search (raw FTS queries), the cached grid and the template are sync
+    # code: run them in one thread hop rather than one per query
+    return await sync_to_async(_home_page)(request)
+
+def _home_page(request):
+    medicines = None
+    page_obj = None
     
-    query = request.GET.get('q', '')
+    query = request.GET.get('q', '').strip()
     if query:
-        medicines = Medicine.objects.filter(
-            Q(name__icontains=query) | 
-            Q(company_name__icontains=query) |
-            Q(components__icontains=query)
-        )
+        page_obj = Paginator(search.search_medicines(query), SEARCH_PAGE_SIZE).get_page(request.GET.get('page'))
+        medicines = page_obj.object_list
+        grid = catalog_cache.cards_grid(request, medicines)
+    else:
+        grid = catalog_cache.home_grid(request)
     
-    return render(request, 'home.html', {'medicines': medicines, 'query': query})
+    return render(request, 'home.html', {'medicines': medicines, 'grid': grid, 'query': query, 'page_obj': page_obj})
 
-def medicine_detail(request, medicine_id):
-    medicine = get_object_or_404(Medicine, id=medicine_id)
-    return render(request, 'product_detail.html', {'medicine': medicine})
+@conditional.cache_policy
+@conditional.condition(conditional.catalog_etag, conditional.catalog_last_modified)
+def search_suggest(request):
+    """As-you-type suggestions for the home page search box"""
+    query = request.GET.get('q', '').strip()
+    results = search.suggest(query) if query else []
+    return JsonResponse({
+        'status': 'success',
+        'results': [
+            {'id': m.id, 'name': m.name, 'company_name': m.company_name, 'power': m.power}
+            for m in results
+        ]
+    })
 
 def register_view(request):
     if request.method == 'POST':
@@ -60,149 +89,211 @@ def logout_view(request):
     return redirect('home')
 
 @login_required
-def profile_view(request):
-    orders = Order.objects.filter(user=request.user, is_completed=True).order_by('-order_date')
-
+async def profile_view(request):
+    user = await request.auser()
     if request.method == 'POST':
         new_email = request.POST.get('email')
         if new_email:
-            request.user.email = new_email
-            request.user.save()
+            user.email = new_email
+            await user.asave()
             messages.success(request, 'Email updated successfully.')
             return redirect('profile')
         else:
             messages.error(request, 'Please provide a valid email address.')
 
-    return render(request, 'profile.html', {'orders': orders})
+    cursor = request.GET.get('cursor')
+    try:
+        order_list, next_cursor = await orders.aorder_history(user, cursor)
+    except ValueError:
+        cursor = None
+        order_list, next_cursor = await orders.aorder_history(user)
+
+    return await sync_to_async(render)(request, 'profile.html', {
+        'orders': order_list,
+        'next_cursor': next_cursor,
+        'is_first_page': not cursor,
+    })
+
+@login_required
+async def api_order_history(request):
+    """API endpoint returning a page of the user's order history"""
+    try:
+        order_list, next_cursor = await orders.aorder_history(await request.auser(), request.GET.get('cursor'))
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    return JsonResponse({
+        'status': 'success',
+        'orders': [orders.order_as_dict(order) for order in order_list],
+        'next_cursor': next_cursor,
+    })
+
+@staff_member_required
+def export_orders(request):
+    """Stream completed order lines as CSV/JSONL (?format=, ?start=/?end= YYYY-MM-DD, ?gzip=1)"""
+    fmt = request.GET.get('format', 'csv')
+    compress = request.GET.get('gzip') == '1'
+    try:
+        start, end = (
+            date.fromisoformat(request.GET[name]) if request.GET.get(name) else None for name in ('start', 'end')
+        )
+        chunks = exports.export(fmt, start, end, compress)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    if isinstance(request, ASGIRequest):
+        # A sync iterator would be read to the end before the first byte is sent
+        chunks = exports.aiterate(chunks)
+
+    content_type = 'application/gzip' if compress else exports.FORMATS[fmt][0]
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{exports.filename(fmt, start, end, compress)}"'
+    return response
+
+SALES_REPORT_DAYS = 30
+MAX_SALES_REPORT_DAYS = 731
+
+def _sales_report_range(params):
+    """(start, end) from ?start=/?end=, defaulting to the last 30 days; raises ValueError"""
+    end = date.fromisoformat(params['end']) if params.get('end') else timezone.localdate()
+    start = (date.fromisoformat(params['start']) if params.get('start')
+             else end - timedelta(days=SALES_REPORT_DAYS - 1))
+    if start > end:
+        raise ValueError('start must not be after end')
+    if (end - start).days >= MAX_SALES_REPORT_DAYS:
+        raise ValueError(f'Report at most {MAX_SALES_REPORT_DAYS} days at a time')
+    return start, end
+
+@staff_member_required
+def sales_report(request):
+    """Sales dashboard for a date range, read from the daily rollups"""
+    try:
+        start, end = _sales_report_range(request.GET)
+    except ValueError as e:
+        messages.error(request, str(e))
+        start, end = _sales_report_range({})
+    report = rollups.report(start, end)
+    best_day = max(day['revenue'] for day in report['daily']) or 1
+    for day in report['daily']:
+        day['percent'] = round(day['revenue'] / best_day * 100)
+    return render(request, 'sales_report.html', {'report': report})
+
+@staff_member_required
+def api_sales_report(request):
+    """API endpoint returning daily sales and top sellers for a date range"""
+    try:
+        start, end = _sales_report_range(request.GET)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    report = rollups.report(start, end)
+    return JsonResponse({'status': 'success', **report})
+
+REORDER_REPORT_SIZE = 200
 
-def get_cart(request):
-    cart = request.session.get('cart', {})
-    return cart
+@staff_member_required
+def reorder_report(request):
+    """Reorder suggestions for the whole catalog from recent sales velocity"""
+    try:
+        method = request.GET.get('method', 'ewma')
+        lead_time = int(request.GET.get('lead_time', forecasting.LEAD_TIME))
+        cover_days = int(request.GET.get('cover_days', forecasting.COVER_DAYS))
+        if not (1 <= lead_time <= 365 and 1 <= cover_days <= 365):
+            raise ValueError('Lead time and cover must be between 1 and 365 days')
+        forecast = forecasting.forecast(method, lead_time=lead_time, cover_days=cover_days)
+    except ValueError as e:
+        messages.error(request, str(e))
+        method, lead_time, cover_days = 'ewma', forecasting.LEAD_TIME, forecasting.COVER_DAYS
+        forecast = forecasting.forecast()
+    
+    suggestions = forecast.suggestions()
+    return render(request, 'reorder_report.html', {
+        'rows': forecast.rows(suggestions[:REORDER_REPORT_SIZE]),
+        'to_reorder': len(suggestions),
+        'at_risk': forecast.at_risk(lead_time),
+        'catalog_size': len(forecast),
+        'method': method,
+        'methods': forecasting.METHODS,
+        'lead_time': lead_time,
+        'cover_days': cover_days,
+    })
 
-def save_cart(request, cart):
-    request.session['cart'] = cart
-    request.session.modified = True
+@staff_member_required
+def performance_stats(request):
+    """Per-view request latency histograms of this process (PERF_INSTRUMENTATION must be on)"""
+    return JsonResponse({
+        'status': 'success',
+        'enabled': settings.PERF_INSTRUMENTATION,
+        'views': instrumentation.snapshot(),
+    })
+
+@staff_member_required
+def job_stats(request):
+    """Background job queue depth, lag and throughput (see jobs.py)"""
+    return JsonResponse({'status': 'success', **jobs.stats()})
 
 @login_required
-def add_to_cart(request, medicine_id):
+async def add_to_cart(request, medicine_id):
     if request.method == 'POST':
-        medicine = get_object_or_404(Medicine, id=medicine_id)
-        cart = get_cart(request)
-        
-        medicine_id_str = str(medicine_id)
-        if medicine_id_str in cart:
-            cart[medicine_id_str]['quantity'] += 1
-        else:
-            cart[medicine_id_str] = {
-                'name': medicine.name,
-                'price': str(medicine.price),
-                'quantity': 1,
-                'image': medicine.image.url if medicine.image else '',
-                'max_quantity': medicine.quantity
-            }
-        
-        save_cart(request, cart)
+        medicine = await aget_object_or_404(Medicine.objects.only(*cart.CART_FIELDS), id=medicine_id)
+        await cart.aadd_item(request, medicine)
         messages.success(request, f'{medicine.name} added to cart!')
         return redirect('cart_view')
     
     return redirect('medicine_detail', medicine_id=medicine_id)
 
 @login_required
-def cart_view(request):
-    cart = get_cart(request)
-    cart_items = []
-    total = Decimal('0.00')
-    
-    for medicine_id, item in cart.items():
-        item_total = Decimal(item['price']) * item['quantity']
-        cart_items.append({
-            'id': medicine_id,
-            'medicine': get_object_or_404(Medicine, id=medicine_id),
-            'quantity': item['quantity'],
-            'price': item['price'],
-            'total': item_total,
-            'image': item['image']
-        })
-        total += item_total
+async def cart_view(request):
+    current_cart = await cart.aload_cart(request)
     
-    return render(request, 'cart.html', {
-        'cart_items': cart_items,
-        'total': total
+    return await sync_to_async(render)(request, 'cart.html', {
+        'cart_items': current_cart.lines,
+        'total': current_cart.total
     })
 
 @login_required
-def update_cart(request, medicine_id):
-    if request.method == 'POST':
-        cart = get_cart(request)
-        medicine_id_str = str(medicine_id)
+async def update_cart(request, medicine_id):
+    if request.method == 'POST' and await cart.acontains(request, medicine_id):
+        quantity_str = request.POST.get('quantity', '').strip()
+        if not quantity_str.isdigit():
+            messages.error(request, 'Enter a valid quantity.')
+            return redirect('cart_view')
         
-        if medicine_id_str in cart:
-            quantity_str = request.POST.get('quantity', '').strip()
-            if not quantity_str.isdigit():
-                messages.error(request, 'Enter a valid quantity.')
-                return redirect('cart_view')
-            
-            quantity = int(quantity_str)
-            medicine = get_object_or_404(Medicine, id=medicine_id)
-            
-            if quantity <= 0:
-                del cart[medicine_id_str]
-                messages.info(request, 'Item removed from cart.')
-            elif quantity <= medicine.quantity:
-                cart[medicine_id_str]['quantity'] = quantity
-                messages.success(request, 'Cart updated!')
-            else:
-                messages.error(request, f'Only {medicine.quantity} available in stock.')
+        quantity = int(quantity_str)
+        medicine = await aget_object_or_404(Medicine.objects.only('id', 'quantity'), id=medicine_id)
         
-        save_cart(request, cart)
+        if quantity <= 0:
+            await cart.aremove_item(request, medicine_id)
+            messages.info(request, 'Item removed from cart.')
+        elif quantity <= medicine.quantity:
+            await cart.aset_quantity(request, medicine_id, quantity)
+            messages.success(request, 'Cart updated!')
+        else:
+            messages.error(request, f'Only {medicine.quantity} available in stock.')
     
     return redirect('cart_view')
 
 
 @login_required
-def remove_from_cart(request, medicine_id):
+async def remove_from_cart(request, medicine_id):
     if request.method == 'POST':
-        cart = get_cart(request)
-        medicine_id_str = str(medicine_id)
-        
-        if medicine_id_str in cart:
-            del cart[medicine_id_str]
-            save_cart(request, cart)
+        if await cart.aremove_item(request, medicine_id):
             messages.info(request, 'Item removed from cart.')
     
     return redirect('cart_view')
 
-from decimal import Decimal
-from django.shortcuts import render, get_object_or_404, redirect
-from django.contrib import messages
-from django.db import transaction
-from django.contrib.auth.decorators import login_required
-from django.utils import timezone
-
 @login_required
 def checkout_view(request):
-    cart = get_cart(request)
-    if not cart:
+    current_cart = cart.load_cart(request)
+    if not current_cart:
         messages.warning(request, 'Your cart is empty!')
         return redirect('cart_view')
     
-    cart_items = []
-    total = Decimal('0.00')
+    if current_cart.shortages:
+        line = current_cart.shortages[0]
+        messages.error(request, f'Not enough stock for {line.medicine.name}. Only {line.medicine.quantity} available.')
+        return redirect('cart_view')
     
-    for medicine_id, item in cart.items():
-        medicine = get_object_or_404(Medicine, id=medicine_id)
-        if item['quantity'] > medicine.quantity:
-            messages.error(request, f'Not enough stock for {medicine.name}. Only {medicine.quantity} available.')
-            return redirect('cart_view')
-        
-        item_total = Decimal(item['price']) * item['quantity']
-        cart_items.append({
-            'medicine': medicine,
-            'quantity': item['quantity'],
-            'price': item['price'],
-            'total': item_total
-        })
-        total += item_total
+    cart_items = current_cart.lines
+    total = current_cart.total
     
     discount_percentage = Decimal('0')
     final_amount = total
@@ -211,40 +302,21 @@ def checkout_view(request):
         # Only allow discount if user is staff/admin
         if request.user.is_staff:
             discount_percentage = Decimal(request.POST.get('discount', '0'))
-            discount_amount = total * (discount_percentage / Decimal('100'))
-            final_amount = total - discount_amount
+            total, final_amount = orders.order_totals(cart_items, discount_percentage)
 
         try:
-            with transaction.atomic():
-                # Create order
-                order = Order.objects.create(
-                    user=request.user,
-                    total_amount=total,
-                    discount_percentage=discount_percentage,
-                    final_amount=final_amount,
-                    is_completed=True
-                )
-                
-                # Create order items and update medicine quantities
-                for item in cart_items:
-                    OrderItem.objects.create(
-                        order=order,
-                        medicine=item['medicine'],
-                        quantity=item['quantity'],
-                        price=item['price']
-                    )
-                    item['medicine'].quantity -= item['quantity']
-                    item['medicine'].save()
-                
-                # Clear cart
-                request.session['cart'] = {}
-                request.session.modified = True
-                
-                messages.success(request, f'Order placed successfully! Total: ₹{final_amount:.2f}')
-                return redirect('order_success', order_id=order.id)
-                
-        except Exception as e:
+            result = orders.place_order(request.user, cart_items, discount_percentage, cart_id=cart.get_cart_id(request))
+        except Exception:
             messages.error(request, 'An error occurred during checkout. Please try again.')
+        else:
+            if result.ok:
+                cart.emptied(request)
+                messages.success(request, f'Order placed successfully! Total: ₹{final_amount:.2f}')
+                return redirect('order_success', order_id=result.order.id)
+            
+            for shortfall in result.shortfalls:
+                messages.error(request, f'Not enough stock for {shortfall.name}. Only {shortfall.available} available.')
+            return redirect('cart_view')
     
     return render(request, 'checkout.html', {
         'cart_items': cart_items,
@@ -258,10 +330,6 @@ def order_success(request, order_id):
     order = get_object_or_404(Order, id=order_id, user=request.user)
     return render(request, 'order_success.html', {'order': order})
 
-from django.contrib.admin.views.decorators import staff_member_required
-from django.shortcuts import render, redirect
-from .forms import MedicineForm
-
 @staff_member_required
 def add_product(request):
     if request.method == 'POST':
@@ -274,74 +342,125 @@ def add_product(request):
         form = MedicineForm()
     
     return render(request, 'add_product.html', {'form': form})
-from django.shortcuts import redirect
-from django.contrib.admin.views.decorators import staff_member_required
 
 @staff_member_required
 def redirect_to_medicine_admin(request):
     return redirect('admin:store_medicine_changelist')
-from django.contrib.admin.views.decorators import staff_member_required
-from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse
-from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
-from .models import Medicine
-from .forms import MedicineForm
-import json
 
 @staff_member_required
 def admin_product_management(request):
-    """Comprehensive product management page for admin"""
-    medicines = Medicine.objects.all().order_by('-created_at')
+    """Comprehensive product management page for admin; rows load from api_medicine_list"""
     form = MedicineForm()
     
     return render(request, 'admin_product_management.html', {
-        'medicines': medicines,
         'form': form,
+        'page_size': listing.PAGE_SIZE,
         'title': 'Product Management'
     })
 
+@staff_member_required
+@require_http_methods(["GET"])
+@conditional.cache_policy
+@conditional.condition(conditional.catalog_etag)
+def api_medicine_list(request):
+    """API endpoint listing medicines a page at a time, with search, sort and stock filters"""
+    try:
+        limit = min(max(int(request.GET.get('limit', listing.PAGE_SIZE)), 1), listing.MAX_PAGE_SIZE)
+        cursor = request.GET.get('cursor')
+        medicines, next_cursor = listing.medicine_page(
+            query=request.GET.get('q', '').strip(),
+            sort=request.GET.get('sort', 'newest'),
+            stock=request.GET.get('stock', ''),
+            cursor=cursor,
+            limit=limit,
+        )
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    
+    data = {
+        'status': 'success',
+        'results': [listing.medicine_as_dict(m) for m in medicines],
+        'next_cursor': next_cursor,
+    }
+    if not cursor:
+        data['counts'] = listing.stock_counts()
+    return JsonResponse(data)
+
 @staff_member_required
 @csrf_exempt
 @require_http_methods(["POST"])
 def api_update_medicine(request, medicine_id):
-    """API endpoint to update medicine details"""
-    medicine = get_object_or_404(Medicine, id=medicine_id)
+    """API endpoint to update medicine details; send "version" to detect concurrent edits"""
+    medicine = get_object_or_404(Medicine.objects.only('id'), id=medicine_id)
     
     try:
-        data = json.loads(request.body)
-        
-        # Update fields if they exist in the request
-        if 'quantity' in data:
-            medicine.quantity = int(data['quantity'])
-        if 'price' in data:
-            medicine.price = float(data['price'])
-        if 'name' in data:
-            medicine.name = data['name']
-        if 'company_name' in data:
-            medicine.company_name = data['company_name']
-        if 'power' in data:
-            medicine.power = data['power']
-        
-        medicine.save()
-        
+        data = json.loads(request.body, parse_float=Decimal)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid JSON'}, status=400)
+    
+    patch = {key: data[key] for key in (*inventory.UPDATABLE_FIELDS, 'version') if key in data}
+    result = inventory.apply_patches([{'id': medicine.id, **patch}])
+    row = result.results[0]
+    if not result.applied:
+        data = {'status': 'error', 'message': '; '.join(row.as_dict()['errors'])}
+        if row.conflict:
+            data['version'] = row.medicine.version
+        return JsonResponse(data, status=409 if row.conflict else 400)
+    
+    medicine = row.medicine
+    return JsonResponse({
+        'status': 'success',
+        'message': 'Medicine updated successfully',
+        'medicine': {
+            'id': medicine.id,
+            'name': medicine.name,
+            'company_name': medicine.company_name,
+            'power': medicine.power,
+            'price': str(medicine.price),
+            'quantity': medicine.quantity,
+            'version': medicine.version
+        }
+    })
+
+@staff_member_required
+@csrf_exempt
+@require_http_methods(["POST"])
+def api_batch_update_medicines(request):
+    """API endpoint applying a JSON array of stock/price patches in one transaction"""
+    try:
+        patches = json.loads(request.body, parse_float=Decimal)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid JSON'}, status=400)
+    if isinstance(patches, dict):
+        patches = patches.get('patches')
+    if not isinstance(patches, list) or not patches:
+        return JsonResponse({'status': 'error', 'message': 'Expected a non-empty array of patches'}, status=400)
+    if len(patches) > inventory.MAX_BATCH_SIZE:
         return JsonResponse({
-            'status': 'success',
-            'message': 'Medicine updated successfully',
-            'medicine': {
-                'id': medicine.id,
-                'name': medicine.name,
-                'company_name': medicine.company_name,
-                'power': medicine.power,
-                'price': str(medicine.price),
-                'quantity': medicine.quantity
-            }
-        })
-    except Exception as e:
+            'status': 'error',
+            'message': f'At most {inventory.MAX_BATCH_SIZE} patches per batch'
+        }, status=400)
+    
+    result = inventory.apply_patches(patches)
+    results = [r.as_dict() for r in result.results]
+    if result.errors:
         return JsonResponse({
             'status': 'error',
-            'message': str(e)
+            'message': f'{len(result.errors)} invalid patch(es); nothing was updated',
+            'results': results
         }, status=400)
+    if result.conflicts:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'{len(result.conflicts)} medicine(s) were changed by someone else; nothing was updated',
+            'results': results
+        }, status=409)
+    return JsonResponse({
+        'status': 'success',
+        'message': f'Updated {len(results)} medicine(s)',
+        'updated': len(results),
+        'results': results
+    })
 
 @staff_member_required
 @csrf_exempt
@@ -372,6 +491,34 @@ def api_add_medicine(request):
             'errors': form.errors
         }, status=400)
 
+@staff_member_required
+@csrf_exempt
+@require_http_methods(["POST"])
+def api_import_medicines(request):
+    """API endpoint importing a CSV/XLSX price list ('file'), with an optional zip of images ('images')"""
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({'status': 'error', 'message': 'Upload a .csv or .xlsx file as "file"'}, status=400)
+    try:
+        archive = importer.ImageArchive(request.FILES['images']) if 'images' in request.FILES else None
+        result = importer.import_catalog(importer.read_records(upload, upload.name), archive=archive)
+    except importer.ImportFileError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    
+    return JsonResponse({
+        'status': 'success',
+        'message': f'Imported {result.summary()}',
+        'rows': result.rows,
+        'created': result.created,
+        'updated': result.updated,
+        'rejected': result.error_rows,
+        'errors': [
+            {'line': line, 'product_number': number, 'field': name, 'message': message}
+            for line, number, name, message in result.errors
+        ],
+        'errors_truncated': result.errors_truncated
+    })
+
 @staff_member_required
 @csrf_exempt
 @require_http_methods(["DELETE"])
@@ -385,87 +532,26 @@ def api_delete_medicine(request, medicine_id):
         'status': 'success',
         'message': f'Medicine "{medicine_name}" deleted successfully'
     })
-from django.shortcuts import render, get_object_or_404
-from .models import Medicine
-import requests
 
-def medicine_detail(request, medicine_id):
-    medicine = get_object_or_404(Medicine, id=medicine_id)
-    
-    medicine_info = {
-        "description": "No information available from FDA database",
-        "uses": "No information available from FDA database", 
-        "side_effects": "No information available from FDA database",
-        "precautions": "No information available from FDA database",
-    }
-
-    try:
-        # Try FDA API with the medicine name
-        url = f'https://api.fda.gov/drug/label.json?search=openfda.brand_name:"{medicine.name}"&limit=1'
-        print(f"🔍 API URL: {url}")
-        
-        response = requests.get(url, timeout=10)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data.get("results"):
-                result = data["results"][0]
-                print("✅ FDA API returned data")
-                print(f"🔑 Available keys: {list(result.keys())}")
-                
-                # Extract description from various possible fields
-                if result.get("description"):
-                    medicine_info["description"] = result["description"][0]
-                elif result.get("purpose"):
-                    medicine_info["description"] = result["purpose"][0]
-                elif result.get("clinical_pharmacology"):
-                    medicine_info["description"] = result["clinical_pharmacology"][0]
-                
-                # Extract uses
-                if result.get("indications_and_usage"):
-                    medicine_info["uses"] = result["indications_and_usage"][0]
-                elif result.get("purpose"):
-                    medicine_info["uses"] = result["purpose"][0]
-                
-                # EXTRACT SIDE EFFECTS - ENHANCED
-                if result.get("adverse_reactions"):
-                    medicine_info["side_effects"] = result["adverse_reactions"][0]
-                elif result.get("warnings"):
-                    medicine_info["side_effects"] = result["warnings"][0]
-                elif result.get("boxed_warning"):
-                    medicine_info["side_effects"] = result["boxed_warning"][0]
-                elif result.get("contraindications"):
-                    medicine_info["side_effects"] = result["contraindications"][0]
-                elif result.get("drug_interactions"):
-                    medicine_info["side_effects"] = result["drug_interactions"][0]
-                # If still no side effects, use a generic message
-                elif medicine_info["side_effects"] == "No information available from FDA database":
-                    medicine_info["side_effects"] = "Common side effects may include nausea, headache, or dizziness. Consult your doctor for specific side effects."
-                
-                # Extract precautions
-                if result.get("precautions"):
-                    medicine_info["precautions"] = result["precautions"][0]
-                elif result.get("warnings"):
-                    medicine_info["precautions"] = result["warnings"][0]
-                elif result.get("drug_interactions"):
-                    medicine_info["precautions"] = result["drug_interactions"][0]
-                elif result.get("contraindications"):
-                    medicine_info["precautions"] = result["contraindications"][0]
-                    
-                print(f"📊 Extracted data - Description: {bool(result.get('description'))}, Uses: {bool(result.get('indications_and_usage'))}, Side Effects: {bool(result.get('adverse_reactions'))}, Precautions: {bool(result.get('precautions'))}")
-                    
-            else:
-                print("❌ No results in FDA API response")
-        else:
-            print(f"❌ FDA API returned status: {response.status_code}")
-            
-    except Exception as e:
-        print(f"💥 Error calling FDA API: {e}")
+@conditional.cache_policy
+@conditional.condition(conditional.medicine_etag, conditional.medicine_last_modified)
+async def medicine_detail(request, medicine_id):
+    medicine = await aget_object_or_404(Medicine, id=medicine_id)
+    medicine_info, label_pending = await fda.aget_label_info_within(medicine.name, settings.FDA_LABEL_BUDGET)
 
     context = {
         'medicine': medicine,
         'medicine_info': medicine_info,
+        'label_pending': label_pending,
     }
-    return render(request, 'product_detail.html', context)
-
+    return await sync_to_async(render)(request, 'product_detail.html', context)
 
+async def medicine_label(request, medicine_id):
+    """JSON endpoint the detail page polls when the label lookup missed its budget"""
+    medicine = await aget_object_or_404(Medicine, id=medicine_id)
+    medicine_info, pending = await fda.aget_label_info_within(medicine.name, settings.FDA_LABEL_BUDGET)
+    return JsonResponse({
+        'status': 'success',
+        'medicine_info': medicine_info,
+        'pending': pending,
+    })